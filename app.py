@@ -7,32 +7,87 @@ _CZ_DP_DIR = _os.path.join(_os.path.dirname(_os.path.abspath(__file__)), "cz_dat
 _cz_dp_component = _components.declare_component("cz_datepicker", path=_CZ_DP_DIR)
 import sqlite3
 import pandas as pd
+import numpy as np
 import hashlib
 import json
+import sys
+import unicodedata
 import os
 import io
 import base64
 import threading
+import functools
+import itertools
+import queue
+import tempfile
+import importlib.util
 import shutil
 import glob
+import gzip
 import smtplib
+from collections import OrderedDict
+from contextlib import contextmanager
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-from datetime import datetime, date, timedelta, time
+from email.utils import parseaddr
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+from datetime import datetime, date, timedelta, time, timezone
 from pathlib import Path
 from zoneinfo import ZoneInfo
 
 # ─────────────────────────────────────────────
 # CONFIG
 # ─────────────────────────────────────────────
-DB_PATH    = Path(__file__).parent / "dochazka.db"
-BACKUP_DIR = Path(__file__).parent / "backups"
+# DOCHAZKA_DB / DOCHAZKA_BACKUP_DIR přesměrují data jinam (testy, benchmark)
+DB_PATH    = Path(os.environ.get("DOCHAZKA_DB") or Path(__file__).parent / "dochazka.db")
+BACKUP_DIR = Path(os.environ.get("DOCHAZKA_BACKUP_DIR") or Path(__file__).parent / "backups")
 BACKUP_DIR.mkdir(exist_ok=True)
-BACKUP_KEEP = 30      # max počet uchovávaných automatických záloh
+BACKUP_KEEP = 30      # max počet ručních / pre_restore záloh (na label)
 BACKUP_INTERVAL_H = 6 # každých N hodin
+BACKUP_PAGES_PER_STEP = 256    # stránek na jeden krok backup() – mezi kroky se uvolní zámek
+BACKUP_STEP_SLEEP_S   = 0.01   # pauza mezi kroky
+# Automatické zálohy: nejnovější za každý den / týden / měsíc v daném stáří
+BACKUP_RETENTION = {"daily": 7, "weekly": 5, "monthly": 12}
+BACKUP_MANIFEST  = BACKUP_DIR / "manifest.json"
+BACKUP_POLL_S            = 60    # jak často plánovač kontroluje, zda zálohovat
+BACKUP_BURST_CHANGES     = 200   # tolik změněných řádků od poslední zálohy → záloha dřív
+BACKUP_BURST_MIN_GAP_MIN = 15    # ale nejdřív N minut po předchozí záloze
 CET       = ZoneInfo("Europe/Prague")
 BASE_DIR  = Path(__file__).parent
 
+# ── Profil úložiště SQLite ────────────────────
+# journal_mode je vlastnost souboru DB (nastaví init_db), ostatní PRAGMA
+# se aplikují jednou při otevření každého spojení v poolu.
+DB_PROFILE = {
+    "journal_mode":       "WAL",            # čtenáři neblokují zapisovatele
+    "synchronous":        "NORMAL",         # ve WAL bezpečné, fsync jen při checkpointu
+    "busy_timeout":       5000,             # ms – čekání na zámek místo chyby
+    "mmap_size":          64 * 1024 * 1024, # B – čtení přes mmap
+    "cache_size":         -16000,           # záporné = KiB na spojení
+    "temp_store":         "MEMORY",
+    "journal_size_limit": 16 * 1024 * 1024, # B – WAL se po checkpointu zkrátí
+}
+WAL_CHECKPOINT_INTERVAL_S = 30   # PASSIVE checkpoint na pozadí (0 = nechat na SQLite)
+
+# ── Kalendář pracovních dní ──────────────────
+WORKDAY_INDEX_YEARS = (5, 5)  # předpočítat N let zpět / dopředu od aktuálního roku
+WORKDAY_TABLE       = True    # zrcadlit index do tabulky workday_calendar (pro JOIN v SQL)
+# Firemní dny volna navíc ke státním svátkům – "YYYY-MM-DD": "název"
+COMPANY_DAYS_OFF = {
+    # "2026-12-31": "Silvestr (firemní volno)",
+}
+
+# ── Exporty ──────────────────────────────────
+READ_CACHE_ENTRIES   = 512    # výsledků čtecích helperů ve sdílené LRU cache
+EXPORT_CACHE_ENTRIES = 8      # hotových exportů držených v tempdir (LRU)
+EXPORT_BATCH_ROWS    = 1000   # fetchmany() při streamovaném exportu tabulek
+
+# ── Audit ────────────────────────────────────
+AUDIT_BATCH_SIZE = 200        # max událostí v jedné zápisové transakci
+AUDIT_FLUSH_S    = 0.5        # jak dlouho writer sbírá dávku, než zapíše
+AUDIT_PAGE_SIZE  = 50         # řádků na stránku v prohlížeči auditu
+
 # ── E-mail (nastavte dle vašeho SMTP serveru) ─
 SMTP_HOST     = "smtp.gmail.com"
 SMTP_PORT     = 587
@@ -40,6 +95,29 @@ SMTP_USER     = ""           # např. system@eupraha.cz
 SMTP_PASSWORD = ""           # heslo nebo App Password
 EMAIL_FROM    = "Docházkový systém <system@eupraha.cz>"
 EMAIL_ENABLED = False        # True = skutečně odesílat; False = jen zobrazit simulaci
+EMAIL_BATCH_SIZE   = 50      # zpráv odeslaných přes jedno SMTP spojení
+EMAIL_POLL_S       = 5       # jak často sender kontroluje frontu
+EMAIL_MAX_ATTEMPTS = 6       # po posledním neúspěchu zůstane zpráva jako 'failed'
+EMAIL_RETRY_BASE_S = 30      # odstup opakování: 30 s, 60 s, 120 s … (max 1 h)
+EMAIL_CLAIM_LEASE_S = 1800   # rozpracovanou dávku jiného senderu lze převzít až po N s
+EMAIL_KEEP_DAYS    = 90      # odeslané zprávy starší než N dní se z fronty mažou
+EMAIL_LOG_ROWS     = 20      # posledních zpráv v přehledu administrace
+
+# ── Denní přehled pro administrátory ─────────
+DIGEST_TIMES     = ("08:30",)  # kdy (CET) spočítat a rozeslat přehled; jen pracovní dny
+DIGEST_GRACE_MIN = 120         # zmeškaný termín (restart serveru) doženeme do N minut
+DIGEST_POLL_S    = 30          # jak často úloha kontroluje, zda nastal termín
+
+# ── HTTP API pro terminály ───────────────────
+API_ENABLED = False          # True = spustit API ve vlákně vedle Streamlitu
+API_HOST    = "127.0.0.1"
+API_PORT    = 8765
+# sha256(token) → uživatelské jméno (osobní token) nebo "*" (terminál, uživatel v požadavku)
+# hash: python -c "import hashlib; print(hashlib.sha256(b'TOKEN').hexdigest())"
+API_TOKENS: dict[str, str] = {}
+API_MAX_BODY = 4096          # bajtů; větší tělo → 413 a spojení se ukončí
+# python app.py --api: samostatný proces jen s API, bez UI a úloh na pozadí
+API_ONLY = __name__ == "__main__" and "--api" in sys.argv[1:]
 
 # ─────────────────────────────────────────────
 # CET HELPERS
@@ -84,14 +162,15 @@ def logo_st_path(white: bool = False) -> Path | None:
 # ─────────────────────────────────────────────
 # PAGE CONFIG & CSS
 # ─────────────────────────────────────────────
-st.set_page_config(
-    page_title="Docházkový systém – Exekutorský úřad Praha 4",
-    page_icon="🏛️",
-    layout="wide",
-    initial_sidebar_state="expanded",
-)
+if not API_ONLY:
+    st.set_page_config(
+        page_title="Docházkový systém – Exekutorský úřad Praha 4",
+        page_icon="🏛️",
+        layout="wide",
+        initial_sidebar_state="expanded",
+    )
 
-st.markdown("""
+    st.markdown("""
 <style>
 @import url('https://fonts.googleapis.com/css2?family=Inter:wght@400;500;600;700;800&display=swap');
 
@@ -485,6 +564,66 @@ hr { border-color: var(--border) !important; }
     color: var(--text-dark); margin-bottom: 14px;
 }
 .divider { height: 1px; background: var(--border); margin: 24px 0; }
+
+/* ═══════════════════════════════════════════════
+   17.  ABSENCE CALENDAR  (render_calendar_html)
+   ═══════════════════════════════════════════════ */
+.cal-leg { display:flex; gap:14px; margin-bottom:20px; flex-wrap:wrap; }
+.cal-leg span { display:flex; align-items:center; gap:6px; font-size:12px; color:#475569; }
+.cal-wrap {
+    overflow-x:auto; -webkit-overflow-scrolling:touch;
+    border:1px solid #e2e8f0; border-radius:12px;
+    box-shadow:0 2px 8px rgba(31,94,140,.08);
+}
+.cal { border-collapse:collapse; font-family:Inter,sans-serif; min-width:max-content; width:100%; }
+.cal th, .cal td {
+    min-width:44px; width:44px; max-width:44px;
+    text-align:center; vertical-align:middle; padding:0 1px;
+}
+.cal td { height:40px; background:#fff; border-bottom:1px solid #e2e8f0; }
+.cal tbody tr:nth-child(even) td { background:#f8fafc; }
+.cal th { padding:5px 1px; background:#f0f4f8; border-bottom:2px solid #cbd5e1; }
+.cal th i { display:block; font-style:normal; font-size:9px; color:#94a3b8; font-weight:600; line-height:1.2; }
+.cal th b { display:block; font-size:15px; font-weight:700; color:#1e293b; line-height:1.2; }
+.cal th.w { background:#e2e8f0; }
+.cal th.w b { color:#94a3b8; font-weight:600; }
+.cal th.h { background:#fef3c7; }
+.cal th.h i, .cal th.h b { color:#92400e; }
+.cal th.t { background:#1d4ed8; }
+.cal th.t i { color:rgba(255,255,255,.7); }
+.cal th.t b { color:#fff; font-weight:800; }
+.cal .n {
+    min-width:100px; width:100px; max-width:100px; text-align:left; padding:4px 6px;
+    border-right:2px solid #cbd5e1; white-space:nowrap; overflow:hidden;
+}
+.cal th.n { padding:8px; }
+.cal .n div { display:flex; align-items:center; gap:5px; }
+.cal .av {
+    flex-shrink:0; width:22px; height:22px; border-radius:50%;
+    background:color-mix(in srgb, var(--c) 13%, transparent); color:var(--c);
+    border:1.5px solid color-mix(in srgb, var(--c) 40%, transparent);
+    display:flex; align-items:center; justify-content:center; font-weight:800; font-size:8px;
+}
+.cal .nm { font-size:11px; font-weight:600; color:#334155; overflow:hidden; text-overflow:ellipsis; }
+.cal tbody tr td.w { background:#f1f5f9; }
+.cal tbody tr td.h { background:#fefce8; }
+.cal tbody tr td.t { background:#eff6ff; border-left:2px solid #1d4ed8; border-right:2px solid #1d4ed8; }
+.cal td.w:empty::after {
+    content:""; display:block; width:18px; height:3px; margin:0 auto;
+    background:#d1d5db; border-radius:2px;
+}
+.cal td.h:empty::after { content:"★"; display:block; font-size:15px; color:#f59e0b; }
+.cal-b {
+    width:30px; height:30px; margin:0 auto; border-radius:6px; font-style:normal;
+    display:flex; align-items:center; justify-content:center; font-size:12px; font-weight:800;
+}
+.cal-leg .cal-b { width:22px; height:22px; margin:0; font-size:11px; }
+.cal-b.v  { background:#dbeafe; color:#1d4ed8; border:1.5px solid #1d4ed866; }
+.cal-b.vh { background:#bfdbfe; color:#1d4ed8; border:1.5px solid #1d4ed866; }
+.cal-b.s  { background:#fee2e2; color:#991b1b; border:1.5px solid #991b1b66; }
+.cal-b.n  { background:#ffe4e6; color:#9f1239; border:1.5px solid #9f123966; }
+.cal-b.x  { background:#f1f5f9; color:#64748b; border:1.5px solid #64748b66; }
+.cal-b.hl { background:#fef9c3; color:#92400e; border:1.5px solid #92400e66; }
 </style>
 """, unsafe_allow_html=True)
 
@@ -495,70 +634,402 @@ hr { border-color: var(--border) !important; }
 # ─────────────────────────────────────────────
 # AUTOMATICKÁ ZÁLOHA
 # ─────────────────────────────────────────────
+_BACKUP_LOCK = threading.Lock()
+
+
+def _load_manifest() -> list[dict]:
+    """Záznamy záloh z manifest.json; chybí-li, sestaví se jednorázově ze souborů."""
+    try:
+        return json.loads(BACKUP_MANIFEST.read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError):
+        return []
+    entries = []
+    for f in glob.glob(str(BACKUP_DIR / "dochazka_*.sqlite*")):
+        p     = Path(f)
+        parts = p.name.split(".")[0].split("_")   # dochazka_<label>_<datum>_<čas>[ms][-n]
+        try:
+            created = datetime.strptime(f"{parts[-2]}_{parts[-1][:6]}", "%Y%m%d_%H%M%S")
+        except ValueError:
+            continue
+        entries.append({"name": p.name, "label": "_".join(parts[1:-2]),
+                        "created_at": created.isoformat(timespec="seconds"),
+                        "size": p.stat().st_size, "db_size": None,
+                        "duration_s": None, "integrity": None})
+    _save_manifest(entries)
+    return entries
+
+
+def _save_manifest(entries: list[dict]):
+    entries = sorted(entries, key=lambda e: e["created_at"], reverse=True)
+    tmp = BACKUP_MANIFEST.with_suffix(".tmp")
+    tmp.write_text(json.dumps(entries, ensure_ascii=False, indent=1), encoding="utf-8")
+    tmp.replace(BACKUP_MANIFEST)
+
+
+def _retained_auto(entries: list[dict], now: datetime) -> set[str]:
+    """GFS: nejnovější auto záloha z každého dne/týdne/měsíce v rámci BACKUP_RETENTION."""
+    buckets = {
+        "daily":   (lambda d: d.date(),               timedelta(days=1)),
+        "weekly":  (lambda d: d.isocalendar()[:2],    timedelta(weeks=1)),
+        "monthly": (lambda d: (d.year, d.month),      timedelta(days=31)),
+    }
+    keep = set()
+    newest_first = sorted(entries, key=lambda e: e["created_at"], reverse=True)
+    if newest_first:
+        keep.add(newest_first[0]["name"])
+    for period, count in BACKUP_RETENTION.items():
+        key_of, span = buckets[period]
+        seen = set()
+        for e in newest_first:
+            created = datetime.fromisoformat(e["created_at"])
+            if now - created > span * count:
+                break
+            if key_of(created) not in seen:
+                seen.add(key_of(created))
+                keep.add(e["name"])
+    return keep
+
+
+def _prune_backups(entries: list[dict]) -> list[dict]:
+    """Auto zálohy podle GFS, ostatní labely posledních BACKUP_KEEP kusů."""
+    auto = [e for e in entries if e["label"] == "auto"]
+    keep = _retained_auto(auto, datetime.now())
+    by_label = {}
+    for e in sorted(entries, key=lambda e: e["created_at"], reverse=True):
+        if e["label"] != "auto":
+            by_label.setdefault(e["label"], []).append(e)
+    for group in by_label.values():
+        keep.update(e["name"] for e in group[:BACKUP_KEEP])
+    for e in entries:
+        if e["name"] not in keep:
+            try: os.remove(BACKUP_DIR / e["name"])
+            except OSError: pass
+    return [e for e in entries if e["name"] in keep]
+
+
+def _reserve_backup_name(label: str) -> tuple[Path, Path]:
+    """Jedinečná dvojice (cíl, .partial) – .partial se založí exkluzivně.
+
+    Čas v názvu je na milisekundy; dvě zálohy v tutéž chvíli (tlačítko
+    a plánovač) dostanou příponu -2, -3 …, nikdy nesdílí soubor.
+    """
+    now = datetime.now()
+    ts  = now.strftime("%Y%m%d_%H%M%S") + f"{now.microsecond // 1000:03d}"
+    for n in itertools.count(1):
+        stem    = f"dochazka_{label}_{ts}" + (f"-{n}" if n > 1 else "")
+        dest    = BACKUP_DIR / f"{stem}.sqlite.gz"
+        partial = BACKUP_DIR / f".{stem}.partial"
+        if dest.exists():
+            continue
+        try:
+            partial.open("x").close()
+        except FileExistsError:
+            continue
+        return dest, partial
+
+
 def _do_backup(label: str = "auto") -> Path | None:
-    """Zkopíruje DB do BACKUP_DIR. Vrátí cestu k záloze nebo None."""
+    """Online záloha DB po dávkách stránek, komprimovaná gzipem. Vrátí cestu nebo None.
+
+    backup() kopíruje BACKUP_PAGES_PER_STEP stránek a mezi kroky spí,
+    takže zápisy (příchody) nečekají na celou kopii. Výsledek se ověří
+    přes PRAGMA integrity_check a zapíše do manifestu.
+    """
     if not DB_PATH.exists():
         return None
-    ts   = datetime.now().strftime("%Y%m%d_%H%M%S")
-    dest = BACKUP_DIR / f"dochazka_{label}_{ts}.sqlite"
+    dest, partial = _reserve_backup_name(label)
+    t0 = datetime.now()
     try:
-        # Použij SQLite Online Backup API – bezpečné za provozu
-        src_conn = sqlite3.connect(DB_PATH)
-        dst_conn = sqlite3.connect(dest)
-        src_conn.backup(dst_conn)
-        dst_conn.close()
-        src_conn.close()
-        # Udržuj max BACKUP_KEEP souborů pro každý label
-        pattern = str(BACKUP_DIR / f"dochazka_{label}_*.sqlite")
-        old = sorted(glob.glob(pattern))
-        for f in old[:-BACKUP_KEEP]:
-            try: os.remove(f)
-            except Exception: pass
-        return dest
+        version  = data_version()   # čtené před kopií – změny během ní chytí další běh
+        src_conn = sqlite3.connect(DB_PATH, timeout=30)
+        dst_conn = sqlite3.connect(partial)
+        try:
+            src_conn.backup(dst_conn, pages=BACKUP_PAGES_PER_STEP, sleep=BACKUP_STEP_SLEEP_S)
+            integrity = "; ".join(r[0] for r in dst_conn.execute("PRAGMA integrity_check"))
+        finally:
+            dst_conn.close()
+            src_conn.close()
+        db_size = partial.stat().st_size
+        with open(partial, "rb") as fin, gzip.open(dest, "wb", compresslevel=6) as fout:
+            shutil.copyfileobj(fin, fout, 1024 * 1024)
     except Exception:
+        dest.unlink(missing_ok=True)
         return None
-
-
-def _auto_backup_loop():
-    """Bezi v daemon threadu; zalohuje vzdycky BACKUP_INTERVAL_H hodin."""
-    import time
-    while True:
-        time.sleep(BACKUP_INTERVAL_H * 3600)
-        _do_backup("auto")
+    finally:
+        partial.unlink(missing_ok=True)
+
+    entry = {"name": dest.name, "label": label,
+             "created_at": t0.isoformat(timespec="seconds"),
+             "size": dest.stat().st_size, "db_size": db_size,
+             "duration_s": round((datetime.now() - t0).total_seconds(), 3),
+             "integrity": integrity, "data_version": version}
+    with _BACKUP_LOCK:
+        _save_manifest(_prune_backups(_load_manifest() + [entry]))
+    return dest
+
+
+class BackupScheduler:
+    """Plánovač automatických záloh řízený změnami dat.
+
+    Čas a verze dat poslední zálohy se čtou z manifestu, takže restart
+    serveru interval nevynuluje. Beze změn (data_version) se nezálohuje,
+    po dávce BACKUP_BURST_CHANGES změn se zálohuje dřív než po intervalu.
+    """
+
+    def __init__(self):
+        self.status = {"checked_at": None, "plan": None, "last_result": None, "error": None}
+
+    def plan(self, now: datetime | None = None) -> dict:
+        now  = now or datetime.now()
+        cur  = data_version()
+        last = next((e for e in list_backups() if e.get("data_version") is not None), None)
+        if last is None:
+            return {"due": True, "next": now, "reason": "zatím žádná záloha",
+                    "changes": None, "last": None}
+        last_at = datetime.fromisoformat(last["created_at"])
+        changes = abs(cur - last["data_version"])
+        if changes == 0:
+            return {"due": False, "next": None, "reason": "beze změn od poslední zálohy",
+                    "changes": 0, "last": last_at}
+        if changes >= BACKUP_BURST_CHANGES:
+            next_at = last_at + timedelta(minutes=BACKUP_BURST_MIN_GAP_MIN)
+            reason  = f"dávka {changes} změn"
+        else:
+            next_at = last_at + timedelta(hours=BACKUP_INTERVAL_H)
+            reason  = "interval"
+        return {"due": now >= next_at, "next": next_at, "reason": reason,
+                "changes": changes, "last": last_at}
+
+    def run_once(self) -> Path | None:
+        plan = self.plan()
+        self.status.update(checked_at=datetime.now(), plan=plan, error=None)
+        if not plan["due"]:
+            return None
+        path = _do_backup("auto")
+        self.status["last_result"] = (datetime.now(), path.name if path else None)
+        self.status["plan"] = self.plan()
+        return path
+
+    def loop(self):
+        import time
+        while True:
+            try:
+                self.run_once()
+            except Exception as e:
+                self.status["error"] = str(e)
+            time.sleep(BACKUP_POLL_S)
 
 
 @st.cache_resource
-def start_auto_backup():
+def start_auto_backup() -> BackupScheduler:
     """cache_resource zajisti jedine spusteni za cely proces serveru –
     Streamlit re-spousti skript pri kazde interakci, ale cache_resource perzistuje."""
-    t = threading.Thread(target=_auto_backup_loop, daemon=True)
+    scheduler = BackupScheduler()
+    t = threading.Thread(target=scheduler.loop, daemon=True)
     t.start()
-    return True
+    return scheduler
 
 
 def list_backups() -> list[dict]:
-    """Vrátí seznam všech záloh seřazených od nejnovější."""
-    files = sorted(glob.glob(str(BACKUP_DIR / "dochazka_*.sqlite")), reverse=True)
-    result = []
-    for f in files:
-        p    = Path(f)
-        size = p.stat().st_size
-        name = p.name  # dochazka_auto_20250227_143000.sqlite
-        parts = name.replace(".sqlite", "").split("_")
-        # parts: ['dochazka', label, date, time]
-        label = parts[1] if len(parts) >= 4 else "?"
-        result.append({"path": f, "name": p.name, "size": size, "label": label})
-    return result
+    """Vrátí seznam všech záloh z manifestu seřazených od nejnovější."""
+    with _BACKUP_LOCK:
+        entries = _load_manifest()
+    return [{**e, "path": str(BACKUP_DIR / e["name"])}
+            for e in sorted(entries, key=lambda e: e["created_at"], reverse=True)]
 
 
 # ─────────────────────────────────────────────
-def get_conn():
-    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
-    conn.row_factory = sqlite3.Row
-    return conn
+# SPOJENÍ K DATABÁZI
+# ─────────────────────────────────────────────
+class PooledConnection(sqlite3.Connection):
+    """`with conn:` uvnitř db_transaction() nesmí commitnout vnější transakci."""
+
+    in_pool_tx = False
+    pool_gen   = 0      # generace poolu, ve které bylo spojení otevřeno
+
+    def __exit__(self, *exc):
+        if self.in_pool_tx:
+            return False
+        return super().__exit__(*exc)
+
+
+class ConnectionPool:
+    """Dlouhožijící SQLite spojení – jedno na vlákno, po doběhnutí vlákna se recyklují.
+
+    Streamlit spouští každý rerun ve vlastním vlákně; spojení proto nedržíme
+    v threading.local (zaniklo by s vláknem), ale v mapě vlákno → spojení.
+    Spojení mrtvých vláken se vrací do zásobníku a převezme je další vlákno.
+    invalidate() jen zvýší generaci: cizí spojení se nezavírají pod rukama
+    vláken, která je drží – každé vlákno si při dalším get() otevře nové.
+    """
+
+    def __init__(self, path: Path, pragmas: dict | None = None):
+        self.path    = path
+        self.pragmas = dict(pragmas or {})
+        self._lock   = threading.Lock()
+        self._owned  = {}   # thread ident -> (thread, conn)
+        self._idle   = []   # spojení po doběhnutých vláknech
+        self.stats   = {"opened": 0, "reused": 0, "recycled": 0}
+        self.generation = 0
+
+    def _open(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False, factory=PooledConnection)
+        conn.pool_gen    = self.generation
+        conn.row_factory = sqlite3.Row
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name}={value}")
+        return conn
+
+    def _reclaim(self):
+        """Přesune spojení doběhnutých vláken do zásobníku (volat pod zámkem)."""
+        for ident, (thread, conn) in list(self._owned.items()):
+            if not thread.is_alive():
+                del self._owned[ident]
+                if conn.in_transaction:
+                    conn.rollback()
+                if conn.pool_gen == self.generation:
+                    self._idle.append(conn)
+                else:
+                    conn.close()
+
+    def get(self) -> sqlite3.Connection:
+        """Spojení patřící aktuálnímu vláknu (případně převzaté nebo nové)."""
+        thread, stale = threading.current_thread(), None
+        with self._lock:
+            owned = self._owned.get(thread.ident)
+            if owned and owned[0] is thread:
+                conn = owned[1]
+                # Rozběhnutou transakci dokončí ještě na starém spojení
+                if conn.pool_gen == self.generation or conn.in_transaction:
+                    self.stats["reused"] += 1
+                    return conn
+                del self._owned[thread.ident]
+                stale = conn
+            self._reclaim()
+            conn = self._idle.pop() if self._idle else None
+            if conn is not None:
+                self.stats["recycled"] += 1
+        if stale is not None:
+            stale.close()
+        if conn is None:
+            conn = self._open()
+            with self._lock:
+                self.stats["opened"] += 1
+        with self._lock:
+            self._owned[thread.ident] = (thread, conn)
+        return conn
+
+    @contextmanager
+    def transaction(self, immediate: bool = True):
+        """Explicitní transakce; vnořené volání se připojí k již běžící transakci."""
+        conn = self.get()
+        if conn.in_transaction:
+            yield conn
+            return
+        conn.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+        conn.in_pool_tx = True
+        try:
+            yield conn
+        except BaseException:
+            conn.in_pool_tx = False
+            conn.rollback()
+            raise
+        else:
+            conn.in_pool_tx = False
+            conn.commit()
+
+    def invalidate(self):
+        """Nová generace: volná spojení se zavřou, držená vlákny až při jejich dalším get()."""
+        with self._lock:
+            self.generation += 1
+            conns, self._idle = self._idle, []
+        for conn in conns:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            self._reclaim()
+            return {**self.stats, "active": len(self._owned), "idle": len(self._idle)}
+
+
+def _connection_pragmas() -> dict:
+    """PRAGMA z DB_PROFILE platné pro jednotlivé spojení."""
+    pragmas = {k: v for k, v in DB_PROFILE.items() if k != "journal_mode"}
+    if WAL_CHECKPOINT_INTERVAL_S and str(DB_PROFILE.get("journal_mode", "")).upper() == "WAL":
+        # Commit nikdy nespouští checkpoint sám – obstará ho vlákno na pozadí
+        pragmas["wal_autocheckpoint"] = 0
+    return pragmas
+
+
+@st.cache_resource
+def get_pool() -> ConnectionPool:
+    """Jeden pool na celý proces serveru (sdílený všemi sessions)."""
+    return ConnectionPool(DB_PATH, _connection_pragmas())
+
+
+def get_conn() -> sqlite3.Connection:
+    return get_pool().get()
+
+
+def db_transaction(immediate: bool = True):
+    """`with db_transaction() as conn:` – BEGIN IMMEDIATE … COMMIT / ROLLBACK."""
+    return get_pool().transaction(immediate)
+
+
+def pool_stats() -> dict:
+    """Počty otevřených / znovupoužitých spojení pro diagnostiku."""
+    return get_pool().snapshot()
+
+
+def apply_storage_profile(conn: sqlite3.Connection) -> str:
+    """Nastaví journal_mode z DB_PROFILE; vrátí skutečně platný režim."""
+    mode = DB_PROFILE.get("journal_mode")
+    if not mode:
+        return conn.execute("PRAGMA journal_mode").fetchone()[0]
+    return conn.execute(f"PRAGMA journal_mode={mode}").fetchone()[0]
+
+
+def storage_profile_status() -> dict:
+    """Aktuální hodnoty PRAGMA z DB_PROFILE (pro admin přehled)."""
+    conn = get_conn()
+    return {name: conn.execute(f"PRAGMA {name}").fetchone()[0] for name in DB_PROFILE}
+
+
+def wal_checkpoint(mode: str = "PASSIVE") -> dict | None:
+    """Provede checkpoint WAL; PASSIVE nečeká na čtenáře ani zapisovatele."""
+    try:
+        busy, log, done = get_conn().execute(f"PRAGMA wal_checkpoint({mode})").fetchone()
+    except sqlite3.Error:
+        return None
+    return {"busy": busy, "log_frames": log, "checkpointed": done}
+
+
+def _wal_checkpoint_loop():
+    """Bezi v daemon threadu; kazdych WAL_CHECKPOINT_INTERVAL_S s prenese WAL do DB."""
+    import time
+    while True:
+        time.sleep(WAL_CHECKPOINT_INTERVAL_S)
+        wal_checkpoint("PASSIVE")
+
+
+@st.cache_resource
+def start_wal_checkpointer():
+    """Spusti checkpoint vlakno jen jednou za proces a jen v rezimu WAL."""
+    if not WAL_CHECKPOINT_INTERVAL_S or "wal_autocheckpoint" not in _connection_pragmas():
+        return False
+    t = threading.Thread(target=_wal_checkpoint_loop, daemon=True)
+    t.start()
+    return True
+
 
 def init_db():
     with get_conn() as conn:
+        apply_storage_profile(conn)
         conn.executescript("""
         CREATE TABLE IF NOT EXISTS users (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -625,16 +1096,7 @@ def init_db():
             FOREIGN KEY(user_id) REFERENCES users(id)
         );
         """)
-        for _migration in [
-            "ALTER TABLE absences ADD COLUMN email_sent INTEGER DEFAULT 0",
-            "ALTER TABLE absences ADD COLUMN half_days TEXT DEFAULT '[]'",
-            "ALTER TABLE pauses ADD COLUMN paid INTEGER DEFAULT 0",
-        ]:
-            try:
-                conn.execute(_migration)
-                conn.commit()
-            except Exception:
-                pass
+        run_migrations(conn)
         # Seed admin
         row = conn.execute("SELECT id FROM users WHERE role='admin'").fetchone()
         if not row:
@@ -644,6 +1106,352 @@ def init_db():
             )
             conn.commit()
 
+
+@st.cache_resource
+def ensure_db():
+    """init_db jen jednou za proces – ne při každém rerunu skriptu."""
+    init_db()
+    if WORKDAY_TABLE:
+        sync_workday_table()
+    # Svátky/firemní volna se mohly změnit v konfiguraci → srovnat ledger
+    rebuild_leave_ledger()
+    reconcile_pending_counters()
+    return True
+
+
+# ── Migrace schématu ─────────────────────────────────────────────
+def _add_column(conn, table: str, column: str, decl: str):
+    cols = {r["name"] for r in conn.execute(f"PRAGMA table_info({table})")}
+    if column not in cols:
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+
+
+def _m001_columns(conn):
+    _add_column(conn, "users",    "email",      "TEXT")
+    _add_column(conn, "absences", "email_sent", "INTEGER DEFAULT 0")
+    _add_column(conn, "absences", "half_days",  "TEXT DEFAULT '[]'")
+    _add_column(conn, "pauses",   "paid",       "INTEGER DEFAULT 0")
+
+
+def _m002_attendance_unique(conn):
+    """Sloučí duplicitní záznamy (user_id, date) do nejstaršího a přidá UNIQUE index.
+
+    Mezera mezi sloučenými záznamy se stane pauzou jako u druhého příchodu
+    (do_checkin) – jinak by sloučený den započítal přestávku jako práci.
+    """
+    dups = conn.execute(
+        "SELECT user_id, date, MIN(id) AS keep_id FROM attendance"
+        " GROUP BY user_id, date HAVING COUNT(*) > 1"
+    ).fetchall()
+    for d in dups:
+        rows = conn.execute(
+            "SELECT * FROM attendance WHERE user_id=? AND date=? ORDER BY id",
+            (d["user_id"], d["date"])
+        ).fetchall()
+        checkins  = [r["checkin_time"] for r in rows if r["checkin_time"]]
+        checkouts = [r["checkout_time"] for r in rows if r["checkout_time"]]
+        still_open = any(r["checkin_time"] and not r["checkout_time"] for r in rows)
+        other_ids = [r["id"] for r in rows if r["id"] != d["keep_id"]]
+        marks = ",".join("?" * len(other_ids))
+        conn.execute(f"UPDATE pauses SET attendance_id=? WHERE attendance_id IN ({marks})",
+                     (d["keep_id"], *other_ids))
+        conn.execute(f"DELETE FROM attendance WHERE id IN ({marks})", other_ids)
+        end = None
+        for r in sorted((r for r in rows if r["checkin_time"]), key=lambda r: r["checkin_time"]):
+            if end and r["checkin_time"] > end:
+                conn.execute(
+                    "INSERT INTO pauses(attendance_id,pause_type,start_time,end_time,paid)"
+                    " VALUES(?,?,?,?,0)", (d["keep_id"], SECOND_CHECKIN_PAUSE, end, r["checkin_time"])
+                )
+            if not r["checkout_time"]:
+                break
+            end = max(end or r["checkout_time"], r["checkout_time"])
+        conn.execute(
+            "UPDATE attendance SET checkin_time=?, checkout_time=? WHERE id=?",
+            (min(checkins) if checkins else None,
+             None if still_open or not checkouts else max(checkouts),
+             d["keep_id"])
+        )
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS ux_attendance_user_date"
+                 " ON attendance(user_id, date)")
+
+
+# Tabulky, jejichž změny zvyšují čítač v data_versions (klíč pro cache exportů)
+VERSIONED_TABLES = ("users", "attendance", "pauses", "absences",
+                    "time_corrections", "leave_funds", "leave_balances")
+
+
+def _version_triggers(conn, table: str):
+    """AFTER INSERT/UPDATE/DELETE triggery zvyšující verzi tabulky."""
+    conn.execute("INSERT OR IGNORE INTO data_versions(tbl, version) VALUES(?, 0)", (table,))
+    for op in ("INSERT", "UPDATE", "DELETE"):
+        conn.execute(
+            f"CREATE TRIGGER IF NOT EXISTS trg_ver_{table}_{op.lower()} AFTER {op} ON {table}"
+            f" BEGIN UPDATE data_versions SET version=version+1 WHERE tbl='{table}'; END"
+        )
+
+
+def _m006_data_versions(conn):
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS data_versions ("
+        " tbl TEXT PRIMARY KEY, version INTEGER NOT NULL DEFAULT 0) WITHOUT ROWID"
+    )
+    for table in VERSIONED_TABLES:
+        _version_triggers(conn, table)
+
+
+_M003_INDEXES = (
+    "CREATE INDEX IF NOT EXISTS ix_pauses_att_end       ON pauses(attendance_id, end_time)",
+    "CREATE INDEX IF NOT EXISTS ix_absences_approved    ON absences(approved, date_from, date_to)",
+    "CREATE INDEX IF NOT EXISTS ix_absences_user        ON absences(user_id, date_from)",
+    "CREATE INDEX IF NOT EXISTS ix_absences_dates       ON absences(date_to, date_from)",
+    "CREATE INDEX IF NOT EXISTS ix_corrections_status   ON time_corrections(status, created_at)",
+    "CREATE INDEX IF NOT EXISTS ix_corrections_user     ON time_corrections(user_id, created_at)",
+)
+
+_M007_AUDIT = (
+    "CREATE TABLE IF NOT EXISTS audit_log ("
+    " id INTEGER PRIMARY KEY AUTOINCREMENT, ts TEXT NOT NULL, actor TEXT NOT NULL,"
+    " action TEXT NOT NULL, tbl TEXT NOT NULL, row_id INTEGER,"
+    " before TEXT, after TEXT, note TEXT)",
+    "CREATE INDEX IF NOT EXISTS ix_audit_tbl   ON audit_log(tbl, row_id, id)",
+    "CREATE INDEX IF NOT EXISTS ix_audit_actor ON audit_log(actor, id)",
+    # Append-only: úpravy a mazání auditu odmítne sama DB
+    "CREATE TRIGGER IF NOT EXISTS trg_audit_no_update BEFORE UPDATE ON audit_log"
+    " BEGIN SELECT RAISE(ABORT, 'audit_log je append-only'); END",
+    "CREATE TRIGGER IF NOT EXISTS trg_audit_no_delete BEFORE DELETE ON audit_log"
+    " BEGIN SELECT RAISE(ABORT, 'audit_log je append-only'); END",
+)
+
+# Čítače čekajících schválení – triggery je drží v téže transakci jako zápis
+# název → (tabulka, podmínka; {r} = NEW / OLD / tabulka)
+_PENDING_SOURCES = {
+    "absences":    ("absences",         "{r}.approved=0"),
+    "corrections": ("time_corrections", "{r}.status='pending'"),
+}
+
+
+def _m008_pending_counters(conn):
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS pending_counters ("
+        " name TEXT PRIMARY KEY, n INTEGER NOT NULL) WITHOUT ROWID"
+    )
+    for name, (table, cond) in _PENDING_SOURCES.items():
+        new, old = cond.format(r="NEW"), cond.format(r="OLD")
+        conn.execute(
+            f"INSERT OR REPLACE INTO pending_counters(name, n)"
+            f" SELECT '{name}', COUNT(*) FROM {table} WHERE {cond.format(r=table)}"
+        )
+        for op, when, delta in (
+            ("INSERT", new,                  "1"),
+            ("DELETE", old,                  "-1"),
+            ("UPDATE", f"({new}) != ({old})", f"({new}) - ({old})"),
+        ):
+            conn.execute(
+                f"CREATE TRIGGER IF NOT EXISTS trg_pending_{name}_{op.lower()}"
+                f" AFTER {op} ON {table} WHEN {when}"
+                f" BEGIN UPDATE pending_counters SET n = n + {delta} WHERE name='{name}'; END"
+            )
+
+
+def _m010_digest(conn):
+    _add_column(conn, "users", "digest", "INTEGER DEFAULT 1")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS digest_runs ("
+        " tick TEXT PRIMARY KEY, ran_at TEXT NOT NULL, recipients INTEGER NOT NULL) WITHOUT ROWID"
+    )
+
+
+def _m011_punch_events(conn):
+    for sql in (
+        "CREATE TABLE IF NOT EXISTS punch_events ("
+        " id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, day TEXT,"
+        " kind TEXT NOT NULL, ts TEXT NOT NULL, source TEXT NOT NULL, data TEXT NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS ix_punch_user_day ON punch_events(user_id, day, id)",
+        "CREATE TRIGGER IF NOT EXISTS trg_punch_no_update BEFORE UPDATE ON punch_events"
+        " BEGIN SELECT RAISE(ABORT, 'punch_events je append-only'); END",
+        "CREATE TRIGGER IF NOT EXISTS trg_punch_no_delete BEFORE DELETE ON punch_events"
+        " BEGIN SELECT RAISE(ABORT, 'punch_events je append-only'); END",
+    ):
+        conn.execute(sql)
+    _seed_punch_baseline(conn, "migrace")
+
+
+def _m012_outbox_claim(conn):
+    _add_column(conn, "email_outbox", "claimed_at", "TEXT")
+    _add_column(conn, "email_outbox", "claimed_by", "TEXT")
+
+
+# (verze, popis, krok) – krok je funkce(conn) nebo n-tice SQL příkazů.
+# Každá migrace běží ve vlastní transakci právě jednou; nové přidávejte na konec.
+MIGRATIONS = [
+    (1, "sloupce email, email_sent, half_days, paid", _m001_columns),
+    (2, "attendance UNIQUE(user_id, date)",            _m002_attendance_unique),
+    (3, "indexy pro docházku, pauzy, absence a úpravy", _M003_INDEXES),
+    (4, "tabulka workday_calendar", (
+        "CREATE TABLE IF NOT EXISTS workday_calendar ("
+        " date TEXT PRIMARY KEY, is_workday INTEGER NOT NULL,"
+        " cum_workdays INTEGER NOT NULL) WITHOUT ROWID",
+    )),
+    (5, "tabulka leave_balances", (
+        "CREATE TABLE IF NOT EXISTS leave_balances ("
+        " user_id INTEGER NOT NULL, year INTEGER NOT NULL,"
+        " vacation_used REAL NOT NULL DEFAULT 0, sickday_used INTEGER NOT NULL DEFAULT 0,"
+        " updated_at TEXT NOT NULL, PRIMARY KEY(user_id, year)) WITHOUT ROWID",
+    )),
+    (6, "data_versions + triggery verzí", _m006_data_versions),
+    (7, "audit_log (append-only)",        _M007_AUDIT),
+    (8, "pending_counters + triggery",     _m008_pending_counters),
+    (9, "email_outbox", (
+        "CREATE TABLE IF NOT EXISTS email_outbox ("
+        " id INTEGER PRIMARY KEY AUTOINCREMENT, created_at TEXT NOT NULL,"
+        " to_addr TEXT NOT NULL, subject TEXT NOT NULL, body TEXT NOT NULL,"
+        " kind TEXT NOT NULL DEFAULT '', ref_id INTEGER,"
+        " status TEXT NOT NULL DEFAULT 'pending', attempts INTEGER NOT NULL DEFAULT 0,"
+        " next_attempt_at TEXT NOT NULL, last_error TEXT, sent_at TEXT)",
+        "CREATE INDEX IF NOT EXISTS ix_outbox_due ON email_outbox(status, next_attempt_at)",
+    )),
+    (10, "users.digest + tabulka digest_runs", _m010_digest),
+    (11, "punch_events (append-only) + výchozí stav", _m011_punch_events),
+    (12, "email_outbox.claimed_at/claimed_by",      _m012_outbox_claim),
+]
+
+
+def schema_version(conn=None) -> int:
+    conn = conn or get_conn()
+    try:
+        return conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+    except sqlite3.OperationalError:
+        return 0
+
+
+def run_migrations(conn) -> list[int]:
+    """Aplikuje chybějící migrace z MIGRATIONS; vrátí seznam nově použitých verzí."""
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS schema_version ("
+        " version INTEGER PRIMARY KEY, name TEXT NOT NULL, applied_at TEXT NOT NULL)"
+    )
+    conn.commit()
+    current, applied = schema_version(conn), []
+    for version, name, step in MIGRATIONS:
+        if version <= current:
+            continue
+        with db_transaction() as tx:
+            if callable(step):
+                step(tx)
+            else:
+                for sql in step:
+                    tx.execute(sql)
+            tx.execute("INSERT INTO schema_version(version,name,applied_at) VALUES(?,?,?)",
+                       (version, name, cet_now().isoformat()))
+        applied.append(version)
+    return applied
+
+
+def data_version(*tables: str) -> int:
+    """Monotónní verze dat (součet čítačů); bez argumentů přes všechny tabulky."""
+    sql, args = "SELECT COALESCE(SUM(version), 0) FROM data_versions", ()
+    if tables:
+        sql  += f" WHERE tbl IN ({','.join('?' * len(tables))})"
+        args  = tables
+    return get_conn().execute(sql, args).fetchone()[0]
+
+
+class ReadCache:
+    """Sdílená LRU cache výsledků čtecích helperů pro všechny session.
+
+    Klíč obsahuje verzi dotčených tabulek (data_version), takže zápis
+    starý záznam jen „přeskočí“ a ten časem vypadne z LRU.
+    """
+
+    def __init__(self, max_entries: int = READ_CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self._lock    = threading.Lock()
+        self._entries = OrderedDict()
+        self.stats    = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def get(self, key: tuple, load):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return self._entries[key]
+            self.stats["misses"] += 1
+        value = load()
+        with self._lock:
+            self._entries[key] = value
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            total = self.stats["hits"] + self.stats["misses"]
+            return {**self.stats, "entries": len(self._entries),
+                    "hit_rate": self.stats["hits"] / total if total else 0.0}
+
+
+@st.cache_resource
+def get_read_cache() -> ReadCache:
+    return ReadCache()
+
+
+def _clone(value):
+    """Mělká kopie, aby volající nemohl změnit sdílený výsledek v cache."""
+    if isinstance(value, list):
+        return [dict(v) if isinstance(v, dict) else v for v in value]
+    if isinstance(value, dict):
+        return dict(value)
+    return value
+
+
+def cached_read(*tables: str):
+    """Dekorátor čtecího helperu: výsledek z ReadCache, dokud se tabulky nezmění."""
+    def wrap(fn):
+        @functools.wraps(fn)
+        def inner(*args, **kwargs):
+            key = (fn.__name__, args, tuple(sorted(kwargs.items())), data_version(*tables))
+            return _clone(get_read_cache().get(key, lambda: fn(*args, **kwargs)))
+        inner.uncached = fn
+        return inner
+    return wrap
+
+
+# Dotazy z horkých cest – explain_hot_queries() ověří, že nepoužívají full scan
+HOT_QUERIES = {
+    "docházka dne":        "SELECT * FROM attendance WHERE user_id=? AND date=?",
+    "docházka měsíce":     "SELECT * FROM attendance WHERE user_id=? AND date BETWEEN ? AND ?",
+    "otevřená pauza":      "SELECT id FROM pauses WHERE attendance_id=? AND end_time IS NULL",
+    "pauzy záznamu":       "SELECT * FROM pauses WHERE attendance_id=? ORDER BY start_time",
+    "absence dne":         "SELECT * FROM absences WHERE date_from<=? AND date_to>=?",
+    "absence kalendáře":   "SELECT * FROM absences WHERE approved=1 AND date_to>=? AND date_from<=?",
+    "absence uživatele":   "SELECT * FROM absences WHERE user_id=? ORDER BY date_from DESC",
+    "čekající absence":    "SELECT COUNT(*) FROM absences WHERE approved=0",
+    "čekající úpravy":     "SELECT COUNT(*) FROM time_corrections WHERE status='pending'",
+    "fronta e-mailů":      "SELECT id FROM email_outbox WHERE status='pending' AND next_attempt_at<=?",
+    "log píchnutí dne":    "SELECT * FROM punch_events WHERE user_id=? AND day=? ORDER BY id",
+}
+
+
+def explain_hot_queries() -> list[dict]:
+    """EXPLAIN QUERY PLAN pro HOT_QUERIES; full_scan=True znamená chybějící index.
+
+    Hlídá to tests/test_query_plans.py; expander v administraci je jen náhled.
+    """
+    conn, result = get_conn(), []
+    for name, sql in HOT_QUERIES.items():
+        plan = [r["detail"] for r in conn.execute(
+            "EXPLAIN QUERY PLAN " + sql, (None,) * sql.count("?"))]
+        full_scan = any(d.startswith("SCAN") and "INDEX" not in d for d in plan)
+        result.append({"query": name, "plan": " · ".join(plan), "full_scan": full_scan})
+    return result
+
+
 def hash_pw(pw: str) -> str:
     return hashlib.sha256(pw.encode()).hexdigest()
 
@@ -656,6 +1464,7 @@ def authenticate(username: str, password: str):
         return dict(row)
     return None
 
+@cached_read("users")
 def get_all_users():
     with get_conn() as conn:
         return [dict(r) for r in conn.execute(
@@ -664,35 +1473,159 @@ def get_all_users():
 
 def create_user(username, password, display_name, role, color):
     try:
-        with get_conn() as conn:
-            conn.execute(
+        with db_transaction() as conn:
+            user_id = conn.execute(
                 "INSERT INTO users(username,password_hash,display_name,role,color) VALUES(?,?,?,?,?)",
                 (username, hash_pw(password), display_name, role, color)
-            )
-            conn.commit()
+            ).lastrowid
+            _ensure_leave_rows(conn, user_id, cet_today().year)
         return True, "Uživatel vytvořen."
     except sqlite3.IntegrityError:
         return False, "Uživatelské jméno již existuje."
 
 def update_user_password(user_id, new_password):
-    with get_conn() as conn:
+    with db_transaction() as conn:
         conn.execute("UPDATE users SET password_hash=? WHERE id=?", (hash_pw(new_password), user_id))
-        conn.commit()
 
 def update_user_name(user_id, new_name: str):
-    with get_conn() as conn:
+    with db_transaction() as conn:
         conn.execute("UPDATE users SET display_name=? WHERE id=?", (new_name.strip(), user_id))
-        conn.commit()
 
 def update_user_email(user_id, email: str):
-    with get_conn() as conn:
+    with db_transaction() as conn:
         conn.execute("UPDATE users SET email=? WHERE id=?", (email.strip(), user_id))
-        conn.commit()
+
+def set_user_digest(user_id, enabled: bool):
+    with db_transaction() as conn:
+        conn.execute("UPDATE users SET digest=? WHERE id=?", (int(enabled), user_id))
 
 def deactivate_user(user_id):
-    with get_conn() as conn:
+    with db_transaction() as conn:
         conn.execute("UPDATE users SET active=0 WHERE id=?", (user_id,))
-        conn.commit()
+
+# ── Auditní log ──
+class AuditWriter:
+    """Fronta auditních událostí; vlákno na pozadí je zapisuje po dávkách.
+
+    Volající jen vloží událost do fronty – zápis do DB (jedna transakce
+    na dávku až AUDIT_BATCH_SIZE událostí) neprodlužuje obsluhu tlačítka.
+    """
+
+    def __init__(self):
+        self.queue = queue.Queue()
+        self.stats = {"written": 0, "batches": 0, "errors": 0}
+
+    def put(self, event: tuple):
+        self.queue.put(event)
+
+    def _write(self, batch: list[tuple]):
+        with db_transaction() as conn:
+            conn.executemany(
+                "INSERT INTO audit_log(ts,actor,action,tbl,row_id,before,after,note)"
+                " VALUES(?,?,?,?,?,?,?,?)", batch
+            )
+        self.stats["written"] += len(batch)
+        self.stats["batches"] += 1
+
+    def loop(self):
+        import time
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + AUDIT_FLUSH_S
+            while len(batch) < AUDIT_BATCH_SIZE:
+                try:
+                    batch.append(self.queue.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            for attempt in range(3):
+                try:
+                    self._write(batch)
+                    break
+                except sqlite3.Error:
+                    self.stats["errors"] += 1
+                    time.sleep(1 + attempt)
+            for _ in batch:
+                self.queue.task_done()
+
+    def flush(self, timeout: float = 2.0) -> bool:
+        """Počká, než writer zapíše vše z fronty (např. před zobrazením auditu)."""
+        import time
+        deadline = time.monotonic() + timeout
+        while self.queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.02)
+        return not self.queue.unfinished_tasks
+
+
+@st.cache_resource
+def start_audit_writer() -> AuditWriter:
+    writer = AuditWriter()
+    threading.Thread(target=writer.loop, daemon=True).start()
+    return writer
+
+
+_audit_ctx = threading.local()
+
+
+@contextmanager
+def audit_actor(name: str):
+    """Přepíše autora auditních záznamů ve vlákně (API, úlohy na pozadí)."""
+    prev = getattr(_audit_ctx, "actor", None)
+    _audit_ctx.actor = name
+    try:
+        yield
+    finally:
+        _audit_ctx.actor = prev
+
+
+def _current_actor() -> str:
+    actor = getattr(_audit_ctx, "actor", None)
+    if actor:
+        return actor
+    try:
+        user = st.session_state.get("user")
+    except Exception:
+        user = None
+    return user["username"] if user else "system"
+
+
+def audit(tbl: str, row_id, before=None, after=None, note: str = ""):
+    """Zařadí auditní událost; akce se odvodí z before/after."""
+    before = dict(before) if before is not None else None
+    after  = dict(after)  if after  is not None else None
+    action = "insert" if before is None else "delete" if after is None else "update"
+    dump   = lambda d: json.dumps(d, ensure_ascii=False, default=str) if d is not None else None
+    start_audit_writer().put((
+        cet_now().isoformat(timespec="seconds"), _current_actor(), action,
+        tbl, row_id, dump(before), dump(after), note or None,
+    ))
+
+
+def audit_page(page: int = 0, tbl: str | None = None, actor: str | None = None,
+               row_id: int | None = None) -> tuple[list[dict], int]:
+    """Stránka auditu (nejnovější první) a celkový počet záznamů pro filtr."""
+    where, args = [], []
+    for col, val in (("tbl", tbl), ("actor", actor), ("row_id", row_id)):
+        if val is not None:
+            where.append(f"{col}=?")
+            args.append(val)
+    cond = (" WHERE " + " AND ".join(where)) if where else ""
+    conn  = get_conn()
+    total = conn.execute(f"SELECT COUNT(*) FROM audit_log{cond}", args).fetchone()[0]
+    rows  = conn.execute(
+        f"SELECT * FROM audit_log{cond} ORDER BY id DESC LIMIT ? OFFSET ?",
+        args + [AUDIT_PAGE_SIZE, page * AUDIT_PAGE_SIZE]
+    ).fetchall()
+    return [dict(r) for r in rows], total
+
+
+def audit_diff(before: str | None, after: str | None) -> str:
+    """Čitelný rozdíl before/after – jen změněná pole."""
+    b = json.loads(before) if before else {}
+    a = json.loads(after)  if after  else {}
+    if not b or not a:
+        return ", ".join(f"{k}={v}" for k, v in (a or b).items())
+    return ", ".join(f"{k}: {b.get(k)} → {a.get(k)}" for k in a if a.get(k) != b.get(k))
+
 
 # ── Attendance ──
 def get_active_attendance(user_id):
@@ -724,51 +1657,186 @@ def get_attendance(user_id, day=None):
             "SELECT * FROM attendance WHERE user_id=? AND date=?", (user_id, day)
         ).fetchone()
 
-def ensure_attendance(user_id, day=None):
-    if day is None:
-        day = today_str()
-    row = get_attendance(user_id, day)
-    if row:
-        return row["id"]
-    with get_conn() as conn:
-        cur = conn.execute(
-            "INSERT INTO attendance(user_id,date) VALUES(?,?)", (user_id, day)
+# ── Log píchnutí (punch_events) ──
+# Každý zápis do attendance/pauses připíše v téže transakci událost do
+# append-only punch_events. Událost nese druh akce a výsledné řádky (účinek),
+# takže přehrání logu je deterministické a zachová id řádků; attendance
+# a pauses jsou jen projekce, kterou replay_punch_log umí obnovit.
+_PROJ_COLS = {
+    "attendance": ("id", "user_id", "date", "checkin_time", "checkout_time"),
+    "pauses":     ("id", "attendance_id", "pause_type", "start_time", "end_time", "paid"),
+}
+
+
+def _log_punch(conn, user_id: int, day: str, kind: str, effect: dict) -> int:
+    """Připíše událost; effect = {"attendance": [řádky], "pauses": [řádky], "deleted": {...}}."""
+    data = {t: [{c: r[c] for c in _PROJ_COLS[t]} for r in effect.get(t, ())] for t in _PROJ_COLS}
+    data["deleted"] = effect.get("deleted", {})
+    return conn.execute(
+        "INSERT INTO punch_events(user_id, day, kind, ts, source, data) VALUES(?,?,?,?,?,?) RETURNING id",
+        (user_id, day, kind, cet_now().isoformat(timespec="seconds"), _current_actor(),
+         json.dumps(data, ensure_ascii=False, separators=(",", ":")))
+    ).fetchone()[0]
+
+
+def _att_key(conn, att_id: int) -> tuple[int, str] | tuple[None, None]:
+    row = conn.execute("SELECT user_id, date FROM attendance WHERE id=?", (att_id,)).fetchone()
+    return (row["user_id"], row["date"]) if row else (None, None)
+
+
+def _seed_punch_baseline(conn, source: str):
+    """Značka 'reset' a jedna událost 'baseline' na každý den docházky (stávající stav)."""
+    ts = cet_now().isoformat(timespec="seconds")
+    conn.execute(
+        "INSERT INTO punch_events(user_id, day, kind, ts, source, data) VALUES(NULL,NULL,'reset',?,?,'{}')",
+        (ts, source)
+    )
+    cols = _PROJ_COLS["pauses"]
+    pauses = {}
+    for p in conn.execute(f"SELECT {', '.join(cols)} FROM pauses ORDER BY id"):
+        pauses.setdefault(p["attendance_id"], []).append(dict(p))
+    cur = conn.execute(f"SELECT {', '.join(_PROJ_COLS['attendance'])} FROM attendance ORDER BY id")
+    while batch := cur.fetchmany(EXPORT_BATCH_ROWS):
+        conn.executemany(
+            "INSERT INTO punch_events(user_id, day, kind, ts, source, data) VALUES(?,?,'baseline',?,?,?)",
+            [(a["user_id"], a["date"], ts, source,
+              json.dumps({"attendance": [dict(a)], "pauses": pauses.get(a["id"], []), "deleted": {}},
+                         ensure_ascii=False, separators=(",", ":")))
+             for a in batch]
         )
-        conn.commit()
-        return cur.lastrowid
 
-def do_checkin(user_id):
-    active = get_active_attendance(user_id)
-    att    = get_attendance(user_id)
-    now    = now_str()
-    if active:
-        return False, "Příchod byl již zaznamenán (nejprve zaznamenejte odchod)."
-    if att and att["checkin_time"] and att["checkout_time"]:
-        # Druhý příchod v tentýž den – mezičas se stane pauzou
-        pause_start = att["checkout_time"]
-        with get_conn() as conn:
-            conn.execute("UPDATE attendance SET checkout_time=NULL WHERE id=?", (att["id"],))
-            conn.execute(
-                "INSERT INTO pauses(attendance_id,pause_type,start_time,end_time,paid)"
-                " VALUES(?,?,?,?,0)",
-                (att["id"], "přestávka (2. příchod)", pause_start, now)
+
+def _project(conn, effect: dict):
+    """Promítne účinek do attendance/pauses: nejdřív mazání, pak upsert podle id."""
+    for table in ("pauses", "attendance"):
+        ids = effect.get("deleted", {}).get(table)
+        if ids:
+            conn.executemany(f"DELETE FROM {table} WHERE id=?", [(i,) for i in ids])
+    for table in ("attendance", "pauses"):
+        rows = effect.get(table)
+        if rows:
+            cols = _PROJ_COLS[table]
+            conn.executemany(
+                f"INSERT INTO {table}({', '.join(cols)}) VALUES({', '.join('?' * len(cols))})"
+                f" ON CONFLICT(id) DO UPDATE SET " + ", ".join(f"{c}=excluded.{c}" for c in cols[1:]),
+                [tuple(r[c] for c in cols) for r in rows]
             )
-            conn.commit()
-        return True, f"Druhý příchod zaznamenán ✓ (přestávka {pause_start[11:16]}–{now[11:16]} přidána)"
-    att_id = ensure_attendance(user_id)
+
+
+def replay_punch_log(fix: bool = False, delete_extra: bool = False) -> dict:
+    """Přehraje punch_events od poslední značky 'reset' a porovná výsledek s tabulkami.
+
+    Vrátí odchylky {tabulka: {"missing", "changed", "extra"}}; výchozí je jen
+    kontrola. fix=True doplní chybějící a vrátí změněné řádky podle logu.
+    Řádky „navíc“ (starší data, import, ruční SQL bez značky 'reset') mohou
+    být skutečná docházka – smažou se jen s delete_extra=True.
+    """
+    drift = {}
+    with db_transaction(immediate=fix) as conn:
+        start = conn.execute(
+            "SELECT COALESCE(MAX(id), 0) FROM punch_events WHERE kind='reset'"
+        ).fetchone()[0]
+        state = {t: {} for t in _PROJ_COLS}
+        cur = conn.execute("SELECT data FROM punch_events WHERE id > ? ORDER BY id", (start,))
+        while batch := cur.fetchmany(EXPORT_BATCH_ROWS):
+            for (data,) in batch:
+                effect = json.loads(data)
+                for t, ids in effect.get("deleted", {}).items():
+                    for i in ids:
+                        state[t].pop(i, None)
+                for t, cols in _PROJ_COLS.items():
+                    for r in effect.get(t, ()):
+                        state[t][r["id"]] = tuple(r[c] for c in cols)
+        fixes = {"deleted": {}}
+        for t, cols in _PROJ_COLS.items():
+            current = {r[0]: tuple(r) for r in conn.execute(f"SELECT {', '.join(cols)} FROM {t}")}
+            extra   = [i for i in current if i not in state[t]]
+            upsert  = [dict(zip(cols, v)) for i, v in state[t].items() if current.get(i) != v]
+            missing = sum(1 for r in upsert if r["id"] not in current)
+            if extra or upsert:
+                drift[t] = {"missing": missing, "changed": len(upsert) - missing, "extra": len(extra)}
+            fixes["deleted"][t], fixes[t] = (extra if delete_extra else []), upsert
+        if fix and drift:
+            _project(conn, fixes)
+    return drift
+
+
+def get_punch_events(user_id: int, day: str) -> list[dict]:
     with get_conn() as conn:
-        conn.execute("UPDATE attendance SET checkin_time=? WHERE id=?", (now, att_id))
-        conn.commit()
+        return [dict(r) for r in conn.execute(
+            "SELECT id, kind, ts, source FROM punch_events WHERE user_id=? AND day=? ORDER BY id",
+            (user_id, day)
+        ).fetchall()]
+
+
+# ── Příkazy píchaček ──
+# Každá akce je jedna transakce BEGIN IMMEDIATE: souběžné volání (dvojklik,
+# souběžný rerun, terminál) počká na zámek a uvidí už zapsaný stav.
+
+# Pauza, kterou se stane mezičas mezi odchodem a druhým příchodem v tentýž den
+SECOND_CHECKIN_PAUSE = "přestávka (2. příchod)"
+
+
+def _day_rows(conn, user_id) -> tuple[dict | None, dict | None]:
+    """(otevřený záznam – dnes, jinak včera přes půlnoc; dnešní záznam) jedním dotazem."""
+    today     = today_str()
+    yesterday = (cet_today() - timedelta(days=1)).isoformat()
+    rows = [dict(r) for r in conn.execute(
+        "SELECT * FROM attendance WHERE user_id=? AND date IN (?,?) ORDER BY date DESC",
+        (user_id, today, yesterday)
+    ).fetchall()]
+    active = next((r for r in rows if r["checkin_time"] and not r["checkout_time"]), None)
+    return active, next((r for r in rows if r["date"] == today), None)
+
+def do_checkin(user_id):
+    now = now_str()
+    with db_transaction() as conn:
+        active, att = _day_rows(conn, user_id)
+        if active:
+            return False, "Příchod byl již zaznamenán (nejprve zaznamenejte odchod)."
+        if att and att["checkin_time"] and att["checkout_time"]:
+            # Druhý příchod v tentýž den – mezičas se stane pauzou
+            pause_start = att["checkout_time"]
+            reopened = conn.execute(
+                "UPDATE attendance SET checkout_time=NULL WHERE id=? RETURNING *", (att["id"],)
+            ).fetchone()
+            pause = conn.execute(
+                "INSERT INTO pauses(attendance_id,pause_type,start_time,end_time,paid)"
+                " VALUES(?,?,?,?,0) RETURNING *",
+                (att["id"], SECOND_CHECKIN_PAUSE, pause_start, now)
+            ).fetchone()
+            _log_punch(conn, user_id, att["date"], "checkin",
+                       {"attendance": [reopened], "pauses": [pause]})
+            return True, f"Druhý příchod zaznamenán ✓ (přestávka {pause_start[:5]}–{now[:5]} přidána)"
+        # UNIQUE(user_id, date): vloží den, nebo doplní příchod do prázdného záznamu
+        row = conn.execute(
+            "INSERT INTO attendance(user_id,date,checkin_time) VALUES(?,?,?)"
+            " ON CONFLICT(user_id, date) DO UPDATE SET checkin_time=excluded.checkin_time"
+            " WHERE checkin_time IS NULL RETURNING *",
+            (user_id, today_str(), now)
+        ).fetchone()
+        if not row:
+            return False, "Příchod byl již zaznamenán."
+        _log_punch(conn, user_id, row["date"], "checkin", {"attendance": [row]})
     return True, "Příchod zaznamenán ✓"
 
 def do_checkout(user_id):
-    att = get_active_attendance(user_id)
-    if not att:
-        return False, "Nejprve zaznamenejte příchod."
-    close_open_pauses(att["id"])
-    with get_conn() as conn:
-        conn.execute("UPDATE attendance SET checkout_time=? WHERE id=?", (now_str(), att["id"]))
-        conn.commit()
+    now = now_str()
+    with db_transaction() as conn:
+        att = conn.execute(
+            "UPDATE attendance SET checkout_time=? WHERE id=("
+            " SELECT id FROM attendance WHERE user_id=? AND date IN (?,?)"
+            " AND checkin_time IS NOT NULL AND checkout_time IS NULL"
+            " ORDER BY date DESC LIMIT 1) RETURNING *",
+            (now, user_id, today_str(), (cet_today() - timedelta(days=1)).isoformat())
+        ).fetchone()
+        if not att:
+            return False, "Nejprve zaznamenejte příchod."
+        closed = conn.execute(
+            "UPDATE pauses SET end_time=? WHERE attendance_id=? AND end_time IS NULL RETURNING *",
+            (now, att["id"])
+        ).fetchall()
+        _log_punch(conn, user_id, att["date"], "checkout", {"attendance": [att], "pauses": closed})
     note = " (přes půlnoc)" if att["date"] != today_str() else ""
     return True, f"Odchod zaznamenán ✓{note}"
 
@@ -779,53 +1847,76 @@ def get_pauses(att_id):
         ).fetchall()]
 
 def open_pause(att_id, pause_type, paid=False, start_override=None):
-    pauses = get_pauses(att_id)
-    for p in pauses:
-        if p["end_time"] is None:
-            return False, "Existuje nezavřená pauza."
     start = start_override or now_str()
-    with get_conn() as conn:
-        conn.execute(
-            "INSERT INTO pauses(attendance_id,pause_type,start_time,paid) VALUES(?,?,?,?)",
-            (att_id, pause_type, start, 1 if paid else 0)
-        )
-        conn.commit()
+    with db_transaction() as conn:
+        att = conn.execute(
+            "SELECT user_id, date, checkout_time FROM attendance WHERE id=?", (att_id,)
+        ).fetchone()
+        if not att or att["checkout_time"]:
+            return False, "Odchod už byl zaznamenán."
+        row = conn.execute(
+            "INSERT INTO pauses(attendance_id,pause_type,start_time,paid)"
+            " SELECT ?,?,?,? WHERE NOT EXISTS ("
+            "  SELECT 1 FROM pauses WHERE attendance_id=? AND end_time IS NULL)"
+            " RETURNING *",
+            (att_id, pause_type, start, 1 if paid else 0, att_id)
+        ).fetchone()
+        if row:
+            _log_punch(conn, att["user_id"], att["date"], "pause_start", {"pauses": [row]})
+    if not row:
+        return False, "Existuje nezavřená pauza."
     return True, f"Pauza ({pause_type}) zahájena."
 
-def close_open_pauses(att_id):
-    with get_conn() as conn:
-        conn.execute(
-            "UPDATE pauses SET end_time=? WHERE attendance_id=? AND end_time IS NULL",
-            (now_str(), att_id)
-        )
-        conn.commit()
-
 def end_pause(att_id):
-    with get_conn() as conn:
+    with db_transaction() as conn:
         row = conn.execute(
-            "SELECT id FROM pauses WHERE attendance_id=? AND end_time IS NULL", (att_id,)
+            "UPDATE pauses SET end_time=? WHERE id=("
+            " SELECT id FROM pauses WHERE attendance_id=? AND end_time IS NULL"
+            " ORDER BY start_time LIMIT 1) RETURNING *",
+            (now_str(), att_id)
         ).fetchone()
-        if not row:
-            return False, "Žádná aktivní pauza."
-        conn.execute("UPDATE pauses SET end_time=? WHERE id=?", (now_str(), row["id"]))
-        conn.commit()
+        if row:
+            _log_punch(conn, *_att_key(conn, att_id), "pause_end", {"pauses": [row]})
+    if not row:
+        return False, "Žádná aktivní pauza."
     return True, "Pauza ukončena ✓"
 
+def add_doctor_pause(user_id, day: str, pause_type: str, start: str, end: str,
+                     checkin: str | None = None, checkout: str | None = None):
+    """Placená pauza za lékaře; chybějící příchod/odchod dne doplní z checkin/checkout."""
+    with db_transaction() as conn:
+        att = conn.execute(
+            "INSERT INTO attendance(user_id,date,checkin_time,checkout_time) VALUES(?,?,?,?)"
+            " ON CONFLICT(user_id, date) DO UPDATE SET"
+            " checkin_time=COALESCE(checkin_time, excluded.checkin_time),"
+            " checkout_time=COALESCE(checkout_time, excluded.checkout_time)"
+            " RETURNING *",
+            (user_id, day, checkin, checkout)
+        ).fetchone()
+        pause = conn.execute(
+            "INSERT INTO pauses(attendance_id,pause_type,start_time,end_time,paid)"
+            " VALUES(?,?,?,?,1) RETURNING *",
+            (att["id"], pause_type, start, end)
+        ).fetchone()
+        _log_punch(conn, user_id, day, "edit", {"attendance": [att], "pauses": [pause]})
+
 # ── Absences ──
 def request_absence(user_id, absence_type, date_from, date_to, note="", half_days=None):
     hd_json = json.dumps([d.isoformat() if hasattr(d, 'isoformat') else d
                           for d in (half_days or [])])
-    with get_conn() as conn:
+    with db_transaction() as conn:
         conn.execute(
             "INSERT INTO absences(user_id,absence_type,date_from,date_to,note,half_days)"
             " VALUES(?,?,?,?,?,?)",
             (user_id, absence_type, date_from.isoformat(), date_to.isoformat(), note, hd_json)
         )
-        conn.commit()
 
 def get_absences_for_date(day=None):
-    if day is None:
-        day = today_str()
+    # Den se doplní před cache – jinak by klíč (None) přežil půlnoc
+    return _absences_for_date(day or today_str())
+
+@cached_read("absences", "users")
+def _absences_for_date(day: str):
     with get_conn() as conn:
         return [dict(r) for r in conn.execute(
             """SELECT a.*, u.display_name, u.color FROM absences a
@@ -834,6 +1925,7 @@ def get_absences_for_date(day=None):
             (day, day)
         ).fetchall()]
 
+@cached_read("absences")
 def get_user_absences(user_id):
     with get_conn() as conn:
         return [dict(r) for r in conn.execute(
@@ -842,121 +1934,233 @@ def get_user_absences(user_id):
 
 def approve_absence(absence_id: int, approve: bool, user_email: str = "", user_name: str = ""):
     val = 1 if approve else -1
-    with get_conn() as conn:
-        conn.execute("UPDATE absences SET approved=? WHERE id=?", (val, absence_id))
-        conn.commit()
-        ab = dict(conn.execute("SELECT * FROM absences WHERE id=?", (absence_id,)).fetchone())
-
-    email_sent = False
-    if approve and user_email:
-        email_sent = send_absence_email(user_email, user_name, ab)
-        if email_sent:
-            with get_conn() as conn:
-                conn.execute("UPDATE absences SET email_sent=1 WHERE id=?", (absence_id,))
-                conn.commit()
-    return email_sent
+    with db_transaction() as conn:
+        before = conn.execute("SELECT * FROM absences WHERE id=?", (absence_id,)).fetchone()
+        ab = dict(conn.execute("UPDATE absences SET approved=? WHERE id=? RETURNING *",
+                               (val, absence_id)).fetchone())
+        _refresh_leave_for_absence(conn, ab)
+        queued = False
+        if approve and user_email:
+            subject, body = render_absence_email(user_name, ab)
+            queued = bool(enqueue_email(conn, user_email, subject, body,
+                                        kind="absence_approved", ref_id=absence_id))
+    audit("absences", absence_id, before, ab)
+    if queued:
+        start_email_sender().wake()
+    return queued
 
 def delete_absence(absence_id):
-    with get_conn() as conn:
-        conn.execute("DELETE FROM absences WHERE id=?", (absence_id,))
-        conn.commit()
+    with db_transaction() as conn:
+        row = conn.execute(
+            "DELETE FROM absences WHERE id=? RETURNING *", (absence_id,)
+        ).fetchone()
+        if row:
+            _refresh_leave_for_absence(conn, dict(row))
+    if row:
+        audit("absences", absence_id, row, None)
+
+def add_approved_absence(user_id, absence_type, date_from, date_to, note="", half_days=None):
+    """Absence zadaná administrátorem – rovnou schválená, ledger v téže transakci."""
+    hd_json = json.dumps([d.isoformat() if hasattr(d, 'isoformat') else d
+                          for d in (half_days or [])])
+    with db_transaction() as conn:
+        row = conn.execute(
+            "INSERT INTO absences(user_id,absence_type,date_from,date_to,note,approved,email_sent,half_days)"
+            " VALUES(?,?,?,?,?,1,0,?) RETURNING *",
+            (user_id, absence_type, date_from.isoformat(), date_to.isoformat(), note, hd_json)
+        ).fetchone()
+        _refresh_leave_for_absence(conn, dict(row))
+    audit("absences", row["id"], None, row)
 
 # ── Time corrections ──
 def update_nemoc_end(absence_id: int, date_to):
     """Doplní konec nemoci do existujícího záznamu."""
-    with get_conn() as conn:
+    with db_transaction() as conn:
+        before = conn.execute(
+            "SELECT user_id, date_from, date_to FROM absences WHERE id=? AND absence_type='nemoc'",
+            (absence_id,)
+        ).fetchone()
         conn.execute(
             "UPDATE absences SET date_to=? WHERE id=? AND absence_type='nemoc'",
             (date_to.isoformat(), absence_id)
         )
-        conn.commit()
+        if before:
+            # Roky před i po změně – konec mohl přejít přes Silvestra
+            _refresh_leave_for_absence(conn, {**dict(before), "date_to": max(
+                before["date_to"], date_to.isoformat())})
 
 
 # ── Fondy dovolené / sickday ─────────────────────────────────────
+LEAVE_FUND_DEFAULTS = {"vacation_days": 20, "vacation_carry": 0, "sickday_days": 5}
+
+
+def _ensure_leave_rows(conn, user_id: int, year: int):
+    """Založí chybějící fond a řádek ledgeru; volá se uvnitř zápisové transakce."""
+    conn.execute(
+        "INSERT OR IGNORE INTO leave_funds(user_id,year,vacation_days,vacation_carry,sickday_days)"
+        " VALUES(:user_id,:year,:vacation_days,:vacation_carry,:sickday_days)",
+        {"user_id": user_id, "year": year, **LEAVE_FUND_DEFAULTS}
+    )
+    if not conn.execute("SELECT 1 FROM leave_balances WHERE user_id=? AND year=?",
+                        (user_id, year)).fetchone():
+        _refresh_leave_balance(conn, user_id, year)
+
+
 def ensure_leave_fund(user_id: int, year: int) -> dict:
-    """Vrátí (nebo vytvoří) fond pro uživatele+rok."""
-    with get_conn() as conn:
-        row = conn.execute(
+    """Vrátí (nebo vytvoří) fond pro uživatele+rok – jen pro zápisové cesty."""
+    with db_transaction() as conn:
+        _ensure_leave_rows(conn, user_id, year)
+        return dict(conn.execute(
             "SELECT * FROM leave_funds WHERE user_id=? AND year=?", (user_id, year)
-        ).fetchone()
-        if row:
-            return dict(row)
-        conn.execute(
-            "INSERT INTO leave_funds(user_id,year,vacation_days,vacation_carry,sickday_days)"
-            " VALUES(?,?,20,0,5)",
-            (user_id, year)
-        )
-        conn.commit()
-        return {"user_id": user_id, "year": year,
-                "vacation_days": 20, "vacation_carry": 0, "sickday_days": 5}
+        ).fetchone())
 
 
 def get_leave_fund(user_id: int, year: int) -> dict:
-    return ensure_leave_fund(user_id, year)
+    """Fond pro uživatele+rok jen pro čtení; chybějící řádek = výchozí hodnoty."""
+    with get_conn() as conn:
+        row = conn.execute(
+            "SELECT * FROM leave_funds WHERE user_id=? AND year=?", (user_id, year)
+        ).fetchone()
+    return dict(row) if row else {"user_id": user_id, "year": year, **LEAVE_FUND_DEFAULTS}
 
 
 def update_leave_fund(user_id: int, year: int,
                       vacation_days: int = None,
                       vacation_carry: int = None,
                       sickday_days: int = None):
-    fund = ensure_leave_fund(user_id, year)
-    vd = vacation_days  if vacation_days  is not None else fund["vacation_days"]
-    vc = vacation_carry if vacation_carry is not None else fund["vacation_carry"]
-    sd = sickday_days   if sickday_days   is not None else fund["sickday_days"]
-    with get_conn() as conn:
+    with db_transaction() as conn:
+        fund = ensure_leave_fund(user_id, year)
+        vd = vacation_days  if vacation_days  is not None else fund["vacation_days"]
+        vc = vacation_carry if vacation_carry is not None else fund["vacation_carry"]
+        sd = sickday_days   if sickday_days   is not None else fund["sickday_days"]
         conn.execute(
             "UPDATE leave_funds SET vacation_days=?, vacation_carry=?, sickday_days=?"
             " WHERE user_id=? AND year=?",
             (vd, vc, sd, user_id, year)
         )
-        conn.commit()
 
 
-def get_used_vacation(user_id: int, year: int) -> float:
-    """Čerpáno dní dovolené v roce (vacation_half = 0.5)."""
-    first = date(year, 1, 1)
-    last  = date(year, 12, 31)
-    with get_conn() as conn:
-        rows = conn.execute(
-            """SELECT absence_type, date_from, date_to FROM absences
-               WHERE user_id=? AND approved=1
-               AND absence_type IN ('vacation','vacation_half')
-               AND date_from >= ? AND date_to <= ?""",
-            (user_id, first.isoformat(), last.isoformat())
-        ).fetchall()
-    total = 0.0
+def _leave_usage(conn, user_id: int, year: int) -> tuple:
+    """Čerpání (dovolená, sickday) v roce přepočtené od nuly z absencí."""
+    rows = conn.execute(
+        """SELECT absence_type, date_from, date_to FROM absences
+           WHERE user_id=? AND approved=1
+           AND absence_type IN ('vacation','vacation_half','sickday')
+           AND date_from >= ? AND date_to <= ?""",
+        (user_id, date(year, 1, 1).isoformat(), date(year, 12, 31).isoformat())
+    ).fetchall()
+    vac, sick = 0.0, 0
     for r in rows:
         if r["absence_type"] == "vacation_half":
-            total += 0.5
+            vac += 0.5
+            continue
+        days = count_workdays_in_range(date.fromisoformat(r["date_from"]),
+                                       date.fromisoformat(r["date_to"]))
+        if r["absence_type"] == "vacation":
+            vac += days
         else:
-            af = date.fromisoformat(r["date_from"])
-            at = date.fromisoformat(r["date_to"])
-            total += count_workdays_in_range(af, at)
-    return total
+            sick += days
+    return vac, sick
+
+
+def get_used_vacation(user_id: int, year: int) -> float:
+    """Čerpáno dní dovolené v roce (vacation_half = 0.5) – přepočet od nuly."""
+    with get_conn() as conn:
+        return _leave_usage(conn, user_id, year)[0]
 
 
 def get_used_sickdays(user_id: int, year: int) -> int:
-    """Čerpáno sickday dní v roce."""
+    """Čerpáno sickday dní v roce – přepočet od nuly."""
     with get_conn() as conn:
-        rows = conn.execute(
-            """SELECT date_from, date_to FROM absences
-               WHERE user_id=? AND approved=1 AND absence_type='sickday'
-               AND date_from >= ? AND date_to <= ?""",
-            (user_id, date(year, 1, 1).isoformat(), date(year, 12, 31).isoformat())
-        ).fetchall()
-    total = 0
-    for r in rows:
-        af = date.fromisoformat(r["date_from"])
-        at = date.fromisoformat(r["date_to"])
-        total += count_workdays_in_range(af, at)
-    return total
+        return _leave_usage(conn, user_id, year)[1]
+
+
+# ── Ledger čerpání (leave_balances) ──
+def _refresh_leave_balance(conn, user_id: int, year: int) -> tuple:
+    """Přepočítá jeden řádek ledgeru; volá se uvnitř zápisové transakce."""
+    vac, sick = _leave_usage(conn, user_id, year)
+    _store_leave_balance(conn, user_id, year, vac, sick)
+    return vac, sick
+
+
+def _store_leave_balance(conn, user_id: int, year: int, vac: float, sick: int):
+    conn.execute(
+        """INSERT INTO leave_balances(user_id,year,vacation_used,sickday_used,updated_at)
+           VALUES(?,?,?,?,?)
+           ON CONFLICT(user_id, year) DO UPDATE SET
+             vacation_used=excluded.vacation_used,
+             sickday_used=excluded.sickday_used,
+             updated_at=excluded.updated_at""",
+        (user_id, year, vac, sick, cet_now().isoformat(timespec="seconds"))
+    )
+
 
+def _refresh_leave_for_absence(conn, ab: dict):
+    """Přepočítá roky, do kterých absence zasahuje – jen ty se mohly změnit."""
+    for year in range(int(ab["date_from"][:4]), int(ab["date_to"][:4]) + 1):
+        _refresh_leave_balance(conn, ab["user_id"], year)
 
+
+def get_leave_balance(user_id: int, year: int) -> tuple:
+    """(čerpaná dovolená, čerpané sickday) z ledgeru; chybějící řádek se jen dopočítá.
+
+    Nic nezapisuje – řádky zakládá create_user a rebuild_leave_ledger, takže
+    se dá volat i z cached_read helperů.
+    """
+    with get_conn() as conn:
+        row = conn.execute(
+            "SELECT vacation_used, sickday_used FROM leave_balances WHERE user_id=? AND year=?",
+            (user_id, year)
+        ).fetchone()
+        if row:
+            return row["vacation_used"], row["sickday_used"]
+        return _leave_usage(conn, user_id, year)
+
+
+def rebuild_leave_ledger(fix: bool = True) -> list:
+    """Přepočítá celý ledger od nuly a vrátí seznam odchylek (drift).
+
+    Aktivním uživatelům patří i řádek na letošní rok; s fix=True se založí
+    chybějící fondy, aby čtecí helpery nemusely nic zapisovat.
+    """
+    drift = []
+    with db_transaction() as conn:
+        if fix:
+            conn.execute(
+                "INSERT OR IGNORE INTO leave_funds(user_id,year,vacation_days,vacation_carry,sickday_days)"
+                " SELECT id, :year, :vacation_days, :vacation_carry, :sickday_days FROM users WHERE active=1",
+                {"year": cet_today().year, **LEAVE_FUND_DEFAULTS}
+            )
+        keys = conn.execute(
+            """SELECT user_id, CAST(substr(date_from,1,4) AS INTEGER) AS year FROM absences
+                WHERE approved=1 AND absence_type IN ('vacation','vacation_half','sickday')
+               UNION
+               SELECT user_id, year FROM leave_balances
+               UNION
+               SELECT id, ? FROM users WHERE active=1""",
+            (cet_today().year,)
+        ).fetchall()
+        stored = {(r["user_id"], r["year"]): (r["vacation_used"], r["sickday_used"])
+                  for r in conn.execute("SELECT * FROM leave_balances")}
+        for k in keys:
+            uid, year = k["user_id"], k["year"]
+            vac, sick = _leave_usage(conn, uid, year)
+            old = stored.get((uid, year))
+            if old is None or abs(old[0] - vac) > 1e-9 or old[1] != sick:
+                # Zapisuje se jen odchylka – beze změny se nezvedá verze dat
+                if fix:
+                    _store_leave_balance(conn, uid, year, vac, sick)
+                drift.append({"user_id": uid, "year": year,
+                              "vacation_ledger": old[0] if old else None, "vacation_actual": vac,
+                              "sickday_ledger":  old[1] if old else None, "sickday_actual":  sick})
+    return drift
+
+
+@cached_read("leave_funds", "leave_balances")
 def leave_summary(user_id: int, year: int) -> dict:
     """Kompletní přehled fondů a čerpání pro uživatele+rok."""
-    fund      = ensure_leave_fund(user_id, year)
-    used_vac  = get_used_vacation(user_id, year)
-    used_sick = get_used_sickdays(user_id, year)
+    fund      = get_leave_fund(user_id, year)
+    used_vac, used_sick = get_leave_balance(user_id, year)
     total_vac = fund["vacation_days"] + fund["vacation_carry"]
     return {
         "vacation_total":  total_vac,
@@ -972,7 +2176,7 @@ def leave_summary(user_id: int, year: int) -> dict:
 
 def request_correction(user_id, d, orig_in, orig_out, orig_bs, orig_be,
                         req_in, req_out, req_bs, req_be, reason):
-    with get_conn() as conn:
+    with db_transaction() as conn:
         conn.execute(
             """INSERT INTO time_corrections
                (user_id,date,orig_in,orig_out,orig_break_start,orig_break_end,
@@ -981,7 +2185,6 @@ def request_correction(user_id, d, orig_in, orig_out, orig_bs, orig_be,
             (user_id, d, orig_in, orig_out, orig_bs, orig_be,
              req_in, req_out, req_bs, req_be, reason, cet_now().isoformat())
         )
-        conn.commit()
 
 def get_user_corrections(user_id):
     with get_conn() as conn:
@@ -990,15 +2193,25 @@ def get_user_corrections(user_id):
         ).fetchall()]
 
 def get_pending_counts() -> dict:
-    """Vrátí počty čekajících schválení pro notifikační odznak."""
-    with get_conn() as conn:
-        abs_cnt = conn.execute(
-            "SELECT COUNT(*) FROM absences WHERE approved=0"
-        ).fetchone()[0]
-        cor_cnt = conn.execute(
-            "SELECT COUNT(*) FROM time_corrections WHERE status='pending'"
-        ).fetchone()[0]
-    return {"absences": abs_cnt, "corrections": cor_cnt, "total": abs_cnt + cor_cnt}
+    """Vrátí počty čekajících schválení pro notifikační odznak (O(1) z pending_counters)."""
+    counts = {name: 0 for name in _PENDING_SOURCES}
+    counts.update(get_conn().execute("SELECT name, n FROM pending_counters").fetchall())
+    return {**counts, "total": sum(counts.values())}
+
+
+def reconcile_pending_counters() -> dict:
+    """Přepočítá čítače COUNT(*) dotazem; vrátí odchylky {název: (čítač, skutečnost)}."""
+    drift = {}
+    with db_transaction() as conn:
+        stored = dict(conn.execute("SELECT name, n FROM pending_counters").fetchall())
+        for name, (table, cond) in _PENDING_SOURCES.items():
+            actual = conn.execute(
+                f"SELECT COUNT(*) FROM {table} WHERE {cond.format(r=table)}").fetchone()[0]
+            if stored.get(name) != actual:
+                drift[name] = (stored.get(name), actual)
+                conn.execute("INSERT OR REPLACE INTO pending_counters(name, n) VALUES(?,?)",
+                             (name, actual))
+    return drift
 
 
 def get_pending_corrections():
@@ -1011,15 +2224,16 @@ def get_pending_corrections():
 
 def resolve_correction(correction_id: int, approve: bool, admin_note: str = ""):
     status = "approved" if approve else "rejected"
-    with get_conn() as conn:
+    with db_transaction() as conn:
         conn.execute(
             "UPDATE time_corrections SET status=?, admin_note=? WHERE id=?",
             (status, admin_note, correction_id)
         )
-        conn.commit()
 
 # ── E-mail ──
-def send_absence_email(to_email: str, to_name: str, absence: dict) -> bool:
+# Zprávy se jen zařadí do email_outbox (v transakci volajícího); odesílá je
+# EmailSender na pozadí po dávkách přes jedno SMTP spojení.
+def render_absence_email(to_name: str, absence: dict) -> tuple[str, str]:
     type_cz = {"vacation": "Dovolená", "vacation_half": "Dovolená (půlden)", "nemoc": "Nemoc / PN", "sickday": "Sickday"}.get(absence["absence_type"], "Absence")
     date_str = absence["date_from"] if absence["date_from"] == absence["date_to"] \
                else f"{absence['date_from']} – {absence['date_to']}"
@@ -1033,28 +2247,198 @@ def send_absence_email(to_email: str, to_name: str, absence: dict) -> bool:
             f"S pozdravem,\n"
             f"Docházkový systém – Exekutorský úřad Praha 4\n"
             f"urad@eupraha.cz | +420 241 434 045")
+    return subject, body
+
+
+def enqueue_email(conn, to_addr: str, subject: str, body: str,
+                  kind: str = "", ref_id: int | None = None) -> int:
+    """Zařadí e-mail do fronty v transakci volajícího; vrátí id zprávy."""
+    now = cet_now().isoformat(timespec="seconds")
+    return conn.execute(
+        "INSERT INTO email_outbox(created_at,to_addr,subject,body,kind,ref_id,next_attempt_at)"
+        " VALUES(?,?,?,?,?,?,?) RETURNING id",
+        (now, to_addr, subject, body, kind, ref_id, now)
+    ).fetchone()[0]
+
+
+def _smtp_connect() -> smtplib.SMTP:
+    s = smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=30)
+    s.starttls()
+    if SMTP_USER:
+        s.login(SMTP_USER, SMTP_PASSWORD)
+    return s
+
+
+def _utc_iso(dt: datetime) -> str:
+    """ISO čas v UTC – řetězce jde porovnávat i přes změnu letního času."""
+    return dt.astimezone(timezone.utc).isoformat(timespec="seconds")
+
+
+def _mime_message(msg: dict) -> str:
+    mime = MIMEMultipart()
+    mime["From"]    = EMAIL_FROM
+    mime["To"]      = msg["to_addr"]
+    mime["Subject"] = msg["subject"]
+    mime.attach(MIMEText(msg["body"], "plain", "utf-8"))
+    return mime.as_string()
+
+
+class EmailSender:
+    """Odesílá frontu email_outbox na pozadí.
+
+    Jedna dávka = jedno SMTP spojení (STARTTLS + login jen jednou). Neúspěšné
+    zprávy se vrací do fronty s exponenciálním odstupem, po EMAIL_MAX_ATTEMPTS
+    pokusech zůstanou jako 'failed'. Převzatá dávka nese claimed_by/claimed_at,
+    recover() vrací do fronty jen dávky s prošlou lhůtou EMAIL_CLAIM_LEASE_S
+    (sender jiného procesu je mohl právě odesílat). smtp_factory jde v testu nahradit stubem
+    nebo lokálním serverem (aiosmtpd); bez něj a s EMAIL_ENABLED = False se
+    zprávy jen označí jako 'simulated'.
+    """
+
+    def __init__(self, smtp_factory=None, enabled: bool | None = None):
+        self.smtp_factory = smtp_factory or _smtp_connect
+        self.enabled = (EMAIL_ENABLED or smtp_factory is not None) if enabled is None else enabled
+        self.wakeup = threading.Event()
+        self.stats = {"sent": 0, "failed": 0, "batches": 0, "errors": 0}
+        self.owner = f"{os.getpid()}:{id(self):x}"
+        self._pruned = None
+
+    def wake(self):
+        """Probudí sender hned po zařazení zprávy (jinak čeká EMAIL_POLL_S)."""
+        self.wakeup.set()
+
+    def recover(self, now: datetime | None = None) -> int:
+        """Dávky s prošlou lhůtou (sender spadl) vrátí do fronty; vrátí počet zpráv.
+
+        claimed_at je v UTC – místní čas s posunem CET/CEST by se při
+        změně času porovnával jako řetězec o hodinu vedle.
+        """
+        now    = (now or cet_now()).astimezone(timezone.utc)   # odečítat až v UTC, ne v místním čase
+        cutoff = _utc_iso(now - timedelta(seconds=EMAIL_CLAIM_LEASE_S))
+        with db_transaction() as conn:
+            return conn.execute(
+                "UPDATE email_outbox SET status='pending', claimed_by=NULL"
+                " WHERE status='sending' AND COALESCE(claimed_at, '') < ?", (cutoff,)
+            ).rowcount
+
+    def _claim(self) -> list[dict]:
+        now = cet_now()
+        with db_transaction() as conn:
+            rows = conn.execute(
+                "UPDATE email_outbox SET status='sending', attempts=attempts+1,"
+                " claimed_at=?, claimed_by=?"
+                " WHERE id IN (SELECT id FROM email_outbox"
+                "  WHERE status='pending' AND next_attempt_at<=? ORDER BY id LIMIT ?)"
+                " RETURNING *", (_utc_iso(now), self.owner,
+                                 now.isoformat(timespec="seconds"), EMAIL_BATCH_SIZE)
+            ).fetchall()
+        return sorted((dict(r) for r in rows), key=lambda m: m["id"])
+
+    def _deliver(self, batch: list[dict]) -> list[tuple[dict, str | None]]:
+        """Odešle dávku přes jedno spojení; vrátí (zpráva, chyba nebo None)."""
+        if not self.enabled:
+            return [(m, None) for m in batch]
+        results, smtp = [], None
+        sender = parseaddr(EMAIL_FROM)[1]
+        try:
+            smtp = self.smtp_factory()
+            for m in batch:
+                try:
+                    smtp.sendmail(sender, [m["to_addr"]], _mime_message(m))
+                    results.append((m, None))
+                except (smtplib.SMTPRecipientsRefused, smtplib.SMTPResponseException) as e:
+                    # odmítnutá zpráva – spojení zůstává použitelné
+                    results.append((m, f"{type(e).__name__}: {e}"))
+        except Exception as e:
+            # spojení selhalo – zbytek dávky zkusíme později
+            done = {m["id"] for m, _ in results}
+            results += [(m, f"{type(e).__name__}: {e}") for m in batch if m["id"] not in done]
+        finally:
+            if smtp is not None:
+                try:
+                    smtp.quit()
+                except Exception:
+                    pass
+        return results
+
+    def _finish(self, results: list[tuple[dict, str | None]]):
+        now = cet_now()
+        ok_status = "sent" if self.enabled else "simulated"
+        with db_transaction() as conn:
+            for m, err in results:
+                # Dávku mezitím převzal jiný sender (prošlá lhůta) – výsledek patří jemu
+                if not conn.execute("SELECT 1 FROM email_outbox WHERE id=? AND status='sending'"
+                                    " AND claimed_by=?", (m["id"], self.owner)).fetchone():
+                    continue
+                if err is None:
+                    conn.execute(
+                        "UPDATE email_outbox SET status=?, sent_at=?, last_error=NULL WHERE id=?",
+                        (ok_status, now.isoformat(timespec="seconds"), m["id"])
+                    )
+                    if m["kind"] == "absence_approved" and m["ref_id"]:
+                        conn.execute("UPDATE absences SET email_sent=1 WHERE id=? AND email_sent=0",
+                                     (m["ref_id"],))
+                    self.stats["sent"] += 1
+                else:
+                    delay = min(3600, EMAIL_RETRY_BASE_S * 2 ** (m["attempts"] - 1))
+                    final = m["attempts"] >= EMAIL_MAX_ATTEMPTS
+                    conn.execute(
+                        "UPDATE email_outbox SET status=?, last_error=?, next_attempt_at=? WHERE id=?",
+                        ("failed" if final else "pending", err[:500],
+                         (now + timedelta(seconds=delay)).isoformat(timespec="seconds"), m["id"])
+                    )
+                    self.stats["failed"] += final
+
+    def send_batch(self) -> int:
+        """Zpracuje jednu dávku splatných zpráv; vrátí jejich počet."""
+        batch = self._claim()
+        if batch:
+            self._finish(self._deliver(batch))
+            self.stats["batches"] += 1
+        return len(batch)
+
+    def prune(self):
+        cutoff = (cet_now() - timedelta(days=EMAIL_KEEP_DAYS)).isoformat(timespec="seconds")
+        with db_transaction() as conn:
+            conn.execute("DELETE FROM email_outbox WHERE status IN ('sent','simulated')"
+                         " AND sent_at < ?", (cutoff,))
+        self._pruned = today_str()
+
+    def loop(self):
+        while True:
+            try:
+                while self.send_batch() == EMAIL_BATCH_SIZE:
+                    pass
+                if self._pruned != today_str():
+                    self.recover()
+                    self.prune()
+            except Exception as e:
+                self.stats["errors"] += 1
+                self.stats["error"] = str(e)
+            self.wakeup.wait(EMAIL_POLL_S)
+            self.wakeup.clear()
 
-    if not EMAIL_ENABLED:
-        # Simulace – uložíme do session_state pro zobrazení
-        st.session_state.setdefault("email_log", []).append({
-            "to": to_email, "subject": subject, "body": body
-        })
-        return True  # považujeme za "odesláno" (simulace)
 
-    try:
-        msg = MIMEMultipart()
-        msg["From"]    = EMAIL_FROM
-        msg["To"]      = to_email
-        msg["Subject"] = subject
-        msg.attach(MIMEText(body, "plain", "utf-8"))
-        with smtplib.SMTP(SMTP_HOST, SMTP_PORT) as s:
-            s.starttls()
-            s.login(SMTP_USER, SMTP_PASSWORD)
-            s.sendmail(EMAIL_FROM, to_email, msg.as_string())
-        return True
-    except Exception as e:
-        st.warning(f"Email se nepodařilo odeslat: {e}")
-        return False
+@st.cache_resource
+def start_email_sender() -> EmailSender:
+    sender = EmailSender()
+    sender.recover()
+    threading.Thread(target=sender.loop, daemon=True).start()
+    return sender
+
+
+def outbox_status() -> dict:
+    with get_conn() as conn:
+        return dict(conn.execute(
+            "SELECT status, COUNT(*) FROM email_outbox GROUP BY status"
+        ).fetchall())
+
+
+def recent_outbox(limit: int = EMAIL_LOG_ROWS) -> list[dict]:
+    with get_conn() as conn:
+        return [dict(r) for r in conn.execute(
+            "SELECT * FROM email_outbox ORDER BY id DESC LIMIT ?", (limit,)
+        ).fetchall()]
 
 # ── Time helpers ──
 def time_to_seconds(t_str: str) -> int:
@@ -1092,63 +2476,214 @@ def calc_worked_seconds(att, pauses):
         total -= dur
     return max(0, total)
 
+def times_to_seconds(values) -> np.ndarray:
+    """Vektorová obdoba time_to_seconds pro pole časů (None / "" → 0)."""
+    t = pd.Series(values, dtype="object").fillna("").astype(str).str.strip()
+    t = t.str.split(" ", n=1).str[-1]            # "2026-02-28 09:30:00" -> "09:30:00"
+    parts = t.str.split(":", expand=True).reindex(columns=range(3))
+    hms = parts.apply(pd.to_numeric, errors="coerce").fillna(0).astype(np.int64)
+    return (hms[0] * 3600 + hms[1] * 60 + hms[2]).to_numpy(dtype=np.int64)
+
+def calc_worked_seconds_vec(checkin, checkout, pause_att_idx, pause_start,
+                            pause_end, pause_paid, now: str | None = None) -> np.ndarray:
+    """Vektorová calc_worked_seconds přes celé pole záznamů docházky.
+
+    checkin/checkout jsou pole délky n, pauzy jsou plochá pole, kde
+    pause_att_idx[i] je index (0..n-1) záznamu, ke kterému pauza patří.
+    Semantika (přes půlnoc, placené pauzy, běžící čas) odpovídá
+    calc_worked_seconds, která zůstává referenční implementací.
+    """
+    now = now or now_str()
+    ci_raw = pd.Series(checkin, dtype="object")
+    co_raw = pd.Series(checkout, dtype="object")
+    has_ci = (ci_raw.notna() & (ci_raw != "")).to_numpy()
+    co_raw = co_raw.where(co_raw.notna() & (co_raw != ""), now)
+    ci, co = times_to_seconds(ci_raw), times_to_seconds(co_raw)
+    total = co - ci
+    total = np.where(total < 0, total + 86400, total)
+    if len(pause_att_idx):
+        pe_raw = pd.Series(pause_end, dtype="object")
+        pe_raw = pe_raw.where(pe_raw.notna() & (pe_raw != ""), now)
+        ps, pe = times_to_seconds(pause_start), times_to_seconds(pe_raw)
+        dur = pe - ps
+        dur = np.where(dur < 0, dur + 86400, dur)
+        dur = np.where(pd.Series(pause_paid, dtype="object").fillna(0).astype(bool).to_numpy(), 0, dur)
+        total = total - np.bincount(np.asarray(pause_att_idx, dtype=np.int64),
+                                    weights=dur, minlength=len(total)).astype(np.int64)
+    return np.maximum(np.where(has_ci, total, 0), 0)
+
 def is_weekend(day_str: str) -> bool:
     return date.fromisoformat(day_str).weekday() >= 5
 
+def month_bounds(year: int, month: int) -> tuple[date, date]:
+    """První a poslední den měsíce (pro indexovatelné `date BETWEEN ? AND ?`)."""
+    first = date(year, month, 1)
+    last  = (date(year, month + 1, 1) - timedelta(days=1)) if month < 12 else date(year, 12, 31)
+    return first, last
+
 def get_month_stats(user_id, year: int, month: int):
-    with get_conn() as conn:
-        rows = conn.execute(
-            "SELECT * FROM attendance WHERE user_id=? AND strftime('%Y',date)=? AND strftime('%m',date)=?",
-            (user_id, str(year), f"{month:02d}")
-        ).fetchall()
+    data = load_month_data([user_id], year, month)
+    return month_stats_from_data(data, user_id)
+
+def month_stats_from_data(data: dict, user_id) -> list[dict]:
+    """Denní statistiky uživatele z výsledku load_month_data (bez dalších dotazů)."""
     results = []
-    for row in rows:
-        att = dict(row)
-        pauses = get_pauses(att["id"])
-        worked = calc_worked_seconds(att, pauses) if att["checkin_time"] else 0
+    for att in data["attendance"].get(user_id, []):
         results.append({
             "date": att["date"], "checkin": att["checkin_time"] or "",
             "checkout": att["checkout_time"] or "",
-            "worked_seconds": worked, "is_weekend": is_weekend(att["date"]),
+            "worked_seconds": att["worked_seconds"], "is_weekend": is_weekend(att["date"]),
         })
     return results
 
-def czech_holidays(year: int) -> set:
-    """Státní svátky ČR pro daný rok."""
-    a = year % 19
-    b, c = divmod(year, 100)
-    d2, e = divmod(b, 4)
-    f = (b + 8) // 25
-    g = (b - f + 1) // 3
-    h = (19 * a + b - d2 - g + 15) % 30
-    i, k = divmod(c, 4)
-    l = (32 + 2 * e + 2 * i - h - k) % 7
-    m = (a + 11 * h + 22 * l) // 451
-    month_, day_ = divmod(114 + h + l - 7 * m, 31)
-    easter_monday = date(year, month_, day_ + 1) + timedelta(days=1)
-    return {
-        date(year, 1, 1),    # Nový rok
-        easter_monday,        # Velikonoční pondělí
-        date(year, 5, 1),    # Svátek práce
-        date(year, 5, 8),    # Den vítězství
-        date(year, 7, 5),    # Cyril a Metoděj
-        date(year, 7, 6),    # Mistr Jan Hus
-        date(year, 9, 28),   # Den české státnosti
-        date(year, 10, 28),  # Vznik ČSR
-        date(year, 11, 17),  # Den boje za svobodu a demokracii
-        date(year, 12, 24),  # Štědrý den
-        date(year, 12, 25),  # 1. svátek vánoční
-        date(year, 12, 26),  # 2. svátek vánoční
-    }
+def easter_sunday(year: int) -> date:
+    """Velikonoční neděle (gregoriánský výpočet)."""
+    a = year % 19
+    b, c = divmod(year, 100)
+    d2, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d2 - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month_, day_ = divmod(114 + h + l - 7 * m, 31)
+    return date(year, month_, day_ + 1)
+
+
+# Pevné státní svátky ČR (měsíc, den) → název
+_FIXED_HOLIDAYS = {
+    (1, 1):   "Nový rok",
+    (5, 1):   "Svátek práce",
+    (5, 8):   "Den vítězství",
+    (7, 5):   "Cyril a Metoděj",
+    (7, 6):   "Mistr Jan Hus",
+    (9, 28):  "Den české státnosti",
+    (10, 28): "Vznik ČSR",
+    (11, 17): "Den boje za svobodu a demokracii",
+    (12, 24): "Štědrý den",
+    (12, 25): "1. svátek vánoční",
+    (12, 26): "2. svátek vánoční",
+}
+
+
+class HolidayCalendar:
+    """Svátky s názvy, předpočítané jednou pro každý rok.
+
+    Obsahuje státní svátky ČR včetně Velkého pátku (od 2016) a Velikonočního
+    pondělí a firemní dny volna z COMPANY_DAYS_OFF.
+    """
+
+    def __init__(self, company_days: dict | None = None):
+        self._years = {}
+        self._company = {date.fromisoformat(k): v for k, v in (company_days or {}).items()}
+
+    def year(self, year: int) -> dict:
+        """{date: název} pro celý rok."""
+        hols = self._years.get(year)
+        if hols is None:
+            hols = {date(year, m, d): name for (m, d), name in _FIXED_HOLIDAYS.items()}
+            easter = easter_sunday(year)
+            if year >= 2016:
+                hols[easter - timedelta(days=2)] = "Velký pátek"
+            hols[easter + timedelta(days=1)] = "Velikonoční pondělí"
+            hols.update({d: n for d, n in self._company.items() if d.year == year})
+            self._years[year] = hols
+        return hols
+
+    def is_holiday(self, d: date) -> bool:
+        return d in self.year(d.year)
+
+    def name(self, d: date) -> str:
+        return self.year(d.year).get(d, "")
+
+    def for_month(self, year: int, month: int) -> list[tuple[date, str]]:
+        """Seřazené (datum, název) svátků v měsíci."""
+        return sorted((d, n) for d, n in self.year(year).items() if d.month == month)
+
+
+@st.cache_resource
+def get_holiday_calendar() -> HolidayCalendar:
+    return HolidayCalendar(COMPANY_DAYS_OFF)
+
+
+def czech_holidays(year: int) -> set:
+    """Státní svátky ČR (a firemní volna) pro daný rok."""
+    return set(get_holiday_calendar().year(year))
+
+
+class WorkdayIndex:
+    """Předpočítaný kalendář: příznak pracovního dne a kumulativní součet pro každé datum.
+
+    Počet pracovních dní v libovolném rozsahu uvnitř indexu je rozdíl dvou
+    prvků pole cum – O(1) bez procházení dnů.
+    """
+
+    def __init__(self, first_year: int, last_year: int):
+        self.start = date(first_year, 1, 1)
+        self.end   = date(last_year, 12, 31)
+        flags = []
+        for year in range(first_year, last_year + 1):
+            hols = get_holiday_calendar().year(year)
+            d = date(year, 1, 1)
+            while d.year == year:
+                flags.append(d.weekday() < 5 and d not in hols)
+                d += timedelta(days=1)
+        self.is_work = np.array(flags, dtype=bool)
+        # cum[i] = počet pracovních dní PŘED dnem start + i
+        self.cum = np.concatenate(([0], np.cumsum(self.is_work, dtype=np.int64)))
+
+    def covers(self, d: date) -> bool:
+        return self.start <= d <= self.end
+
+    def is_workday(self, d: date) -> bool:
+        return bool(self.is_work[(d - self.start).days])
+
+    def count(self, d_from: date, d_to: date) -> int:
+        if d_to < d_from:
+            return 0
+        i, j = (d_from - self.start).days, (d_to - self.start).days
+        return int(self.cum[j + 1] - self.cum[i])
+
+    def rows(self):
+        """(date, is_workday, cum_workdays) pro tabulku workday_calendar."""
+        for i, flag in enumerate(self.is_work):
+            yield ((self.start + timedelta(days=i)).isoformat(), int(flag), int(self.cum[i + 1]))
+
+
+@st.cache_resource
+def get_workday_index() -> WorkdayIndex:
+    year = cet_today().year
+    return WorkdayIndex(year - WORKDAY_INDEX_YEARS[0], year + WORKDAY_INDEX_YEARS[1])
+
+
+def sync_workday_table() -> int:
+    """Přepíše tabulku workday_calendar podle indexu; vrátí počet řádků.
+
+    Pracovní dny mezi a..b v SQL: e.cum_workdays - s.cum_workdays + s.is_workday
+    (s = řádek pro a, e = řádek pro b).
+    """
+    idx = get_workday_index()
+    with db_transaction() as tx:
+        tx.execute("DELETE FROM workday_calendar")
+        tx.executemany("INSERT INTO workday_calendar(date,is_workday,cum_workdays) VALUES(?,?,?)",
+                       idx.rows())
+    return len(idx.is_work)
 
 
 def is_workday(d: date) -> bool:
     """Pracovní den = ne víkend a ne státní svátek."""
+    idx = get_workday_index()
+    if idx.covers(d):
+        return idx.is_workday(d)
     return d.weekday() < 5 and d not in czech_holidays(d.year)
 
 
 def count_workdays_in_range(d_from: date, d_to: date) -> int:
     """Počet pracovních dní v rozsahu (včetně krajních, bez víkendů a svátků)."""
+    idx = get_workday_index()
+    if idx.covers(d_from) and idx.covers(d_to):
+        return idx.count(d_from, d_to)
     count, d = 0, d_from
     while d <= d_to:
         if is_workday(d):
@@ -1168,36 +2703,86 @@ def count_workdays_so_far(year: int, month: int) -> int:
     return count_workdays_in_range(first, last)
 
 
+# ── Maska absencí: intervaly → matice (uživatel × den) ───────────
+ABS_CODES = {"vacation": 1, "vacation_half": 2, "sickday": 3, "nemoc": 4,
+             "lekar_den": 5, "lekar_prichod": 6, "lekar_odchod": 7}
+ABS_CODE_TYPES = {code: t for t, code in ABS_CODES.items()}
+# Úbytek fondu za pracovní den podle kódu (index = kód); lékař fond nekrátí
+_ABS_FUND_WEIGHT = np.array([0.0, 1.0, 0.5, 1.0, 1.0, 0.0, 0.0, 0.0])
+# Priorita kódu při překryvu (index = kód): vyšší úbytek fondu vyhrává,
+# mezi celými dny nemoc > sickday > dovolená, lékař nejníž
+_ABS_RANK = np.array([0, 5, 4, 6, 7, 3, 2, 1], dtype=np.int8)
+
+
+def absence_mask(rows, year: int, month: int, user_ids=None) -> np.ndarray:
+    """Matice int8 (uživatel × den měsíce) s kódy ABS_CODES, 0 = bez absence.
+
+    Každý interval je jedno přiřazení do řezu pole, dny z half_days
+    u dovolené dostanou kód půldne. Při překryvu rozhoduje _ABS_RANK,
+    ne pořadí řádků. Bez user_ids se všechny řádky berou jako jeden uživatel.
+    """
+    first, last = month_bounds(year, month)
+    row_of = {uid: i for i, uid in enumerate(user_ids)} if user_ids is not None else None
+    mask   = np.zeros((len(user_ids) if user_ids is not None else 1, last.day), dtype=np.int8)
+    for r in rows:
+        code = ABS_CODES.get(r["absence_type"])
+        i    = row_of.get(r["user_id"]) if row_of is not None else 0
+        if code is None or i is None:
+            continue
+        d_from = max(date.fromisoformat(r["date_from"]), first)
+        d_to   = min(date.fromisoformat(r["date_to"]),   last)
+        if d_from > d_to:
+            continue
+        seg = np.full(d_to.day - d_from.day + 1, code, dtype=np.int8)
+        if code == ABS_CODES["vacation"] and r["half_days"]:
+            for hd in json.loads(r["half_days"]):
+                hd = date.fromisoformat(hd)
+                if d_from <= hd <= d_to:
+                    seg[hd.day - d_from.day] = ABS_CODES["vacation_half"]
+        cur = mask[i, d_from.day - 1:d_to.day]
+        mask[i, d_from.day - 1:d_to.day] = np.where(_ABS_RANK[seg] > _ABS_RANK[cur], seg, cur)
+    return mask
+
+
+def month_workday_flags(year: int, month: int) -> np.ndarray:
+    """bool vektor pracovních dní měsíce (řez WorkdayIndex)."""
+    first, last = month_bounds(year, month)
+    idx = get_workday_index()
+    if idx.covers(first) and idx.covers(last):
+        i = (first - idx.start).days
+        return idx.is_work[i:i + last.day]
+    return np.array([is_workday(first + timedelta(days=k)) for k in range(last.day)])
+
+
+def absence_fund_days(mask: np.ndarray, year: int, month: int) -> np.ndarray:
+    """Dny absence krátící fond pro každý řádek masky (půlden = 0.5)."""
+    return (_ABS_FUND_WEIGHT[mask] * month_workday_flags(year, month)).sum(axis=1)
+
+
+def absence_type_workdays(mask: np.ndarray, year: int, month: int) -> dict:
+    """Počet pracovních dní podle typu absence přes všechny řádky masky."""
+    counts = np.bincount(mask[:, month_workday_flags(year, month)].ravel(),
+                         minlength=len(_ABS_FUND_WEIGHT))
+    return {t: int(counts[code]) for t, code in ABS_CODES.items()}
+
+
 def count_absence_workdays(user_id: int, year: int, month: int) -> float:
     """Počet schválených pracovních dní absence v daném měsíci (půlden v half_days = 0.5)."""
-    first = date(year, month, 1)
-    last  = (date(year, month + 1, 1) - timedelta(days=1)) if month < 12 else date(year, 12, 31)
+    first, last = month_bounds(year, month)
     with get_conn() as conn:
         rows = conn.execute(
-            """SELECT absence_type, date_from, date_to, half_days FROM absences
+            """SELECT user_id, absence_type, date_from, date_to, half_days FROM absences
                WHERE user_id=? AND approved=1
                AND absence_type IN ('vacation','vacation_half','sickday','nemoc')
                AND date_to >= ? AND date_from <= ?""",
             (user_id, first.isoformat(), last.isoformat())
         ).fetchall()
-    total = 0.0
-    for row in rows:
-        if row["absence_type"] == "vacation_half":
-            total += 0.5
-        elif row["absence_type"] == "vacation":
-            hd  = set(json.loads(row["half_days"] or "[]"))
-            ab_from = max(date.fromisoformat(row["date_from"]), first)
-            ab_to   = min(date.fromisoformat(row["date_to"]),   last)
-            cur = ab_from
-            while cur <= ab_to:
-                if is_workday(cur):
-                    total += 0.5 if cur.isoformat() in hd else 1.0
-                cur += timedelta(days=1)
-        else:
-            ab_from = max(date.fromisoformat(row["date_from"]), first)
-            ab_to   = min(date.fromisoformat(row["date_to"]),   last)
-            total  += count_workdays_in_range(ab_from, ab_to)
-    return total
+    return absence_workdays_from_rows(rows, year, month)
+
+
+def absence_workdays_from_rows(rows, year: int, month: int) -> float:
+    """Jádro count_absence_workdays nad již načtenými řádky absencí (jeden uživatel)."""
+    return float(absence_fund_days(absence_mask(rows, year, month), year, month)[0])
 
 
 def effective_workdays(user_id: int, year: int, month: int) -> float:
@@ -1205,6 +2790,7 @@ def effective_workdays(user_id: int, year: int, month: int) -> float:
     return max(0.0, count_workdays_so_far(year, month) - count_absence_workdays(user_id, year, month))
 
 
+@cached_read("absences", "users")
 def get_all_absences_for_calendar(year: int, month: int):
     """Všechny schválené absence v daném měsíci pro kalendář."""
     first = date(year, month, 1)
@@ -1221,50 +2807,670 @@ def get_all_absences_for_calendar(year: int, month: int):
         ).fetchall()]
 
 
+# ── Měsíční výkaz – hromadné načtení ────────────────────────────
+def load_month_data(user_ids, year: int, month: int) -> dict:
+    """Docházka, pauzy a schválené absence měsíce pro více uživatelů najednou (3 dotazy)."""
+    user_ids = list(user_ids)
+    first, last = month_bounds(year, month)
+    data = {"year": year, "month": month, "attendance": {}, "pauses": {}, "absences": {}}
+    if not user_ids:
+        return data
+    marks = ",".join("?" * len(user_ids))
+    rng   = (first.isoformat(), last.isoformat())
+    with get_conn() as conn:
+        for r in conn.execute(
+            f"""SELECT * FROM attendance
+                WHERE user_id IN ({marks}) AND date BETWEEN ? AND ?
+                ORDER BY user_id, date""", (*user_ids, *rng)
+        ):
+            data["attendance"].setdefault(r["user_id"], []).append(dict(r))
+        for r in conn.execute(
+            f"""SELECT p.*, a.user_id, a.date AS att_date FROM pauses p
+                JOIN attendance a ON p.attendance_id = a.id
+                WHERE a.user_id IN ({marks}) AND a.date BETWEEN ? AND ?
+                ORDER BY a.date, p.start_time""", (*user_ids, *rng)
+        ):
+            data["pauses"].setdefault(r["attendance_id"], []).append(dict(r))
+        for r in conn.execute(
+            f"""SELECT * FROM absences
+                WHERE user_id IN ({marks}) AND approved=1
+                AND date_to >= ? AND date_from <= ?
+                ORDER BY date_from""", (*user_ids, *rng)
+        ):
+            data["absences"].setdefault(r["user_id"], []).append(dict(r))
+    _attach_worked_seconds(data)
+    data["mask_row"] = {uid: i for i, uid in enumerate(user_ids)}
+    data["absence_mask"] = absence_mask(
+        [a for rows in data["absences"].values() for a in rows], year, month, user_ids)
+    return data
+
+
+def _attach_worked_seconds(data: dict):
+    """Doplní att["worked_seconds"] všem záznamům najednou (calc_worked_seconds_vec)."""
+    atts = [a for rows in data["attendance"].values() for a in rows]
+    if not atts:
+        return
+    pos    = {a["id"]: i for i, a in enumerate(atts)}
+    pauses = [p for a in atts for p in data["pauses"].get(a["id"], [])]
+    worked = calc_worked_seconds_vec(
+        [a["checkin_time"] for a in atts], [a["checkout_time"] for a in atts],
+        [pos[p["attendance_id"]] for p in pauses],
+        [p["start_time"] for p in pauses], [p["end_time"] for p in pauses],
+        [p.get("paid") for p in pauses],
+    )
+    for a, w in zip(atts, worked):
+        a["worked_seconds"] = int(w)
+
+
+def build_month_report(users: list[dict], year: int, month: int,
+                       data: dict | None = None) -> pd.DataFrame:
+    """Souhrn za měsíc (fond, odpracováno, saldo) pro všechny uživatele v jednom průchodu."""
+    if data is None:
+        data = load_month_data([u["id"] for u in users], year, month)
+    workdays = count_workdays_so_far(year, month)
+    fund_off = absence_fund_days(data["absence_mask"], year, month)
+    rows = []
+    for u in users:
+        stats    = month_stats_from_data(data, u["id"])
+        ab_days  = float(fund_off[data["mask_row"][u["id"]]])
+        eff_days = max(0, workdays - ab_days)
+        wd_sec   = sum(s["worked_seconds"] for s in stats if not s["is_weekend"])
+        we_sec   = sum(s["worked_seconds"] for s in stats if s["is_weekend"])
+        expected = eff_days * 8 * 3600
+        rows.append({
+            "Jméno": u["display_name"],
+            "Prac. dny": workdays,
+            "Absence (dny)": ab_days,
+            "Fond (h)": round(expected / 3600, 2),
+            "Odpracováno (h)": round(wd_sec / 3600, 2),
+            "Víkend (h)": round(we_sec / 3600, 2),
+            "Celkem (h)": round((wd_sec + we_sec) / 3600, 2),
+            "Saldo (h)": round((wd_sec - expected) / 3600, 2),
+        })
+    return pd.DataFrame(rows)
+
+
+_ABS_TYPE_LABELS_ASCII = {
+    "vacation": "Dovolena", "vacation_half": "Dovolena (pulden)",
+    "sickday": "Sickday", "nemoc": "Nemoc/PN",
+    "lekar_den": "Lekar (den)", "lekar_prichod": "Lekar (prichod)",
+    "lekar_odchod": "Lekar (odchod)",
+}
+
+
+def _ascii_label(text: str) -> str:
+    """Popisek bez diakritiky pro list s ASCII popisky ("Svátek práce" → "Svatek prace")."""
+    return unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode()
+
+
+def month_detail_rows(user: dict, data: dict) -> list[dict]:
+    """Řádky denního listu XLSX (každý kalendářní den měsíce) z load_month_data."""
+    year, month = data["year"], data["month"]
+    _, last = month_bounds(year, month)
+
+    def _xhm(v):
+        if not v: return ""
+        v = str(v); return (v.split(" ")[1] if " " in v else v)[:5]
+
+    # ── Docházka indexovaná datem ─────────────────────────
+    _att_by_date = {r["date"]: r for r in month_stats_from_data(data, user["id"])}
+
+    # ── Pauzy indexované datem ────────────────────────────
+    _pb = {}
+    for _att in data["attendance"].get(user["id"], []):
+        for _xp in data["pauses"].get(_att["id"], []):
+            _ps = _xhm(_xp["start_time"])
+            _pe = _xhm(_xp.get("end_time")) or "?"
+            _paid_tag = " (pl.)" if _xp.get("paid") else ""
+            _pb.setdefault(_xp["att_date"], []).append(f"{_xp['pause_type']} {_ps}-{_pe}{_paid_tag}")
+
+    # ── Absence: řádek masky uživatele ────────────────────
+    _mask_i   = data.get("mask_row", {}).get(user["id"])
+    _ab_codes = data["absence_mask"][_mask_i] if _mask_i is not None else None
+
+    # ── Svátky ────────────────────────────────────────────
+    _hols = get_holiday_calendar().year(year)
+
+    # ── Každý kalendářní den měsíce → jeden řádek ────────
+    _DOW_CZ = ["Po","Ut","St","Ct","Pa","So","Ne"]
+    _detail_rows = []
+    for _dn in range(1, last.day + 1):
+        _d  = date(year, month, _dn)
+        _ds = _d.isoformat()
+        _att     = _att_by_date.get(_ds)
+        _cin     = _xhm(_att["checkin"])  if _att else ""
+        _cout    = _xhm(_att["checkout"]) if _att else ""
+        _code    = int(_ab_codes[_dn - 1]) if _ab_codes is not None else 0
+        _absence = _ABS_TYPE_LABELS_ASCII[ABS_CODE_TYPES[_code]] if _code else ""
+
+        # Určení stavu dne
+        if _d in _hols:
+            _stav = f"Statni svatek: {_ascii_label(_hols[_d])}"
+        elif _d.weekday() >= 5:
+            _stav = "Vikend"
+        elif _absence:
+            _stav = _absence
+        elif _cin:
+            _stav = "Dochazka"
+        else:
+            _stav = "Chybi dochazka"
+
+        _detail_rows.append({
+            "Datum":        _ds,
+            "Den":          _DOW_CZ[_d.weekday()],
+            "Stav":         _stav,
+            "Prichod":      _cin,
+            "Odchod":       _cout,
+            "Odpracovano":  seconds_to_hm(_att["worked_seconds"]) if _att else "",
+            "Pauzy":        " | ".join(_pb.get(_ds, [])),
+        })
+    return _detail_rows
+
+
+def get_staff_snapshot(day: str | None = None) -> list[dict]:
+    """Kdo je kde: jeden dotaz pro všechny aktivní uživatele.
+
+    Ke každému uživateli připojí absenci dne, relevantní záznam docházky
+    (otevřený dnes, otevřený včera – přes půlnoc –, jinak dnešní) a první
+    otevřenou pauzu. Korelované poddotazy jdou přes indexy, takže cena
+    roste jen s počtem uživatelů, ne s počtem dotazů.
+    """
+    day       = day or today_str()
+    yesterday = (date.fromisoformat(day) - timedelta(days=1)).isoformat()
+    with get_conn() as conn:
+        rows = conn.execute(
+            """SELECT u.*,
+                      ab.absence_type AS ab_type, ab.note AS ab_note,
+                      att.id AS att_id, att.date AS att_date,
+                      att.checkin_time, att.checkout_time,
+                      (SELECT p.pause_type FROM pauses p
+                        WHERE p.attendance_id = att.id AND p.end_time IS NULL
+                        ORDER BY p.start_time LIMIT 1) AS open_pause
+               FROM users u
+               LEFT JOIN absences ab ON ab.id = (
+                    SELECT MAX(a.id) FROM absences a
+                    WHERE a.user_id = u.id AND a.date_from <= :day AND a.date_to >= :day)
+               LEFT JOIN attendance att ON att.id = COALESCE(
+                    (SELECT id FROM attendance WHERE user_id = u.id AND date = :day
+                        AND checkin_time IS NOT NULL AND checkout_time IS NULL),
+                    (SELECT id FROM attendance WHERE user_id = u.id AND date = :yesterday
+                        AND checkin_time IS NOT NULL AND checkout_time IS NULL),
+                    (SELECT id FROM attendance WHERE user_id = u.id AND date = :day))
+               WHERE u.active = 1
+               ORDER BY u.display_name""",
+            {"day": day, "yesterday": yesterday}
+        ).fetchall()
+    return [dict(r) for r in rows]
+
+
+_SNAPSHOT_COLS = ("ab_type", "ab_note", "att_id", "att_date",
+                  "checkin_time", "checkout_time", "open_pause")
+
+
 def get_status_overview():
-    today = today_str()
-    users = get_all_users()
-    absences = get_absences_for_date(today)
-    absent_ids = {a["user_id"]: a for a in absences}
     result = []
-    for u in users:
-        uid = u["id"]
+    for r in get_staff_snapshot():
+        u = {k: v for k, v in r.items() if k not in _SNAPSHOT_COLS}
         status, detail, checkin = "offline", "", None
-        if uid in absent_ids:
-            ab = absent_ids[uid]
-            status = ab["absence_type"]
-            detail = ab["note"] or ""
-        else:
-            att = get_active_attendance(uid)
-            if not att:
-                r = get_attendance(uid, today)
-                att = dict(r) if r else None
-            if att:
-                if att["checkin_time"] and not att.get("checkout_time"):
-                    open_p = [p for p in get_pauses(att["id"]) if p["end_time"] is None]
-                    status  = "pause" if open_p else "working"
-                    detail  = open_p[0]["pause_type"] if open_p else ""
-                    checkin = att["checkin_time"][:5]
-                elif att["checkout_time"]:
-                    status  = "done"
-                    checkin = att["checkin_time"][:5] if att["checkin_time"] else ""
-                    detail  = f"odešel {att['checkout_time'][:5]}"
+        if r["ab_type"]:
+            status = r["ab_type"]
+            detail = r["ab_note"] or ""
+        elif r["att_id"]:
+            if r["checkin_time"] and not r["checkout_time"]:
+                status  = "pause" if r["open_pause"] else "working"
+                detail  = r["open_pause"] or ""
+                checkin = r["checkin_time"][:5]
+            elif r["checkout_time"]:
+                status  = "done"
+                checkin = r["checkin_time"][:5] if r["checkin_time"] else ""
+                detail  = f"odešel {r['checkout_time'][:5]}"
         result.append({**u, "status": status, "detail": detail, "checkin": checkin})
     return result
 
 
-def get_missing_today() -> list:
-    """Vrátí uživatele, kteří dnes nemají ani příchod ani absenci."""
-    today = today_str()
-    absences = {a["user_id"] for a in get_absences_for_date(today)}
-    result = []
-    for u in get_all_users():
-        if u["id"] in absences:
-            continue
-        att = get_active_attendance(u["id"]) or get_attendance(u["id"], today)
-        if not att or not att.get("checkin_time"):
-            result.append(u)
-    return result
+def get_missing_today(day: str | None = None) -> list:
+    """Vrátí uživatele, kteří v den `day` (výchozí dnes) nemají ani příchod ani absenci."""
+    return [
+        {k: v for k, v in r.items() if k not in _SNAPSHOT_COLS}
+        for r in get_staff_snapshot(day)
+        if not r["ab_type"] and not r["checkin_time"]
+    ]
+
+
+# ── Denní přehled pro administrátory ──
+def get_open_sick_leaves(day: str | None = None) -> list[dict]:
+    """Otevřené nemoci (schválené, konec ještě nezadán) začaté nejpozději v den `day`."""
+    with get_conn() as conn:
+        return [dict(r) for r in conn.execute(
+            "SELECT a.id, a.user_id, a.date_from, u.display_name FROM absences a"
+            " JOIN users u ON u.id = a.user_id"
+            " WHERE a.absence_type='nemoc' AND a.approved=1 AND a.date_to = a.date_from"
+            "   AND a.date_from <= ? AND u.active=1 ORDER BY a.date_from",
+            (day or today_str(),)
+        ).fetchall()]
+
+
+def compute_digest(day: str | None = None) -> dict:
+    day = day or today_str()
+    return {
+        "day":       day,
+        "missing":   [u["display_name"] for u in get_missing_today(day)],
+        "pending":   get_pending_counts(),
+        "open_sick": get_open_sick_leaves(day),
+    }
+
+
+def render_digest_email(to_name: str, digest: dict) -> tuple[str, str]:
+    d = date.fromisoformat(digest["day"])
+    missing = "\n".join(f"  - {n}" for n in digest["missing"]) or "  nikdo"
+    sick    = "\n".join(f"  - {a['display_name']} (od {date.fromisoformat(a['date_from']):%d.%m.})"
+                        for a in digest["open_sick"]) or "  žádné"
+    pend    = digest["pending"]
+    subject = f"[Docházkový systém] Přehled {d:%d.%m.%Y}"
+    body = (f"Dobrý den, {to_name},\n\n"
+            f"přehled docházky k {d:%d.%m.%Y}.\n\n"
+            f"Bez příchodu a bez absence ({len(digest['missing'])}):\n{missing}\n\n"
+            f"Čeká na schválení: absence {pend['absences']} · úpravy záznamů {pend['corrections']}\n\n"
+            f"Otevřené nemoci ({len(digest['open_sick'])}):\n{sick}\n\n"
+            f"S pozdravem,\n"
+            f"Docházkový systém – Exekutorský úřad Praha 4")
+    return subject, body
+
+
+class DigestJob:
+    """Denní přehled pro administrátory v časech DIGEST_TIMES.
+
+    Termín (tick) je „YYYY-MM-DD HH:MM“; přehled se pro něj spočítá jednou
+    a do email_outbox se zařadí zpráva pro každého odběratele (admin s e-mailem
+    a users.digest = 1). Zápis ticku do digest_runs a zprávy jdou v jedné
+    transakci, takže ani souběžný proces serveru neodešle přehled dvakrát.
+    """
+
+    def __init__(self):
+        self.status = {"checked_at": None, "last": None, "error": None}
+
+    def due_tick(self, now: datetime | None = None) -> str | None:
+        now = now or cet_now()
+        if not is_workday(now.date()):
+            return None
+        for hhmm in sorted(DIGEST_TIMES, reverse=True):
+            at = datetime.combine(now.date(), time.fromisoformat(hhmm), tzinfo=CET)
+            if at <= now < at + timedelta(minutes=DIGEST_GRACE_MIN):
+                return f"{now.date().isoformat()} {hhmm}"
+        return None
+
+    def run_once(self, now: datetime | None = None, tick: str | None = None) -> int | None:
+        """Zpracuje splatný tick; vrátí počet zařazených zpráv, None = nic k práci."""
+        now  = now or cet_now()
+        tick = tick or self.due_tick(now)
+        self.status.update(checked_at=now, error=None)
+        if tick is None:
+            return None
+        with get_conn() as conn:
+            if conn.execute("SELECT 1 FROM digest_runs WHERE tick=?", (tick,)).fetchone():
+                return None
+        digest = compute_digest(now.date().isoformat())
+        with db_transaction() as conn:
+            recipients = conn.execute(
+                "SELECT display_name, email FROM users WHERE role='admin' AND active=1"
+                " AND digest=1 AND COALESCE(email, '') <> ''"
+            ).fetchall()
+            claimed = conn.execute(
+                "INSERT OR IGNORE INTO digest_runs(tick, ran_at, recipients) VALUES(?,?,?)",
+                (tick, now.isoformat(timespec="seconds"), len(recipients))
+            ).rowcount
+            if claimed:
+                for r in recipients:
+                    subject, body = render_digest_email(r["display_name"], digest)
+                    enqueue_email(conn, r["email"], subject, body, kind="digest")
+        if not claimed:
+            return None
+        self.status["last"] = (tick, len(recipients))
+        if recipients:
+            start_email_sender().wake()
+        return len(recipients)
+
+    def loop(self):
+        import time
+        while True:
+            try:
+                self.run_once()
+            except Exception as e:
+                self.status["error"] = str(e)
+            time.sleep(DIGEST_POLL_S)
+
+
+@st.cache_resource
+def start_digest_job() -> DigestJob:
+    job = DigestJob()
+    threading.Thread(target=job.loop, daemon=True).start()
+    return job
+
+
+def last_digest_run() -> dict | None:
+    with get_conn() as conn:
+        row = conn.execute("SELECT * FROM digest_runs ORDER BY ran_at DESC LIMIT 1").fetchone()
+    return dict(row) if row else None
+
+# ─────────────────────────────────────────────
+# EXPORTY
+# ─────────────────────────────────────────────
+class ExportCache:
+    """Hotové exporty jako soubory v tempdir, klíčované verzí dat; LRU."""
+
+    def __init__(self, max_entries: int = EXPORT_CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self._dir     = Path(tempfile.mkdtemp(prefix="dochazka_export_"))
+        self._lock    = threading.Lock()
+        self._entries = OrderedDict()   # key -> Path
+        self.stats    = {"hits": 0, "builds": 0}
+
+    def path(self, key: tuple, build) -> Path:
+        """Cesta k hotovému exportu; build(path) se zavolá jen při chybějícím klíči."""
+        with self._lock:
+            p = self._entries.get(key)
+            if p is not None and p.exists():
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return p
+            p   = self._dir / f"{hashlib.sha1(repr(key).encode()).hexdigest()}"
+            tmp = p.with_suffix(".tmp")
+            build(tmp)
+            tmp.replace(p)
+            self._entries[key] = p
+            self.stats["builds"] += 1
+            while len(self._entries) > self.max_entries:
+                _, old = self._entries.popitem(last=False)
+                old.unlink(missing_ok=True)
+            return p
+
+    def get(self, key: tuple, build) -> bytes:
+        return self.path(key, build).read_bytes()
+
+    def clear(self):
+        with self._lock:
+            for p in self._entries.values():
+                p.unlink(missing_ok=True)
+            self._entries.clear()
+
+
+@st.cache_resource
+def get_export_cache() -> ExportCache:
+    return ExportCache()
+
+
+def xlsx_available() -> bool:
+    """openpyxl nemusí být k dispozici (Streamlit Cloud)."""
+    return importlib.util.find_spec("openpyxl") is not None
+
+
+def write_report_xlsx(path, user_ids: list[int], periods: list[tuple]):
+    """Výkaz do XLSX přes write-only workbook – řádky jdou rovnou na disk.
+
+    Data se načítají po měsících (load_month_data), takže paměť drží jen
+    jeden měsíc i při ročním exportu celého týmu. Při více obdobích má
+    každý list navíc sloupec "Obdobi".
+    """
+    from openpyxl import Workbook
+    users = [u for u in get_all_users() if u["id"] in set(user_ids)]
+    multi = len(periods) > 1
+    wb    = Workbook(write_only=True)
+    summary = wb.create_sheet("Přehled")
+    sheets  = {u["id"]: wb.create_sheet(u["display_name"][:31]) for u in users}
+    lead    = ["Obdobi"] if multi else []
+    headed  = set()   # listy, které už mají hlavičku
+    for year, month in periods:
+        data   = load_month_data(user_ids, year, month)
+        period = [f"{year}-{month:02d}"] if multi else []
+        df     = build_month_report(users, year, month, data)
+        if summary not in headed:
+            summary.append(lead + list(df.columns))
+            headed.add(summary)
+        for row in df.itertuples(index=False):
+            summary.append(period + list(row))
+        for u in users:
+            rows = month_detail_rows(u, data)
+            if rows and sheets[u["id"]] not in headed:
+                sheets[u["id"]].append(lead + list(rows[0]))
+                headed.add(sheets[u["id"]])
+            for r in rows:
+                sheets[u["id"]].append(period + list(r.values()))
+        del data, df
+    wb.save(path)
+
+
+def _full_db_export(build) -> bytes:
+    """Export celé DB – vždy čerstvý, bez ExportCache.
+
+    audit_log, email_outbox a punch_events nemají čítač v data_versions (audit
+    se navíc zapisuje asynchronně), takže klíč podle verze dat by je nezachytil.
+    """
+    start_audit_writer().flush()
+    with tempfile.TemporaryDirectory(prefix="dochazka_export_") as tmp:
+        path = Path(tmp) / "export"
+        build(path)
+        return path.read_bytes()
+
+
+def snapshot_db(dest):
+    """Konzistentní kopie DB přes Online Backup API (včetně obsahu WAL)."""
+    dst = sqlite3.connect(dest)
+    try:
+        get_conn().backup(dst)
+    finally:
+        dst.close()
+
+
+def db_snapshot_bytes() -> bytes:
+    """Aktuální DB jako .sqlite – snapshot se dělá až na vyžádání."""
+    return _full_db_export(snapshot_db)
+
+
+NDJSON_FORMAT = "dochazka-ndjson/1"
+
+
+def export_tables(conn=None) -> list[str]:
+    return [r[0] for r in (conn or get_conn()).execute(
+        "SELECT name FROM sqlite_master WHERE type='table'"
+        " AND name NOT LIKE 'sqlite_%' ORDER BY name")]
+
+
+def _iter_ndjson(conn):
+    """Řádky NDJSON: hlavička (schéma + počty), pak řádky tabulek po dávkách."""
+    tables = {}
+    for t in export_tables(conn):
+        cols = [r["name"] for r in conn.execute(f"PRAGMA table_info({t})")]
+        tables[t] = {
+            "columns": cols,
+            "sql":     conn.execute("SELECT sql FROM sqlite_master WHERE name=?", (t,)).fetchone()[0],
+            "rows":    conn.execute(f"SELECT COUNT(*) FROM {t}").fetchone()[0],
+        }
+    yield {"format": NDJSON_FORMAT, "schema_version": schema_version(conn),
+           "created_at": cet_now().isoformat(), "tables": tables}
+    for t, meta in tables.items():
+        cur = conn.execute(f"SELECT {', '.join(meta['columns'])} FROM {t}")
+        while batch := cur.fetchmany(EXPORT_BATCH_ROWS):
+            for row in batch:
+                yield {"t": t, "r": list(row)}
+
+
+def write_ndjson_export(path):
+    """Gzip NDJSON; čte se v jedné transakci, takže počty v hlavičce sedí s řádky."""
+    with db_transaction(immediate=False) as conn, \
+         gzip.open(path, "wt", encoding="utf-8", compresslevel=6) as f:
+        for obj in _iter_ndjson(conn):
+            f.write(json.dumps(obj, ensure_ascii=False, separators=(",", ":")))
+            f.write("\n")
+
+
+def read_ndjson_export(fileobj):
+    """Generátor (tabulka, řádek) ze souboru exportu; hlavičku vrací jako první prvek.
+
+    Po posledním řádku ověří počty proti hlavičce – nesoulad = ValueError.
+    """
+    with gzip.open(fileobj, "rt", encoding="utf-8") as f:
+        header = json.loads(f.readline() or "{}")
+        if header.get("format") != NDJSON_FORMAT:
+            raise ValueError("Soubor není export docházky (chybí hlavička).")
+        yield header
+        counts = dict.fromkeys(header["tables"], 0)
+        for line in f:
+            obj = json.loads(line)
+            if obj["t"] not in counts:
+                raise ValueError(f"Neznámá tabulka v exportu: {obj['t']}")
+            counts[obj["t"]] += 1
+            yield obj["t"], obj["r"]
+    bad = [t for t, n in counts.items() if n != header["tables"][t]["rows"]]
+    if bad:
+        raise ValueError(f"Neúplný export – nesedí počty řádků: {', '.join(bad)}")
+
+
+def ndjson_export_bytes() -> bytes:
+    return _full_db_export(write_ndjson_export)
+
+
+# ── Obnova a import ──
+# Odvozené tabulky se při importu přeskočí – aplikace si je dopočítá sama
+IMPORT_SKIP_TABLES = {"schema_version", "data_versions", "workday_calendar", "audit_log",
+                      "pending_counters", "email_outbox", "digest_runs", "punch_events"}
+REQUIRED_TABLES    = {"users", "attendance", "pauses", "absences"}
+
+
+def invalidate_caches():
+    """Po výměně dat pod aplikací: obnovit spojení, zahodit exporty, znovu ensure_db."""
+    get_pool().invalidate()
+    get_export_cache().clear()
+    get_read_cache().clear()
+    ensure_db.clear()
+    ensure_db()
+
+
+def validate_db_file(path) -> tuple[bool, str]:
+    """Hlavička, PRAGMA integrity_check, povinné tabulky a verze schématu."""
+    with open(path, "rb") as f:
+        if f.read(16) != b"SQLite format 3\x00":
+            return False, "Soubor není platná SQLite databáze."
+    latest = MIGRATIONS[-1][0]
+    try:
+        conn = sqlite3.connect(path)
+        try:
+            check = [r[0] for r in conn.execute("PRAGMA integrity_check")]
+            if check != ["ok"]:
+                return False, "Kontrola integrity selhala: " + "; ".join(check[:3])
+            missing = REQUIRED_TABLES - set(export_tables(conn))
+            if missing:
+                return False, f"V záloze chybí tabulky: {', '.join(sorted(missing))}"
+            version = schema_version(conn)
+        finally:
+            conn.close()
+    except sqlite3.DatabaseError as e:
+        return False, f"Soubor nelze otevřít: {e}"
+    if version > latest:
+        return False, f"Záloha má novější schéma (v{version}) než aplikace (v{latest})."
+    return True, f"schéma v{version}"
+
+
+def restore_database(path) -> tuple[bool, str]:
+    """Ověří soubor a nakopíruje ho do živé DB přes backup() – ne přepsáním souboru.
+
+    Backup API zamkne cílovou DB jen na dobu kopie a ostatní spojení
+    se o změně dozví samy; WAL/SHM soubory zůstanou konzistentní.
+    Přijme i komprimovanou zálohu (.sqlite.gz) z _do_backup.
+    """
+    path = Path(path)
+    with open(path, "rb") as f:
+        gz = f.read(2) == b"\x1f\x8b"
+    if gz:
+        plain = path.with_name(path.name + ".unpacked")
+        with gzip.open(path, "rb") as fin, open(plain, "wb") as fout:
+            shutil.copyfileobj(fin, fout, 1024 * 1024)
+        try:
+            return restore_database(plain)
+        finally:
+            plain.unlink(missing_ok=True)
+    ok, msg = validate_db_file(path)
+    if not ok:
+        return False, msg
+    _do_backup("pre_restore")
+    src = sqlite3.connect(path)
+    dst = sqlite3.connect(DB_PATH, timeout=30)
+    try:
+        src.backup(dst)
+    except sqlite3.Error as e:
+        return False, f"Obnova selhala: {e}"
+    finally:
+        dst.close()
+        src.close()
+    invalidate_caches()   # migrace dorovnají starší schéma
+    return True, f"Databáze obnovena ({msg})."
+
+
+def _iter_json_export(fileobj):
+    """Starší export {tabulka: [řádky]} ve tvaru, jaký vrací read_ndjson_export."""
+    data   = json.load(io.TextIOWrapper(fileobj, encoding="utf-8"))
+    tables = {t: {"columns": list(rows[0]) if rows else [], "rows": len(rows)}
+              for t, rows in data.items()}
+    yield {"format": "json", "schema_version": None, "tables": tables}
+    for t, rows in data.items():
+        for r in rows:
+            yield t, [r.get(c) for c in tables[t]["columns"]]
+
+
+def import_export_file(fileobj) -> tuple[bool, str]:
+    """Nahradí obsah tabulek daty z exportu (.ndjson.gz nebo starší .json).
+
+    Vše běží v jedné transakci po dávkách executemany; chyba kdekoli
+    (včetně nesouhlasu počtů řádků na konci souboru) vrátí DB do
+    původního stavu.
+    """
+    gz = fileobj.read(2) == b"\x1f\x8b"
+    fileobj.seek(0)
+    rows = read_ndjson_export(fileobj) if gz else _iter_json_export(fileobj)
+    imported = {}
+    try:
+        header = next(rows)
+        version = header.get("schema_version")
+        if version is not None and version > MIGRATIONS[-1][0]:
+            return False, f"Export má novější schéma (v{version}) než aplikace."
+        _do_backup("pre_import")
+        with db_transaction() as conn:
+            live, targets = set(export_tables(conn)), {}
+            for t, meta in header["tables"].items():
+                if t in IMPORT_SKIP_TABLES or t not in live:
+                    continue
+                cols = {r["name"] for r in conn.execute(f"PRAGMA table_info({t})")}
+                keep = [i for i, c in enumerate(meta["columns"]) if c in cols]
+                names = [meta["columns"][i] for i in keep]
+                targets[t] = (keep, f"INSERT INTO {t}({', '.join(names)})"
+                                    f" VALUES({', '.join('?' * len(names))})")
+                conn.execute(f"DELETE FROM {t}")
+                imported[t] = 0
+
+            batch, batch_t = [], None
+            for t, row in rows:
+                if t not in targets:
+                    continue
+                if batch and (t != batch_t or len(batch) >= EXPORT_BATCH_ROWS):
+                    conn.executemany(targets[batch_t][1], batch)
+                    batch = []
+                batch_t = t
+                batch.append([row[i] for i in targets[t][0]])
+                imported[t] += 1
+            if batch:
+                conn.executemany(targets[batch_t][1], batch)
+            rebuild_leave_ledger()
+            _seed_punch_baseline(conn, "import")
+    except (ValueError, KeyError, StopIteration, OSError, sqlite3.Error) as e:
+        return False, f"Import selhal, data beze změny: {e}"
+    invalidate_caches()
+    return True, "Importováno: " + ", ".join(f"{t} {n}" for t, n in imported.items())
+
+
+def report_xlsx_bytes(user_ids: list[int], periods: list[tuple]) -> bytes:
+    """XLSX výkazu z cache; znovu se generuje jen po změně dat."""
+    key = ("xlsx", tuple(periods), tuple(sorted(user_ids)), data_version())
+    return get_export_cache().get(key, lambda p: write_report_xlsx(p, user_ids, periods))
+
 
 # ─────────────────────────────────────────────
 # UI HELPERS
@@ -1361,51 +3567,78 @@ def page_login():
 # ── Admin – přímá editace docházky ──────────────────────────────
 def admin_set_attendance(user_id: int, day: str, checkin: str, checkout: str):
     """Nastaví nebo přepíše příchod/odchod pro libovolného uživatele."""
-    with get_conn() as conn:
-        row = conn.execute(
-            "SELECT id FROM attendance WHERE user_id=? AND date=?", (user_id, day)
+    with db_transaction() as conn:
+        before = conn.execute(
+            "SELECT * FROM attendance WHERE user_id=? AND date=?", (user_id, day)
         ).fetchone()
-        if row:
-            conn.execute(
-                "UPDATE attendance SET checkin_time=?, checkout_time=? WHERE id=?",
-                (checkin or None, checkout or None, row["id"])
-            )
+        if before:
+            after = conn.execute(
+                "UPDATE attendance SET checkin_time=?, checkout_time=? WHERE id=? RETURNING *",
+                (checkin or None, checkout or None, before["id"])
+            ).fetchone()
         else:
-            conn.execute(
+            after = conn.execute(
                 "INSERT INTO attendance(user_id, date, checkin_time, checkout_time)"
-                " VALUES(?,?,?,?)",
+                " VALUES(?,?,?,?) RETURNING *",
                 (user_id, day, checkin or None, checkout or None)
-            )
-        conn.commit()
+            ).fetchone()
+        _log_punch(conn, user_id, day, "edit", {"attendance": [after]})
+    audit("attendance", after["id"], before, after)
 
 
-def admin_set_pause(att_id: int, pause_type: str, start: str, end: str):
-    """Přidá nebo přepíše pauzu k záznamu docházky."""
-    with get_conn() as conn:
-        conn.execute(
-            "INSERT INTO pauses(attendance_id, pause_type, start_time, end_time)"
-            " VALUES(?,?,?,?)",
-            (att_id, pause_type, start, end or None)
-        )
-        conn.commit()
+def admin_set_pause(att_id: int, pause_type: str, start: str, end: str, paid: bool = False):
+    """Přidá pauzu k záznamu docházky."""
+    with db_transaction() as conn:
+        row = conn.execute(
+            "INSERT INTO pauses(attendance_id, pause_type, start_time, end_time, paid)"
+            " VALUES(?,?,?,?,?) RETURNING *",
+            (att_id, pause_type, start, end or None, 1 if paid else 0)
+        ).fetchone()
+        _log_punch(conn, *_att_key(conn, att_id), "edit", {"pauses": [row]})
+    audit("pauses", row["id"], None, row)
+
+
+def admin_update_pause(pause_id: int, pause_type: str, start: str, end: str, paid: bool):
+    """Přepíše existující pauzu."""
+    with db_transaction() as conn:
+        before = conn.execute("SELECT * FROM pauses WHERE id=?", (pause_id,)).fetchone()
+        after  = conn.execute(
+            "UPDATE pauses SET pause_type=?,start_time=?,end_time=?,paid=? WHERE id=? RETURNING *",
+            (pause_type, start, end, 1 if paid else 0, pause_id)
+        ).fetchone()
+        if after:
+            _log_punch(conn, *_att_key(conn, after["attendance_id"]), "edit", {"pauses": [after]})
+    if after:
+        audit("pauses", pause_id, before, after)
 
 
 def admin_delete_pause(pause_id: int):
-    with get_conn() as conn:
-        conn.execute("DELETE FROM pauses WHERE id=?", (pause_id,))
-        conn.commit()
+    with db_transaction() as conn:
+        row = conn.execute("DELETE FROM pauses WHERE id=? RETURNING *", (pause_id,)).fetchone()
+        if row:
+            _log_punch(conn, *_att_key(conn, row["attendance_id"]), "edit",
+                       {"deleted": {"pauses": [pause_id]}})
+    if row:
+        audit("pauses", pause_id, row, None)
 
 
 def admin_clear_attendance(user_id: int, day: str):
     """Smaže celý záznam docházky včetně pauz."""
-    with get_conn() as conn:
+    with db_transaction() as conn:
         row = conn.execute(
             "SELECT id FROM attendance WHERE user_id=? AND date=?", (user_id, day)
         ).fetchone()
-        if row:
-            conn.execute("DELETE FROM pauses WHERE attendance_id=?", (row["id"],))
-            conn.execute("DELETE FROM attendance WHERE id=?", (row["id"],))
-            conn.commit()
+        if not row:
+            return
+        pauses = conn.execute(
+            "DELETE FROM pauses WHERE attendance_id=? RETURNING *", (row["id"],)
+        ).fetchall()
+        att = conn.execute("DELETE FROM attendance WHERE id=? RETURNING *", (row["id"],)).fetchone()
+        _log_punch(conn, user_id, day, "edit",
+                   {"deleted": {"pauses": [p["id"] for p in pauses], "attendance": [att["id"]]}})
+    for p in pauses:
+        audit("pauses", p["id"], p, None)
+    audit("attendance", att["id"], att, None)
 
 # ─────────────────────────────────────────────
 # PAGE: DASHBOARD
@@ -1902,21 +4135,8 @@ def page_absences():
                     _lpi = date_from.isoformat()
                     _lps = _lpi + " 09:00:00"
                     _lpe = _lpi + " " + _lp_time.strftime("%H:%M:%S")
-                    with get_conn() as _c:
-                        _r = _c.execute("SELECT id,checkin_time FROM attendance WHERE user_id=? AND date=?",
-                                        (user["id"], _lpi)).fetchone()
-                        if _r:
-                            _aid = _r["id"]
-                            if not _r["checkin_time"]:
-                                _c.execute("UPDATE attendance SET checkin_time=? WHERE id=?", (_lpe, _aid))
-                        else:
-                            _aid = _c.execute(
-                                "INSERT INTO attendance(user_id,date,checkin_time) VALUES(?,?,?)",
-                                (user["id"], _lpi, _lpe)).lastrowid
-                        _c.execute("INSERT INTO pauses(attendance_id,pause_type,start_time,end_time,paid)"
-                                   " VALUES(?,?,?,?,1)",
-                                   (_aid, "Lekar od 9:00 (placena)", _lps, _lpe))
-                        _c.commit()
+                    add_doctor_pause(user["id"], _lpi, "Lekar od 9:00 (placena)", _lps, _lpe,
+                                     checkin=_lpe)
                     st.success(f"Lekar 09:00 – {_lp_time.strftime('%H:%M')} zaznamenan ({date_from.strftime('%d.%m.%Y')}) ✓")
                     st.rerun()
             elif abs_type == "lekar_odchod":
@@ -1926,16 +4146,7 @@ def page_absences():
                     _loi = date_from.isoformat()
                     _los = _loi + " " + _lo_time.strftime("%H:%M:%S")
                     _loe = _loi + " 15:00:00"
-                    with get_conn() as _c2:
-                        _r2 = _c2.execute("SELECT id FROM attendance WHERE user_id=? AND date=?",
-                                          (user["id"], _loi)).fetchone()
-                        _aid2 = _r2["id"] if _r2 else _c2.execute(
-                            "INSERT INTO attendance(user_id,date) VALUES(?,?)",
-                            (user["id"], _loi)).lastrowid
-                        _c2.execute("INSERT INTO pauses(attendance_id,pause_type,start_time,end_time,paid)"
-                                    " VALUES(?,?,?,?,1)",
-                                    (_aid2, "Lekar do 15:00 (placena)", _los, _loe))
-                        _c2.commit()
+                    add_doctor_pause(user["id"], _loi, "Lekar do 15:00 (placena)", _los, _loe)
                     st.success(f"Lekar {_lo_time.strftime('%H:%M')} – 15:00 zaznamenan ({date_from.strftime('%d.%m.%Y')}) ✓")
                     st.rerun()
             elif abs_type == "lekar_den":
@@ -1943,29 +4154,8 @@ def page_absences():
                 _ld_iso  = date_from.isoformat()
                 _ld_cin  = _ld_iso + " 08:00:00"
                 _ld_cout = _ld_iso + " 16:00:00"
-                with get_conn() as _ldc:
-                    _ldr = _ldc.execute(
-                        "SELECT id, checkin_time, checkout_time FROM attendance WHERE user_id=? AND date=?",
-                        (user["id"], _ld_iso)
-                    ).fetchone()
-                    if _ldr:
-                        _ld_att_id = _ldr["id"]
-                        if not _ldr["checkin_time"]:
-                            _ldc.execute("UPDATE attendance SET checkin_time=? WHERE id=?", (_ld_cin, _ld_att_id))
-                        if not _ldr["checkout_time"]:
-                            _ldc.execute("UPDATE attendance SET checkout_time=? WHERE id=?", (_ld_cout, _ld_att_id))
-                    else:
-                        _ldc_cur = _ldc.execute(
-                            "INSERT INTO attendance(user_id,date,checkin_time,checkout_time) VALUES(?,?,?,?)",
-                            (user["id"], _ld_iso, _ld_cin, _ld_cout)
-                        )
-                        _ld_att_id = _ldc_cur.lastrowid
-                    _ldc.execute(
-                        "INSERT INTO pauses(attendance_id,pause_type,start_time,end_time,paid)"
-                        " VALUES(?,?,?,?,1)",
-                        (_ld_att_id, "🏥 Lékař – celý den (placená)", _ld_cin, _ld_cout)
-                    )
-                    _ldc.commit()
+                add_doctor_pause(user["id"], _ld_iso, "🏥 Lékař – celý den (placená)", _ld_cin, _ld_cout,
+                                 checkin=_ld_cin, checkout=_ld_cout)
                 st.success(f"✅ Celodenní lékař zaznamenán pro {date_from.strftime('%d.%m.%Y')} – 8 h v pracovní době 💚")
                 st.rerun()
             else:
@@ -2250,164 +4440,25 @@ def page_reports():
     else:
         target_users = [next(u for u in get_all_users() if u["id"] == (sel_uid or user["id"]))]
 
-    all_rows = []
-    for tu in target_users:
-        stats     = get_month_stats(tu["id"], year, month)
-        workdays  = count_workdays_so_far(year, month)
-        ab_days   = count_absence_workdays(tu["id"], year, month)
-        eff_days  = max(0, workdays - ab_days)
-        wd_sec    = sum(s["worked_seconds"] for s in stats if not s["is_weekend"])
-        we_sec    = sum(s["worked_seconds"] for s in stats if s["is_weekend"])
-        expected  = eff_days * 8 * 3600
-        all_rows.append({
-            "Jméno": tu["display_name"],
-            "Prac. dny": workdays,
-            "Absence (dny)": ab_days,
-            "Fond (h)": round(expected / 3600, 2),
-            "Odpracováno (h)": round(wd_sec / 3600, 2),
-            "Víkend (h)": round(we_sec / 3600, 2),
-            "Celkem (h)": round((wd_sec + we_sec) / 3600, 2),
-            "Saldo (h)": round((wd_sec - expected) / 3600, 2),
-        })
+    month_data = load_month_data([tu["id"] for tu in target_users], year, month)
+    df = build_month_report(target_users, year, month, month_data)
 
-    if all_rows:
-        df = pd.DataFrame(all_rows)
+    if not df.empty:
         st.dataframe(df, use_container_width=True, hide_index=True)
         csv = df.to_csv(index=False, sep=";", decimal=",").encode("utf-8-sig")
 
-        # XLSX – openpyxl nemusí být k dispozici (Streamlit Cloud)
-        xlsx_buf = None
-        try:
-            import openpyxl  # noqa: F401
-            xlsx_buf = io.BytesIO()
-            with pd.ExcelWriter(xlsx_buf, engine="openpyxl") as writer:
-                df.to_excel(writer, sheet_name="Přehled", index=False)
-                for tu in target_users:
-                    # ── Pomocné funkce ────────────────────────────────────
-                    def _xhm(v):
-                        if not v: return ""
-                        v = str(v); return (v.split(" ")[1] if " " in v else v)[:5]
-
-                    # ── Docházka indexovaná datem ─────────────────────────
-                    _s = get_month_stats(tu["id"], year, month)
-                    _att_by_date = {r["date"]: r for r in _s}
-
-                    # ── Pauzy indexované datem ────────────────────────────
-                    with get_conn() as _xpc:
-                        _xp_rows = [dict(r) for r in _xpc.execute(
-                            """SELECT p.pause_type, p.start_time, p.end_time, p.paid, a.date as att_date
-                               FROM pauses p JOIN attendance a ON p.attendance_id=a.id
-                               WHERE a.user_id=? AND strftime('%Y',a.date)=?
-                               AND strftime('%m',a.date)=?
-                               ORDER BY a.date, p.start_time""",
-                            (tu["id"], str(year), f"{month:02d}")
-                        ).fetchall()]
-                    _pb = {}
-                    for _xp in _xp_rows:
-                        _d = _xp["att_date"]
-                        _ps = _xhm(_xp["start_time"])
-                        _pe = _xhm(_xp.get("end_time")) or "?"
-                        _pt = _xp["pause_type"]
-                        _paid_tag = " (pl.)" if _xp.get("paid") else ""
-                        _pb.setdefault(_d, []).append(f"{_pt} {_ps}-{_pe}{_paid_tag}")
-
-                    # ── Absence indexované datem ──────────────────────────
-                    _abs_type_labels = {
-                        "vacation": "Dovolena", "vacation_half": "Dovolena (pulden)",
-                        "sickday": "Sickday", "nemoc": "Nemoc/PN",
-                        "lekar_den": "Lekar (den)", "lekar_prichod": "Lekar (prichod)",
-                        "lekar_odchod": "Lekar (odchod)",
-                    }
-                    with get_conn() as _xac:
-                        _abs_rows = [dict(r) for r in _xac.execute(
-                            """SELECT absence_type, date_from, date_to, note FROM absences
-                               WHERE user_id=? AND approved=1
-                               AND date_from <= ? AND date_to >= ?""",
-                            (tu["id"],
-                             date(year, month, 1).replace(month=month % 12 + 1, day=1).isoformat()
-                             if month < 12 else f"{year+1}-01-01",
-                             f"{year}-{month:02d}-01")
-                        ).fetchall()]
-                    _ab_by_date = {}
-                    for _ab in _abs_rows:
-                        _af = date.fromisoformat(_ab["date_from"])
-                        _at = date.fromisoformat(_ab["date_to"])
-                        _cur = _af
-                        while _cur <= _at:
-                            if _cur.year == year and _cur.month == month:
-                                _lbl = _abs_type_labels.get(_ab["absence_type"], _ab["absence_type"])
-                                _ab_by_date[_cur.isoformat()] = _lbl
-                            _cur += timedelta(days=1)
-
-                    # ── Svátky ────────────────────────────────────────────
-                    _hols = czech_holidays(year)
-                    _hol_names = {
-                        date(year,1,1):"Novy rok", date(year,5,1):"Svatek prace",
-                        date(year,5,8):"Den vitezstvi", date(year,7,5):"Cyril a Metodej",
-                        date(year,7,6):"Mistr Jan Hus", date(year,9,28):"Den ceske statnosti",
-                        date(year,10,28):"Vznik CSR", date(year,11,17):"Den svobody",
-                        date(year,12,24):"Stedry den", date(year,12,25):"1. svanek vanocni",
-                        date(year,12,26):"2. svatek vanocni",
-                    }
-                    # Velikonoce se mění – přidáme z hol_names
-                    for _h in _hols:
-                        if _h not in _hol_names:
-                            _hol_names[_h] = "Statni svatek"
-
-                    # ── Každý kalendářní den měsíce → jeden řádek ────────
-                    _num_days = (date(year, month % 12 + 1, 1) - timedelta(days=1)).day \
-                                if month < 12 else 31
-                    _DOW_CZ = ["Po","Ut","St","Ct","Pa","So","Ne"]
-                    _detail_rows = []
-                    for _dn in range(1, _num_days + 1):
-                        _d = date(year, month, _dn)
-                        _ds = _d.isoformat()
-                        _dow = _DOW_CZ[_d.weekday()]
-                        _is_wknd = _d.weekday() >= 5
-                        _is_hol  = _d in _hols
-
-                        _att = _att_by_date.get(_ds)
-                        _cin    = _xhm(_att["checkin"])  if _att else ""
-                        _cout   = _xhm(_att["checkout"]) if _att else ""
-                        _worked = seconds_to_hm(_att["worked_seconds"]) if _att else ""
-                        _pauses = " | ".join(_pb.get(_ds, []))
-                        _absence = _ab_by_date.get(_ds, "")
-
-                        # Určení stavu dne
-                        if _is_hol:
-                            _stav = f"Statn  svatek: {_hol_names.get(_d,'')}"
-                        elif _is_wknd:
-                            _stav = "Vikend"
-                        elif _absence:
-                            _stav = _absence
-                        elif _cin:
-                            _stav = "Dochazka"
-                        else:
-                            _stav = "Chybi dochazka"
-
-                        _detail_rows.append({
-                            "Datum":        _ds,
-                            "Den":          _dow,
-                            "Stav":         _stav,
-                            "Prichod":      _cin,
-                            "Odchod":       _cout,
-                            "Odpracovano":  _worked,
-                            "Pauzy":        _pauses,
-                        })
-
-                    _sheet_name = tu["display_name"][:31]
-                    pd.DataFrame(_detail_rows).to_excel(writer, sheet_name=_sheet_name, index=False)
-            xlsx_buf.seek(0)
-        except ImportError:
-            pass
-
-        btn_cols = st.columns([1, 1, 4]) if xlsx_buf else st.columns([1, 5])
+        # XLSX se generuje až po kliknutí (callable) a drží se v ExportCache
+        has_xlsx = xlsx_available()
+        xlsx_ids = [tu["id"] for tu in target_users]
+
+        btn_cols = st.columns([1, 1, 4]) if has_xlsx else st.columns([1, 5])
         with btn_cols[0]:
             st.download_button("⬇ CSV", data=csv,
                                file_name=f"dochazka_{year}_{month:02d}.csv", mime="text/csv")
-        if xlsx_buf:
+        if has_xlsx:
             with btn_cols[1]:
-                st.download_button("⬇ XLSX", data=xlsx_buf,
+                st.download_button("⬇ XLSX",
+                                   data=lambda: report_xlsx_bytes(xlsx_ids, [(year, month)]),
                                    file_name=f"dochazka_{year}_{month:02d}.xlsx",
                                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
         else:
@@ -2417,7 +4468,8 @@ def page_reports():
         if len(target_users) == 1:
             st.markdown("---")
             st.markdown("#### Denní přehled")
-            stats = get_month_stats(target_users[0]["id"], year, month)
+            _rep_user = target_users[0]
+            stats = month_stats_from_data(month_data, _rep_user["id"])
             if stats:
                 df3 = pd.DataFrame(stats)
                 df3["Odpracováno"] = df3["worked_seconds"].apply(seconds_to_hm)
@@ -2426,24 +4478,18 @@ def page_reports():
                     columns={"date":"Datum","checkin":"Příchod","checkout":"Odchod"})
                 st.dataframe(df3, use_container_width=True, hide_index=True)
                 # Pauzy
-                _rep_user = target_users[0]
                 _all_pauses_rows = []
-                with get_conn() as _pc:
-                    _month_pauses = _pc.execute(
-                        """SELECT p.*, a.date FROM pauses p
-                           JOIN attendance a ON p.attendance_id=a.id
-                           WHERE a.user_id=? AND strftime('%Y',a.date)=?
-                           AND strftime('%m',a.date)=? ORDER BY a.date,p.start_time""",
-                        (_rep_user["id"], str(year), f"{month:02d}")
-                    ).fetchall()
-                for _p in _month_pauses:
-                    _pd = dict(_p)
+                _month_pauses = sorted(
+                    (p for att in month_data["attendance"].get(_rep_user["id"], [])
+                     for p in month_data["pauses"].get(att["id"], [])),
+                    key=lambda p: (p["att_date"], p["start_time"]))
+                for _pd in _month_pauses:
                     _dur = ""
                     if _pd.get("end_time"):
                         _ds = time_to_seconds(_pd["end_time"]) - time_to_seconds(_pd["start_time"])
                         _dur = seconds_to_hm(_ds)
                     _all_pauses_rows.append({
-                        "Datum": _pd["date"], "Typ": _pd["pause_type"],
+                        "Datum": _pd["att_date"], "Typ": _pd["pause_type"],
                         "Začátek": _pd["start_time"][11:16] if _pd["start_time"] else "",
                         "Konec": _pd["end_time"][11:16] if _pd.get("end_time") else "—",
                         "Trvání": _dur,
@@ -2466,11 +4512,11 @@ def page_admin():
     </div>
     <div class="content-pad">""", unsafe_allow_html=True)
 
-    tab1, tab2, tab3, tab4, tab5, tab6, tab7, tab8, tab9 = st.tabs([
+    tab1, tab2, tab3, tab4, tab5, tab6, tab7, tab8, tab9, tab10 = st.tabs([
         "👥 Uživatelé", "➕ Nový uživatel",
         "🤒 Vložit nemoc", "✅ Schválení absencí", "✏️ Schválení úprav",
         "📊 Fondy dovolené", "💾 Záloha databáze", "✏️ Přímá editace docházky",
-        "Editace dovolene"
+        "Editace dovolene", "🧾 Audit"
     ])
 
     # ── Tab 1: Users ──────────────────────────────────────
@@ -2526,6 +4572,12 @@ def page_admin():
                         update_user_email(u["id"], new_email_val)
                         st.success("E-mail ulozen")
                         st.rerun()
+                if u["role"] == "admin":
+                    _dg_on = st.checkbox("Denní přehled e-mailem", value=bool(u.get("digest", 1)),
+                                         key=f"digest_{u['id']}")
+                    if _dg_on != bool(u.get("digest", 1)):
+                        set_user_digest(u["id"], _dg_on)
+                        st.rerun()
 
                 # Deactivate
                 if u["id"] != st.session_state.user["id"]:
@@ -2553,9 +4605,8 @@ def page_admin():
                 ok, msg = create_user(new_username, new_password, new_display, new_role, new_color)
                 # Store email too if provided
                 if ok and new_email:
-                    with get_conn() as conn:
+                    with db_transaction() as conn:
                         conn.execute("UPDATE users SET email=? WHERE username=?", (new_email, new_username))
-                        conn.commit()
                 st.success(msg) if ok else st.error(msg)
             else:
                 st.warning("Vyplňte všechna povinná pole.")
@@ -2579,12 +4630,7 @@ def page_admin():
             if sick_to < sick_from:
                 st.error("Datum 'Do' musí být ≥ 'Od'.")
             else:
-                with get_conn() as conn:
-                    conn.execute(
-                        "INSERT INTO absences(user_id,absence_type,date_from,date_to,note,approved,email_sent) VALUES(?,?,?,?,?,1,0)",
-                        (sick_uid, "sickday", sick_from.isoformat(), sick_to.isoformat(), sick_note)
-                    )
-                    conn.commit()
+                add_approved_absence(sick_uid, "sickday", sick_from, sick_to, sick_note)
                 days = (sick_to - sick_from).days + 1
                 st.success(f"Nemoc pro **{uid_map[sick_uid]}** zaznamenána ({days} {'den' if days==1 else 'dní'}) ✓")
                 st.rerun()
@@ -2639,26 +4685,32 @@ def page_admin():
             col1, col2, _ = st.columns([1, 1, 4])
             with col1:
                 if st.button("✅ Schválit", key=f"app_abs_{a['id']}"):
-                    sent = approve_absence(a["id"], True,
-                                           user_email=email_info,
-                                           user_name=a["display_name"])
-                    if sent:
-                        st.success(f"Schváleno ✓ · Email odeslán na {email_info}" if email_info
-                                   else "Schváleno ✓ (simulace emailu – email uživatele není nastaven)")
+                    queued = approve_absence(a["id"], True,
+                                             user_email=email_info,
+                                             user_name=a["display_name"])
+                    if queued:
+                        st.success(f"Schváleno ✓ · Email zařazen k odeslání na {email_info}")
                     else:
-                        st.success("Schváleno ✓")
+                        st.success("Schváleno ✓ (email uživatele není nastaven)")
                     st.rerun()
             with col2:
                 if st.button("❌ Zamítnout", key=f"rej_abs_{a['id']}"):
                     approve_absence(a["id"], False)
                     st.rerun()
 
-        # Show email simulation log
-        if st.session_state.get("email_log"):
+        # Odchozí e-maily – posledních EMAIL_LOG_ROWS zpráv z fronty
+        outbox = recent_outbox()
+        if outbox:
             st.markdown("---")
-            st.markdown("**📬 Simulace odeslaných e-mailů** *(EMAIL_ENABLED = False)*")
-            for em in st.session_state["email_log"]:
-                with st.expander(f"✉ {em['to']} – {em['subject']}"):
+            st.markdown("**📬 Odchozí e-maily**"
+                        + ("" if EMAIL_ENABLED else " *(EMAIL_ENABLED = False – simulace)*"))
+            st.caption(" · ".join(f"{k}: {v}" for k, v in sorted(outbox_status().items())))
+            status_icon = {"pending": "⏳", "sending": "📤", "sent": "✉", "simulated": "✉", "failed": "⚠️"}
+            for em in outbox:
+                with st.expander(f"{status_icon.get(em['status'], '✉')} {em['to_addr']} – "
+                                 f"{em['subject']} · {em['status']}"):
+                    if em["last_error"]:
+                        st.caption(f"Pokus {em['attempts']}: {em['last_error']}")
                     st.code(em["body"])
 
     # ── Tab 5: Approve corrections ────────────────────────
@@ -2699,9 +4751,8 @@ def page_admin():
         st.markdown("Upravte fond dovolené a počet sickday dní pro každého zaměstnance.")
         all_users_f = get_all_users()
         for u in all_users_f:
-            fund  = ensure_leave_fund(u["id"], fund_year)
-            used_v = get_used_vacation(u["id"], fund_year)
-            used_s = get_used_sickdays(u["id"], fund_year)
+            fund  = get_leave_fund(u["id"], fund_year)
+            used_v, used_s = get_leave_balance(u["id"], fund_year)
             total_v = fund["vacation_days"] + fund["vacation_carry"]
             initials = "".join(w[0].upper() for w in u["display_name"].split()[:2])
             color = u.get("color") or "#1f5e8c"
@@ -2730,6 +4781,57 @@ def page_admin():
                     st.success(f"Uloženo: {u['display_name']} – dovolená {int(vd)}+{int(vc)} dní, sickday {int(sd)} ✓")
                     st.rerun()
 
+        st.markdown("---")
+        st.caption("Čerpání se drží v ledgeru a aktualizuje při každé změně absence. "
+                   "Kontrola ho přepočítá od nuly a vypíše odchylky.")
+        lc1, lc2 = st.columns(2)
+        with lc1:
+            verify_only = st.button("🔍 Ověřit ledger", key="ledger_verify")
+        with lc2:
+            do_rebuild  = st.button("🔁 Přepočítat ledger", key="ledger_rebuild")
+        if verify_only or do_rebuild:
+            drift = rebuild_leave_ledger(fix=do_rebuild)
+            if not drift:
+                st.success("Ledger odpovídá absencím ✓")
+            else:
+                names = {u["id"]: u["display_name"] for u in all_users_f}
+                st.warning(f"Odchylek: {len(drift)}" + (" – opraveno ✓" if do_rebuild else ""))
+                st.dataframe(pd.DataFrame([
+                    {"Zaměstnanec": names.get(d["user_id"], d["user_id"]), "Rok": d["year"],
+                     "Dovolená (ledger)": d["vacation_ledger"], "Dovolená (skutečně)": d["vacation_actual"],
+                     "Sickday (ledger)": d["sickday_ledger"], "Sickday (skutečně)": d["sickday_actual"]}
+                    for d in drift
+                ]), hide_index=True, use_container_width=True)
+
+        st.caption("Docházka a pauzy jsou projekcí append-only logu píchnutí (punch_events). "
+                   "Kontrola log přehraje a porovná s tabulkami.")
+        if st.button("🔍 Ověřit docházku z logu", key="punch_verify"):
+            st.session_state.punch_drift = replay_punch_log()
+        punch_drift = st.session_state.get("punch_drift")
+        if punch_drift == {}:
+            st.success("Docházka odpovídá logu píchnutí ✓")
+        elif punch_drift:
+            st.warning(" · ".join(
+                f"{t}: chybí {d['missing']}, liší se {d['changed']}, navíc {d['extra']}"
+                for t, d in punch_drift.items()
+            ))
+            has_extra = any(d["extra"] for d in punch_drift.values())
+            if has_extra:
+                st.caption("Řádky navíc v logu nejsou – může jít o data z doby před logem, "
+                           "z importu nebo z ruční úpravy. Bez zaškrtnutí zůstanou zachované.")
+            punch_del = st.checkbox("Smazat i řádky navíc", key="punch_delete_extra",
+                                    disabled=not has_extra)
+            punch_ok  = st.checkbox("Rozumím – docházka se přepíše podle logu (předtím se vytvoří záloha)",
+                                    key="confirm_punch_replay")
+            if st.button("🔁 Přehrát log do docházky", key="punch_replay",
+                         type="primary", disabled=not punch_ok):
+                if not _do_backup("pre_replay"):
+                    st.error("Záloha se nezdařila – docházka zůstala beze změny.")
+                else:
+                    replay_punch_log(fix=True, delete_extra=punch_del)
+                    st.session_state.punch_drift = replay_punch_log()
+                    st.rerun()
+
 
     # ── Tab 7: Záloha / Export / Import ─────────────────────
     with tab7:
@@ -2751,6 +4853,15 @@ def page_admin():
             "Interval automatické zálohy (hodiny)", min_value=1, max_value=168,
             value=BACKUP_INTERVAL_H, key="bkp_interval_display", disabled=True
         )
+        _sched = start_auto_backup()
+        _plan  = _sched.plan()
+        _fmt   = lambda d: d.strftime("%d.%m.%Y %H:%M") if d else "—"
+        st.caption(
+            f"Poslední záloha: {_fmt(_plan['last'])} · změn od ní: {_plan['changes'] if _plan['changes'] is not None else '—'} · "
+            f"další: {'ihned' if _plan['due'] else _fmt(_plan['next'])} ({_plan['reason']}) · "
+            f"plánovač naposledy kontroloval {_fmt(_sched.status['checked_at'])}"
+            + (f" · ⚠️ chyba: {_sched.status['error']}" if _sched.status["error"] else "")
+        )
         _bcol1, _bcol2 = st.columns(2)
         with _bcol1:
             if st.button("▶ Zálohovat nyní", use_container_width=True):
@@ -2760,23 +4871,28 @@ def page_admin():
                 else:
                     st.error("Záloha se nezdařila.")
         with _bcol2:
-            _bkp_running = True  # cache_resource zajistuje jedine spusteni
+            _bkp_running = _sched.status["error"] is None
             st.markdown(
                 f"<div style='padding:8px 12px;border-radius:8px;font-size:13px;"
                 f"background:{'#dcfce7' if _bkp_running else '#fee2e2'};"
                 f"color:{'#14532d' if _bkp_running else '#7f1d1d'};font-weight:600'>"
-                f"{'🟢 Automatická záloha běží' if _bkp_running else '🔴 Automatická záloha neběží'}</div>",
+                f"{'🟢 Plánovač záloh běží' if _bkp_running else '🔴 Plánovač záloh hlásí chybu'}</div>",
                 unsafe_allow_html=True
             )
 
         # ── Přehled existujících záloh ─────────────────────────
         _backups = list_backups()
         if _backups:
-            st.markdown(f"**Uložené zálohy** ({len(_backups)} souborů ve složce `backups/`):")
+            st.markdown(f"**Uložené zálohy** ({len(_backups)} souborů ve složce `backups/`, 'auto' podle retence "
+                        f"{BACKUP_RETENTION['daily']} dní / {BACKUP_RETENTION['weekly']} týdnů / {BACKUP_RETENTION['monthly']} měsíců):")
             for _b in _backups[:10]:
                 _sz = f"{_b['size']/1024:.1f} kB"
+                if _b.get("db_size"):
+                    _sz += f" (DB {_b['db_size']/1024:.0f} kB, {_b['duration_s']:.2f} s)"
+                if _b.get("integrity") not in (None, "ok"):
+                    _sz += " ⚠️ integrita"
                 _lbl_color = "#dbeafe" if _b["label"] == "auto" else "#dcfce7"
-                _lbl_text  = "auto" if _b["label"] == "auto" else "manuální"
+                _lbl_text  = {"auto": "auto", "manual": "manuální"}.get(_b["label"], _b["label"])
                 _bcols = st.columns([3, 1, 1])
                 _bcols[0].markdown(
                     f"<span style='font-size:12px;font-family:monospace'>{_b['name']}</span> "
@@ -2785,11 +4901,10 @@ def page_admin():
                     f"<span style='color:#94a3b8;font-size:11px'>{_sz}</span>",
                     unsafe_allow_html=True
                 )
-                with open(_b["path"], "rb") as _bf:
-                    _bdata = _bf.read()
                 _bcols[1].download_button(
-                    "⬇", data=_bdata, file_name=_b["name"],
-                    mime="application/octet-stream", key=f"dl_{_b['name']}"
+                    "⬇", data=lambda _p=_b["path"]: Path(_p).read_bytes(), file_name=_b["name"],
+                    mime="application/gzip" if _b["name"].endswith(".gz") else "application/octet-stream",
+                    key=f"dl_{_b['name']}"
                 )
         else:
             st.caption("Zatím žádné zálohy. Klikněte na '▶ Zálohovat nyní'.")
@@ -2801,58 +4916,59 @@ def page_admin():
         with _ecol1:
             st.markdown("#### ⬇ Záloha SQLite")
             if DB_PATH.exists():
-                with open(DB_PATH, "rb") as _fdb:
-                    _db_bytes = _fdb.read()
                 _ts = datetime.now().strftime("%Y%m%d_%H%M")
                 st.download_button(
                     "⬇ Stáhnout aktuální DB (.sqlite)",
-                    data=_db_bytes,
+                    data=db_snapshot_bytes,
                     file_name=f"dochazka_backup_{_ts}.sqlite",
                     mime="application/octet-stream",
                     use_container_width=True,
                 )
-                st.caption(f"{len(_db_bytes)/1024:.1f} kB")
+                st.caption(f"{DB_PATH.stat().st_size/1024:.1f} kB")
 
         with _ecol2:
             st.markdown("#### ⬇ Export JSON")
             if DB_PATH.exists():
-                with get_conn() as _ec:
-                    _tables = [r[0] for r in _ec.execute(
-                        "SELECT name FROM sqlite_master WHERE type='table'"
-                    ).fetchall()]
-                    _export = {t: [dict(r) for r in _ec.execute(f"SELECT * FROM {t}").fetchall()]
-                               for t in _tables}
-                _json_bytes = json.dumps(_export, ensure_ascii=False, indent=2).encode("utf-8")
+                _tables = export_tables()
                 _ts2 = datetime.now().strftime("%Y%m%d_%H%M")
                 st.download_button(
-                    "⬇ Exportovat jako JSON",
-                    data=_json_bytes,
-                    file_name=f"dochazka_export_{_ts2}.json",
-                    mime="application/json",
+                    "⬇ Exportovat jako NDJSON (.gz)",
+                    data=ndjson_export_bytes,
+                    file_name=f"dochazka_export_{_ts2}.ndjson.gz",
+                    mime="application/gzip",
                     use_container_width=True,
                 )
-                st.caption(f"Tabulky: {', '.join(_tables)}")
+                st.caption(f"Tabulky: {', '.join(_tables)} · 1. řádek = hlavička se schématem a počty")
 
         st.markdown("---")
         st.markdown("#### ⬆ Obnova ze zálohy")
         st.warning("⚠️ **Obnova přepíše celou stávající databázi!** Nejdřív si stáhněte aktuální zálohu.")
         _uploaded = st.file_uploader(
-            "Nahrajte záložní soubor (.sqlite / .db)",
-            type=["sqlite", "db", "sqlite3"],
+            "Nahrajte záložní soubor (.sqlite / .sqlite.gz / .db) nebo export (.ndjson.gz / .json)",
+            type=["sqlite", "db", "sqlite3", "gz", "json"],
             key="db_restore_upload"
         )
         if _uploaded is not None:
             _confirm = st.checkbox("Rozumím – obnova přepíše stávající data", key="confirm_restore")
             if st.button("🔄 Obnovit databázi", type="primary", disabled=not _confirm):
-                _data = _uploaded.read()
-                if _data[:16] == b"SQLite format 3\x00":
-                    # Záloha před obnovením
-                    _do_backup("pre_restore")
-                    with open(DB_PATH, "wb") as _fout:
-                        _fout.write(_data)
-                    st.success("✅ Databáze obnovena (automatická záloha před obnovením byla uložena). Odhlaste se a přihlaste znovu.")
+                if _uploaded.name.endswith((".ndjson.gz", ".json")):
+                    with st.spinner("Importuji export…"):
+                        _ok, _msg = import_export_file(_uploaded)
+                else:
+                    # Upload nejdřív do dočasného souboru – ověřuje se mimo živou DB
+                    with tempfile.NamedTemporaryFile(suffix=".sqlite", delete=False,
+                                                     dir=DB_PATH.parent) as _tmp:
+                        shutil.copyfileobj(_uploaded, _tmp)
+                    try:
+                        with st.spinner("Ověřuji a obnovuji…"):
+                            _ok, _msg = restore_database(_tmp.name)
+                    finally:
+                        Path(_tmp.name).unlink(missing_ok=True)
+                if _ok:
+                    st.success(f"✅ {_msg} Automatická záloha před obnovením byla uložena. "
+                               "Odhlaste se a přihlaste znovu.")
                 else:
-                    st.error("❌ Soubor není platná SQLite databáze.")
+                    st.error(f"❌ {_msg}")
 
         st.markdown("---")
         st.markdown("#### 📊 Statistiky databáze")
@@ -2868,6 +4984,46 @@ def page_admin():
                         _stat_cols[_ci].metric(_lbl, _sc.execute(f"SELECT COUNT(*) FROM {_tbl}").fetchone()[0])
                     except Exception:
                         pass
+            _sp = storage_profile_status()
+            st.caption(
+                f"Úložiště: journal_mode={_sp.get('journal_mode')} · synchronous={_sp.get('synchronous')} · "
+                f"busy_timeout={_sp.get('busy_timeout')} ms · cache_size={_sp.get('cache_size')} · "
+                f"mmap_size={_sp.get('mmap_size')} · temp_store={_sp.get('temp_store')}"
+            )
+            _ps = pool_stats()
+            with st.expander(f"Schéma v{schema_version()} · plány horkých dotazů"):
+                for _q in explain_hot_queries():
+                    st.markdown(f"{'🔴 full scan' if _q['full_scan'] else '🟢'} **{_q['query']}** "
+                                f"<small style='color:#64748b'>{_q['plan']}</small>",
+                                unsafe_allow_html=True)
+            st.caption(
+                f"Spojení k DB: otevřeno {_ps['opened']} · znovupoužito {_ps['reused']}× · "
+                f"převzato {_ps['recycled']}× · aktivní {_ps['active']} · volná {_ps['idle']}"
+            )
+            _rc = get_read_cache().snapshot()
+            st.caption(
+                f"Cache čtení: {_rc['entries']}/{READ_CACHE_ENTRIES} záznamů · zásahy {_rc['hits']} · "
+                f"výpadky {_rc['misses']} ({_rc['hit_rate']:.0%} zásahů) · vyřazeno {_rc['evictions']} · "
+                f"verze dat {data_version()}"
+            )
+            _pc = get_pending_counts()
+            _pcc1, _pcc2 = st.columns([3, 1])
+            _pcc1.caption(f"Čítače čekajících schválení: absence {_pc['absences']} · úpravy {_pc['corrections']}")
+            if _pcc2.button("🔁 Ověřit čítače", key="reconcile_pending"):
+                _drift = reconcile_pending_counters()
+                if _drift:
+                    st.warning("Opraveno: " + ", ".join(f"{k} {a}→{b}" for k, (a, b) in _drift.items()))
+                else:
+                    st.success("Čítače sedí ✓")
+            _dg = last_digest_run()
+            _dgc1, _dgc2 = st.columns([3, 1])
+            _dgc1.caption(
+                f"Denní přehled v {', '.join(DIGEST_TIMES)} · naposledy "
+                + (f"{_dg['tick']} ({_dg['recipients']} příjemců)" if _dg else "zatím nikdy")
+            )
+            if _dgc2.button("📨 Odeslat přehled teď", key="digest_now"):
+                _n = start_digest_job().run_once(tick=f"{today_str()} ručně {now_str()}")
+                st.success(f"Přehled zařazen k odeslání ({_n or 0} příjemců)")
 
     # ── Tab 8: Přímá editace docházky ───────────────────────
     with tab8:
@@ -2902,6 +5058,13 @@ def page_admin():
             )
         else:
             st.caption("Pro tento den neexistuje žádný záznam – vyplněním formuláře ho vytvoříte.")
+        _punches = get_punch_events(_sel_uid, _sel_day.isoformat())
+        if _punches:
+            with st.expander(f"🕓 Historie píchnutí ({len(_punches)})"):
+                st.dataframe(pd.DataFrame([
+                    {"Čas": p["ts"][:19].replace("T", " "), "Akce": p["kind"], "Zdroj": p["source"]}
+                    for p in _punches
+                ]), hide_index=True, use_container_width=True)
 
         # ── Formulář příchod / odchod ──────────────────────────
         st.markdown("**Příchod a odchod**")
@@ -2979,12 +5142,7 @@ def page_admin():
                     if st.button("💾 Uložit pauzu", key="save_ep_btn"):
                         _ep_sdt = _sel_day.isoformat() + " " + _ep_s.strip() + ":00" if _ep_s.strip() else None
                         _ep_edt = _sel_day.isoformat() + " " + _ep_e.strip() + ":00" if _ep_e.strip() else None
-                        with get_conn() as _epc:
-                            _epc.execute(
-                                "UPDATE pauses SET pause_type=?,start_time=?,end_time=?,paid=? WHERE id=?",
-                                (_ep_type, _ep_sdt, _ep_edt, 1 if _ep_paid else 0, _ep_sel)
-                            )
-                            _epc.commit()
+                        admin_update_pause(_ep_sel, _ep_type, _ep_sdt, _ep_edt, _ep_paid)
                         st.success("Pauza uložena ✓"); st.rerun()
 
             # Přidat novou pauzu
@@ -3004,13 +5162,7 @@ def page_admin():
                     if _valid_time(_p_start) and _p_start.strip():
                         _ps = _sel_day.isoformat() + " " + _p_start.strip() + ":00"
                         _pe = (_sel_day.isoformat() + " " + _p_end.strip() + ":00") if _p_end.strip() else None
-                        with get_conn() as _apc:
-                            _apc.execute(
-                                "INSERT INTO pauses(attendance_id,pause_type,start_time,end_time,paid)"
-                                " VALUES(?,?,?,?,?)",
-                                (_att["id"], _p_type, _ps, _pe, 1 if _is_paid_adm else 0)
-                            )
-                            _apc.commit()
+                        admin_set_pause(_att["id"], _p_type, _ps, _pe, _is_paid_adm)
                         st.success("Pauza přidána ✓")
                         st.rerun()
                     else:
@@ -3111,15 +5263,8 @@ def page_admin():
             if _vac_to < _vac_from:
                 st.error("Datum Do musi byt >= Od.")
             else:
-                _hd_json2 = json.dumps([d.isoformat() for d in _vac_half_sel])
-                with get_conn() as _vconn:
-                    _vconn.execute(
-                        "INSERT INTO absences(user_id,absence_type,date_from,date_to,note,approved,half_days)"
-                        " VALUES(?,?,?,?,?,1,?)",
-                        (_vac_uid, _vadd_type, _vac_from.isoformat(), _vac_to.isoformat(),
-                         _vac_note or "Pridano administratorem", _hd_json2)
-                    )
-                    _vconn.commit()
+                add_approved_absence(_vac_uid, _vadd_type, _vac_from, _vac_to,
+                                     _vac_note or "Pridano administratorem", _vac_half_sel)
                 st.success("Absence pridana a automaticky schvalena.")
                 st.rerun()
 
@@ -3129,8 +5274,8 @@ def page_admin():
         with get_conn() as _vconn2:
             _vac_recs = [dict(r) for r in _vconn2.execute(
                 "SELECT * FROM absences WHERE user_id=? AND absence_type IN ('vacation','sickday','vacation_half')"
-                " AND strftime('%Y',date_from)=? ORDER BY date_from DESC",
-                (_vac_uid, str(_vac_yr))
+                " AND date_from BETWEEN ? AND ? ORDER BY date_from DESC",
+                (_vac_uid, f"{_vac_yr}-01-01", f"{_vac_yr}-12-31")
             ).fetchall()]
 
         if not _vac_recs:
@@ -3151,18 +5296,120 @@ def page_admin():
                     unsafe_allow_html=True
                 )
                 if _rc2.button("Smazat", key=f"del_vac_{_vr3['id']}"):
-                    with get_conn() as _vconn3:
-                        _vconn3.execute("DELETE FROM absences WHERE id=?", (_vr3["id"],))
-                        _vconn3.commit()
+                    delete_absence(_vr3["id"])
                     st.success("Zaznam smazan.")
                     st.rerun()
 
+    # ── Tab 10: Auditní log ─────────────────────────────────
+    with tab10:
+        st.markdown("### 🧾 Auditní log")
+        st.caption("Každá změna provedená administrátorem – kdo, kdy, co a jak to vypadalo předtím a potom.")
+        _aw = start_audit_writer()
+        _aw.flush(timeout=1.0)
+        _au_users = {u["username"] for u in get_all_users()} | {"system"}
+        _ac1, _ac2, _ac3 = st.columns([2, 2, 1])
+        with _ac1:
+            _a_tbl = st.selectbox("Tabulka", ["— vše —", "attendance", "pauses", "absences"],
+                                  key="audit_tbl")
+        with _ac2:
+            _a_actor = st.selectbox("Kdo", ["— vše —"] + sorted(_au_users), key="audit_actor")
+        _a_filter = dict(tbl=None if _a_tbl == "— vše —" else _a_tbl,
+                         actor=None if _a_actor == "— vše —" else _a_actor)
+        _, _a_total = audit_page(0, **_a_filter)
+        _a_pages = max(1, -(-_a_total // AUDIT_PAGE_SIZE))
+        with _ac3:
+            _a_page = st.number_input("Stránka", min_value=1, max_value=_a_pages, value=1,
+                                      key="audit_page") - 1
+        _a_rows, _ = audit_page(_a_page, **_a_filter)
+        if not _a_rows:
+            st.caption("Zatím žádné záznamy.")
+        else:
+            _act_lbl = {"insert": "➕ vložení", "update": "✏️ úprava", "delete": "🗑 smazání"}
+            st.dataframe(pd.DataFrame([{
+                "Čas": r["ts"].replace("T", " ")[:19], "Kdo": r["actor"],
+                "Akce": _act_lbl.get(r["action"], r["action"]), "Tabulka": r["tbl"],
+                "ID": r["row_id"], "Změna": audit_diff(r["before"], r["after"]),
+            } for r in _a_rows]), hide_index=True, use_container_width=True)
+            st.caption(f"{_a_total} záznamů · stránka {_a_page + 1}/{_a_pages} · "
+                       f"zapsáno {_aw.stats['written']} v {_aw.stats['batches']} dávkách"
+                       + (f" · ⚠️ chyb zápisu {_aw.stats['errors']}" if _aw.stats["errors"] else ""))
+
     st.markdown('</div>', unsafe_allow_html=True)
 
 
 # ─────────────────────────────────────────────
 # PAGE: CALENDAR
 # ─────────────────────────────────────────────
+# Kód typu absence → (CSS třída odznaku, písmeno, popisek legendy)
+CAL_TYPES = {
+    "vacation":      ("v",  "D", "Dovolená"),
+    "vacation_half": ("vh", "½", "Dovolená půlden"),
+    "sickday":       ("s",  "S", "Sickday"),
+    "nemoc":         ("n",  "N", "Nemoc / PN"),
+}
+_CAL_DOW = ["Po", "Út", "St", "Čt", "Pá", "So", "Ne"]
+
+
+@cached_read("absences", "users")
+def calendar_absence_mask(year: int, month: int) -> tuple:
+    """(user_ids, maska) schválených absencí měsíce v pořadí get_all_users."""
+    user_ids = [u["id"] for u in get_all_users()]
+    return user_ids, absence_mask(get_all_absences_for_calendar(year, month), year, month, user_ids)
+
+
+@cached_read("absences", "users")
+def render_calendar_html(year: int, month: int, today: date) -> str:
+    """Legenda + mřížka absencí měsíce; styly jsou v globálním CSS (sekce 17).
+
+    Buňka běžného dne je jen <td></td> – víkend, svátek a dnešek nese
+    krátká třída, odznak absence <i class="cal-b v">D</i>. Výsledek se
+    drží v ReadCache podle (rok, měsíc, dnes, verze absencí a uživatelů).
+    """
+    first, last = month_bounds(year, month)
+    holidays = get_holiday_calendar().year(year)
+    users    = get_all_users()
+
+    mask = calendar_absence_mask(year, month)[1]
+
+    # Šablona sloupců: třída dne se spočítá jednou pro celý měsíc
+    day_cls, head = {}, ['<th class="n"></th>']
+    for dn in range(1, last.day + 1):
+        d   = date(year, month, dn)
+        cls = " ".join(c for c, on in (("w", d.weekday() >= 5), ("h", d in holidays),
+                                       ("t", d == today)) if on)
+        day_cls[dn] = f' class="{cls}"' if cls else ""
+        head.append(f'<th{day_cls[dn]}><i>{_CAL_DOW[d.weekday()]}</i><b>{dn}</b></th>')
+    empty = {dn: f"<td{c}></td>" for dn, c in day_cls.items()}
+    badge = {ABS_CODES[t]: f'<i class="cal-b {c}">{letter}</i>' for t, (c, letter, _) in CAL_TYPES.items()}
+
+    rows = []
+    for u, codes in zip(users, mask.tolist()):
+        initials = "".join(w[0].upper() for w in u["display_name"].split()[:2])
+        cells = [
+            f'<td class="n"><div><i class="av" style="--c:{u.get("color") or "#1f5e8c"}">{initials}</i>'
+            f'<span class="nm" title="{u["display_name"]}">{u["display_name"].split()[-1]}</span></div></td>'
+        ]
+        for dn, code in enumerate(codes, start=1):
+            if code:
+                cells.append(f"<td{day_cls[dn]}>"
+                             + badge.get(code, '<i class="cal-b x">?</i>') + "</td>")
+            else:
+                cells.append(empty[dn])
+        rows.append("<tr>" + "".join(cells) + "</tr>")
+
+    legend = "".join(
+        f'<span><i class="cal-b {c}">{letter}</i>{label}</span>'
+        for c, letter, label in list(CAL_TYPES.values()) + [("hl", "★", "Státní svátek")]
+    )
+    return (
+        f'<div class="cal-leg">{legend}</div>'
+        '<div class="cal-wrap"><table class="cal">'
+        f'<thead><tr>{"".join(head)}</tr></thead>'
+        f'<tbody>{"".join(rows)}</tbody>'
+        '</table></div>'
+    )
+
+
 def page_calendar():
     today = cet_today()
     st.markdown("""<div class="page-header">
@@ -3179,182 +5426,11 @@ def page_calendar():
         year = st.selectbox("Rok", list(range(today.year - 1, today.year + 2)),
                             index=1, key="cal_year")
 
-    first    = date(year, month, 1)
-    last     = (date(year, month + 1, 1) - timedelta(days=1)) if month < 12 else date(year, 12, 31)
-    num_days = last.day
-    holidays = czech_holidays(year)
-
-    absences  = get_all_absences_for_calendar(year, month)
-    users     = get_all_users()
-
-    # {user_id: {day: absence_type}}
-    user_days = {}
-    for a in absences:
-        uid = a["user_id"]
-        if uid not in user_days:
-            user_days[uid] = {}
-        ab_from = max(date.fromisoformat(a["date_from"]), first)
-        ab_to   = min(date.fromisoformat(a["date_to"]),   last)
-        cur = ab_from
-        while cur <= ab_to:
-            user_days[uid][cur.day] = a["absence_type"]
-            cur += timedelta(days=1)
-
-    TYPE_STYLE = {
-        "vacation":      ("#dbeafe", "#1d4ed8", "D"),
-        "vacation_half": ("#bfdbfe", "#1d4ed8", "½"),
-        "sickday":       ("#fee2e2", "#991b1b", "S"),
-        "nemoc":         ("#ffe4e6", "#9f1239", "N"),
-    }
-    DOW_CZ = ["Po", "Út", "St", "Čt", "Pá", "So", "Ne"]
-
-    # ── Legenda ────────────────────────────────────────────────
-    legend_items = [
-        ("#dbeafe", "#1d4ed8", "D",         "Dovolená"),
-        ("#bfdbfe", "#1d4ed8", "½",    "Dovolená půlden"),
-        ("#fee2e2", "#991b1b", "S",         "Sickday"),
-        ("#ffe4e6", "#9f1239", "N",         "Nemoc / PN"),
-        ("#fef9c3", "#92400e", "★",    "Státní svátek"),
-    ]
-    leg_parts = ['<div style="display:flex;gap:14px;margin-bottom:20px;flex-wrap:wrap">']
-    for bg, fg, letter, label in legend_items:
-        leg_parts.append(
-            '<div style="display:flex;align-items:center;gap:6px;font-size:12px;color:#475569">'
-            '<div style="width:22px;height:22px;border-radius:4px;'
-            + f'background:{bg};border:1px solid {fg}88;'
-            + 'display:flex;align-items:center;justify-content:center;'
-            + f'font-size:11px;font-weight:800;color:{fg}">{letter}</div>'
-            + f'{label}</div>'
-        )
-    leg_parts.append('</div>')
-    st.markdown("".join(leg_parts), unsafe_allow_html=True)
-
-    # ── Tabulka ─────────────────────────────────────────────────
-    # Rozměry
-    DAY_W  = 44   # px – šířka buňky dne
-    NAME_W = 100  # px – šířka sloupce se jménem
-    ROW_H  = 40   # px – výška řádku
-
-    rows = []
-
-    # Záhlaví – jmenovka + dny
-    hdr_cells = []
-    hdr_cells.append(
-        f'<th style="min-width:{NAME_W}px;width:{NAME_W}px;max-width:{NAME_W}px;'
-        f'padding:8px 8px;text-align:left;font-size:10px;color:#94a3b8;font-weight:700;'
-        f'white-space:nowrap;background:#f0f4f8;border-right:2px solid #cbd5e1;'
-        f'border-bottom:2px solid #cbd5e1"></th>'
-    )
-    for dn in range(1, num_days + 1):
-        d       = date(year, month, dn)
-        is_wknd = d.weekday() >= 5
-        is_hol  = d in holidays
-        is_tod  = d == today
-        if is_tod:
-            hbg = "#1d4ed8"; dnc = "rgba(255,255,255,.7)"; nnc = "#fff"; nfw = "800"
-        elif is_hol:
-            hbg = "#fef3c7"; dnc = "#92400e"; nnc = "#92400e"; nfw = "700"
-        elif is_wknd:
-            hbg = "#e2e8f0"; dnc = "#94a3b8"; nnc = "#94a3b8"; nfw = "600"
-        else:
-            hbg = "#f0f4f8"; dnc = "#94a3b8"; nnc = "#1e293b"; nfw = "700"
-        hdr_cells.append(
-            f'<th style="min-width:{DAY_W}px;width:{DAY_W}px;max-width:{DAY_W}px;'
-            f'text-align:center;padding:5px 1px;background:{hbg};border-bottom:2px solid #cbd5e1;">'
-            f'<div style="font-size:9px;color:{dnc};font-weight:600;line-height:1.2">{DOW_CZ[d.weekday()]}</div>'
-            f'<div style="font-size:15px;font-weight:{nfw};color:{nnc};line-height:1.2">{dn}</div>'
-            f'</th>'
-        )
-    rows.append('<tr>' + "".join(hdr_cells) + '</tr>')
-
-    # Řádky uživatelů
-    for idx, u in enumerate(users):
-        uid       = u["id"]
-        udays     = user_days.get(uid, {})
-        rbg       = "#ffffff" if idx % 2 == 0 else "#f8fafc"
-        color     = u.get("color") or "#1f5e8c"
-        initials  = "".join(w[0].upper() for w in u["display_name"].split()[:2])
-        last_name = u["display_name"].split()[-1]
-        full_name = u["display_name"]
-
-        cells = []
-        # Jmenovka – avatar + příjmení
-        cells.append(
-            f'<td style="min-width:{NAME_W}px;width:{NAME_W}px;max-width:{NAME_W}px;'
-            f'height:{ROW_H}px;padding:4px 6px;background:{rbg};'
-            f'border-right:2px solid #cbd5e1;border-bottom:1px solid #e2e8f0;'
-            f'white-space:nowrap;overflow:hidden;">'
-            f'<div style="display:flex;align-items:center;gap:5px">'
-            f'<div style="flex-shrink:0;width:22px;height:22px;border-radius:50%;'
-            f'background:{color}22;color:{color};border:1.5px solid {color}66;'
-            f'display:flex;align-items:center;justify-content:center;'
-            f'font-weight:800;font-size:8px">{initials}</div>'
-            f'<span style="font-size:11px;font-weight:600;color:#334155;'
-            f'overflow:hidden;text-overflow:ellipsis;white-space:nowrap" title="{full_name}">'
-            f'{last_name}</span>'
-            f'</div></td>'
-        )
-
-        for dn in range(1, num_days + 1):
-            d        = date(year, month, dn)
-            is_wknd  = d.weekday() >= 5
-            is_hol   = d in holidays
-            is_tod   = d == today
-            atype    = udays.get(dn)
-
-            if atype:
-                abg, afg, aletter = TYPE_STYLE.get(atype, ("#f1f5f9", "#64748b", "?"))
-                inner = (
-                    f'<div style="width:30px;height:30px;margin:0 auto;border-radius:6px;'
-                    f'background:{abg};border:1.5px solid {afg}66;'
-                    f'display:flex;align-items:center;justify-content:center;'
-                    f'font-size:12px;font-weight:800;color:{afg}">{aletter}</div>'
-                )
-            elif is_hol:
-                inner = '<div style="text-align:center;font-size:15px;color:#f59e0b">★</div>'
-            elif is_wknd:
-                inner = '<div style="width:18px;height:3px;margin:0 auto;background:#d1d5db;border-radius:2px"></div>'
-            else:
-                inner = ''
-
-            if is_tod:
-                cbg = "#eff6ff"
-                brd = "border-left:2px solid #1d4ed8;border-right:2px solid #1d4ed8;"
-            elif is_hol:
-                cbg = "#fefce8"; brd = ""
-            elif is_wknd:
-                cbg = "#f1f5f9"; brd = ""
-            else:
-                cbg = rbg; brd = ""
-
-            cells.append(
-                f'<td style="min-width:{DAY_W}px;width:{DAY_W}px;max-width:{DAY_W}px;'
-                f'height:{ROW_H}px;text-align:center;vertical-align:middle;padding:0 1px;'
-                f'background:{cbg};{brd}border-bottom:1px solid #e2e8f0;">{inner}</td>'
-            )
-
-        rows.append(f'<tr>{"".join(cells)}</tr>')
-
-    # Sestavení kompletní tabulky
-    table_html = (
-        '<div style="overflow-x:auto;-webkit-overflow-scrolling:touch;'
-        'border:1px solid #e2e8f0;border-radius:12px;'
-        'box-shadow:0 2px 8px rgba(31,94,140,.08)">'
-        '<table style="border-collapse:collapse;font-family:Inter,sans-serif;'
-        'min-width:max-content;width:100%">'
-        '<thead>' + rows[0] + '</thead>'
-        '<tbody>' + "".join(rows[1:]) + '</tbody>'
-        '</table></div>'
-    )
-    st.markdown(table_html, unsafe_allow_html=True)
+    hol_cal  = get_holiday_calendar()
+    st.markdown(render_calendar_html(year, month, today), unsafe_allow_html=True)
 
-    # ── Souhrn ──────────────────────────────────────────────────
-    type_totals = {}
-    for a in absences:
-        t   = a["absence_type"]
-        af  = max(date.fromisoformat(a["date_from"]), first)
-        at  = min(date.fromisoformat(a["date_to"]),   last)
-        type_totals[t] = type_totals.get(t, 0) + count_workdays_in_range(af, at)
+    # ── Souhrn (pracovní dny podle typu z masky) ────────────────
+    type_totals = absence_type_workdays(calendar_absence_mask(year, month)[1], year, month)
 
     sum_parts = ['<div style="display:flex;gap:10px;flex-wrap:wrap;margin-top:16px">']
     for typ, tbg, tfg, tlabel in [
@@ -3371,15 +5447,7 @@ def page_calendar():
         )
 
     # Státní svátky v měsíci
-    hol_names = {
-        (1,1):"Nový rok",(5,1):"Svátek práce",(5,8):"Den vítězství",
-        (7,5):"Cyril a Metoděj",(7,6):"Mistr Jan Hus",(9,28):"Den české státnosti",
-        (10,28):"Vznik ČSR",(11,17):"Den boje za svobodu",
-        (12,24):"Štědrý den",(12,25):"1. svátek vánoční",
-        (12,26):"2. svátek vánoční",
-    }
-    for h in sorted(d for d in holidays if d.month == month and d.year == year):
-        name = hol_names.get((h.month, h.day), "Státní svátek")
+    for h, name in hol_cal.for_month(year, month):
         sum_parts.append(
             f'<div style="background:#fef9c3;color:#92400e;border-radius:8px;'
             f'padding:7px 14px;font-size:13px;font-weight:700">'
@@ -3468,22 +5536,206 @@ def cz_date_input(label: str, value=None, key: str = None,
         kwargs["max_value"] = max_value
     return st.date_input(**kwargs)
 
-start_auto_backup()
+# ─────────────────────────────────────────────
+# HTTP API PRO TERMINÁLY
+# ─────────────────────────────────────────────
+class ApiError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+def hash_api_token(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def _api_user(scope: str, username: str | None) -> dict:
+    """Uživatel požadavku; osobní token smí jen za svého uživatele."""
+    if scope != "*":
+        if username and username != scope:
+            raise ApiError(403, "token nepatří tomuto uživateli")
+        username = scope
+    if not username:
+        raise ApiError(400, "chybí parametr user")
+    with get_conn() as conn:
+        row = conn.execute(
+            "SELECT id, username, display_name FROM users WHERE username=? AND active=1", (username,)
+        ).fetchone()
+    if not row:
+        raise ApiError(404, f"uživatel {username} neexistuje")
+    return dict(row)
+
+
+def api_status(user_id: int) -> dict:
+    att   = get_today_or_active_att(user_id)
+    pause = None
+    if att and att["checkin_time"] and not att["checkout_time"]:
+        pause = next((p for p in get_pauses(att["id"]) if p["end_time"] is None), None)
+    if not att or not att["checkin_time"] or att["checkout_time"]:
+        state = "out"
+    else:
+        state = "pause" if pause else "in"
+    return {
+        "state":         state,
+        "date":          att["date"] if att else today_str(),
+        "checkin_time":  att["checkin_time"] if att else None,
+        "checkout_time": att["checkout_time"] if att else None,
+        "pause":         pause and {"type": pause["pause_type"], "start_time": pause["start_time"],
+                                    "paid": bool(pause["paid"])},
+    }
+
+
+def _api_pause_start(user: dict, body: dict):
+    att = get_active_attendance(user["id"])
+    if not att:
+        return False, "Nejprve zaznamenejte příchod."
+    pause_type = body.get("type") or PAUSE_TYPES[0]
+    if pause_type not in PAUSE_TYPES and pause_type not in PAUSE_TYPES_PAID:
+        raise ApiError(400, f"neznámý typ pauzy: {pause_type}")
+    return open_pause(att["id"], pause_type, paid=pause_type in PAUSE_TYPES_PAID)
+
+
+def _api_pause_end(user: dict, body: dict):
+    att = get_active_attendance(user["id"])
+    if not att:
+        return False, "Nejprve zaznamenejte příchod."
+    return end_pause(att["id"])
+
+
+# POST endpoint → funkce(uživatel, tělo) -> (ok, zpráva)
+API_ACTIONS = {
+    "/api/checkin":     lambda user, body: do_checkin(user["id"]),
+    "/api/checkout":    lambda user, body: do_checkout(user["id"]),
+    "/api/pause/start": _api_pause_start,
+    "/api/pause/end":   _api_pause_end,
+}
 
-init_db()
 
-# Migrace DB sloupců
-for _mig in [
-    "ALTER TABLE users ADD COLUMN email TEXT",
-    "ALTER TABLE absences ADD COLUMN email_sent INTEGER DEFAULT 0",
-    "ALTER TABLE absences ADD COLUMN half_days TEXT DEFAULT '[]'",
-    "ALTER TABLE pauses ADD COLUMN paid INTEGER DEFAULT 0",
-]:
-    with get_conn() as _mc:
+class ApiHandler(BaseHTTPRequestHandler):
+    """JSON API nad stejnou datovou vrstvou jako UI, bez Streamlit reruns.
+
+    GET  /api/health                    – bez tokenu
+    GET  /api/status?user=…             – stav příchodu / pauzy
+    POST /api/checkin, /api/checkout,
+         /api/pause/start, /api/pause/end – tělo {"user": …, "type": …}
+    Autorizace: hlavička „Authorization: Bearer <token>“ (viz API_TOKENS).
+    """
+
+    server_version   = "DochazkaAPI/1"
+    protocol_version = "HTTP/1.1"   # keep-alive pro terminály
+    disable_nagle_algorithm = True  # jinak hlavička a tělo čekají na zpožděné ACK (~40 ms)
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def _reply(self, status: int, payload: dict):
+        data = json.dumps(payload, ensure_ascii=False).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        if self.close_connection:
+            self.send_header("Connection", "close")
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _scope(self) -> str:
+        auth  = self.headers.get("Authorization", "")
+        token = auth[7:].strip() if auth.startswith("Bearer ") else ""
+        scope = API_TOKENS.get(hash_api_token(token)) if token else None
+        if scope is None:
+            raise ApiError(401, "neplatný token")
+        return scope
+
+    def _read_body(self) -> bytes:
+        """Přečte tělo ještě před jakoukoli odpovědí.
+
+        Nepřečtené bajty by se na keep-alive spojení načetly jako další
+        požadavek; tělo, které číst nechceme, proto spojení ukončí.
+        """
+        if "chunked" in self.headers.get("Transfer-Encoding", "").lower():
+            self.close_connection = True
+            raise ApiError(411, "chybí Content-Length")
+        try:
+            n = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            n = -1
+        if n < 0:
+            self.close_connection = True
+            raise ApiError(400, "neplatná hlavička Content-Length")
+        if n > API_MAX_BODY:
+            self.close_connection = True
+            raise ApiError(413, "příliš velký požadavek")
+        return self.rfile.read(n)
+
+    @staticmethod
+    def _body(raw: bytes) -> dict:
+        try:
+            body = json.loads(raw or b"{}")
+        except ValueError:
+            raise ApiError(400, "tělo není platný JSON")
+        if not isinstance(body, dict):
+            raise ApiError(400, "tělo musí být JSON objekt")
+        return body
+
+    def _handle(self, method: str):
         try:
-            _mc.execute(_mig); _mc.commit()
-        except Exception:
-            pass
+            url = urlsplit(self.path)
+            raw = self._read_body()
+            if method == "GET" and url.path == "/api/health":
+                return self._reply(200, {"ok": True, "schema": schema_version()})
+            scope = self._scope()
+            body  = self._body(raw) if method == "POST" else {}
+            user  = _api_user(scope, body.get("user") or parse_qs(url.query).get("user", [None])[0])
+            if method == "GET" and url.path == "/api/status":
+                return self._reply(200, {"ok": True, "user": user["username"], **api_status(user["id"])})
+            action = API_ACTIONS.get(url.path) if method == "POST" else None
+            if action is None:
+                raise ApiError(404, "neznámý endpoint")
+            with audit_actor(f"api:{user['username']}"):
+                ok, msg = action(user, body)
+            self._reply(200 if ok else 409,
+                        {"ok": ok, "message": msg, "user": user["username"], **api_status(user["id"])})
+        except ApiError as e:
+            self._reply(e.status, {"ok": False, "error": str(e)})
+        except Exception as e:
+            # Detail jen do statistik serveru – volající nemusí být přihlášený
+            self.server.stats["errors"] += 1
+            self.server.stats["error"] = f"{type(e).__name__}: {e}"
+            self._reply(500, {"ok": False, "error": "interní chyba serveru"})
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+
+def make_api_server(host: str = API_HOST, port: int = API_PORT) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer((host, port), ApiHandler)
+    server.daemon_threads = True
+    server.stats = {"errors": 0}
+    return server
+
+
+@st.cache_resource
+def start_api_server() -> ThreadingHTTPServer:
+    server = make_api_server()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+ensure_db()
+start_audit_writer()
+start_wal_checkpointer()   # spojení mají wal_autocheckpoint=0 – bez něj by WAL jen rostl
+if API_ONLY:
+    # E-maily, přehled a zálohy obstarává proces se Streamlitem
+    make_api_server().serve_forever()
+    raise SystemExit
+start_email_sender()
+start_digest_job()
+start_auto_backup()
+if API_ENABLED:
+    start_api_server()
 
 if "user" not in st.session_state:
     page_login()
@@ -0,0 +1,98 @@
+"""Zátěžový test HTTP API: paralelní terminály s keep-alive spojením.
+
+Bez --url spustí API nad dočasnou DB v tomto procesu. S --url míří na běžící
+instanci (python app.py --api); --token je pak terminálový token ("*")
+a --users seznam existujících uživatelských jmen oddělených čárkou.
+
+    python benchmarks/bench_api.py [--terminals 8] [--rounds 50]
+    python benchmarks/bench_api.py --url http://127.0.0.1:8765 --token T --users jan,eva
+"""
+import argparse
+import http.client
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from urllib.parse import urlsplit
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def local_instance(terminals: int) -> tuple[str, str, list[str]]:
+    """API nad dočasnou DB s `terminals` uživateli; vrátí (url, token, uživatelé)."""
+    work = Path(tempfile.mkdtemp(prefix="dochazka_bench_api_"))
+    os.environ["DOCHAZKA_DB"]         = str(work / "api.db")
+    os.environ["DOCHAZKA_BACKUP_DIR"] = str(work / "backups")
+    sys.path.insert(0, str(ROOT))
+    import app  # noqa: E402
+
+    users = [f"term{i}" for i in range(terminals)]
+    for name in users:
+        app.create_user(name, "heslo", name, "user", "#1f5e8c")
+    app.API_TOKENS[app.hash_api_token("bench")] = "*"
+    server = app.make_api_server("127.0.0.1", 0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address
+    return f"http://{host}:{port}", "bench", users
+
+
+def terminal(url: str, token: str, username: str, rounds: int, out: list, errors: list):
+    """Celý den jednoho uživatele: příchod, `rounds`× pauza + stav, odchod."""
+    u    = urlsplit(url)
+    conn = http.client.HTTPConnection(u.hostname, u.port, timeout=10)
+    who  = json.dumps({"user": username}).encode()
+    hdrs = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
+    steps  = [("POST", "/api/checkin", who)]
+    steps += [("POST", "/api/pause/start", who), ("GET", f"/api/status?user={username}", None),
+              ("POST", "/api/pause/end", who)] * rounds
+    steps += [("POST", "/api/checkout", who)]
+    for method, path, body in steps:
+        t0 = time.perf_counter()
+        conn.request(method, path, body=body, headers=hdrs)
+        resp = conn.getresponse()
+        resp.read()
+        out.append(time.perf_counter() - t0)
+        if resp.status != 200:
+            errors.append((username, path, resp.status))
+    conn.close()
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--terminals", type=int, default=8)
+    ap.add_argument("--rounds", type=int, default=50)
+    ap.add_argument("--url")
+    ap.add_argument("--token")
+    ap.add_argument("--users")
+    args = ap.parse_args()
+    if args.url:
+        url, token, users = args.url, args.token, args.users.split(",")
+    else:
+        url, token, users = local_instance(args.terminals)
+
+    latencies, errors = [], []
+    threads = [threading.Thread(target=terminal, args=(url, token, u, args.rounds, latencies, errors))
+               for u in users]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - t0
+
+    ms = sorted(x * 1000 for x in latencies)
+    print(f"{len(users)} terminálů × {len(ms) // len(users)} požadavků proti {url}")
+    print(f"{len(ms) / elapsed:8.0f} req/s · p50 {statistics.median(ms):6.1f} ms"
+          f" · p95 {ms[int(len(ms) * 0.95)]:6.1f} ms · p99 {ms[int(len(ms) * 0.99)]:6.1f} ms"
+          f" · chyb {len(errors)}")
+    if errors:
+        print("první chyby:", errors[:5])
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""Benchmark přístupu k DB: píchnutí a latence čtení při souběžných zápisech.
+
+Zápis jde skutečnou cestou do_checkin()/do_checkout(), čtení je přehled
+„kdo je kde“ (get_staff_snapshot). Obě osy se měří zvlášť, aby šel každý
+zisk přičíst své příčině:
+
+    spojení:  connect  – nové sqlite3.connect() na každé volání (původní idiom)
+              pool     – dlouhožijící spojení z ConnectionPool
+    žurnál:   rollback – journal_mode=DELETE, synchronous=FULL (výchozí SQLite)
+              WAL      – journal_mode=WAL, synchronous=NORMAL (DB_PROFILE)
+
+Ostatní PRAGMA z DB_PROFILE (busy_timeout, cache, mmap …) platí ve všech variantách.
+
+    python benchmarks/bench_db.py [--writers 4] [--readers 2] [--seconds 3]
+"""
+import argparse
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+WORK = Path(tempfile.mkdtemp(prefix="dochazka_bench_"))
+os.environ["DOCHAZKA_DB"]         = str(WORK / "template.db")
+os.environ["DOCHAZKA_BACKUP_DIR"] = str(WORK / "backups")
+sys.path.insert(0, str(ROOT))
+
+import app  # noqa: E402  (vytvoří schéma v WORK/template.db)
+
+USERS_PER_WRITER = 50
+JOURNALS = {"rollback": ("DELETE", "FULL"), "WAL": ("WAL", "NORMAL")}
+
+
+class ConnectPerCall:
+    """Náhrada ConnectionPool: každé get()/transaction() otevře nové spojení."""
+
+    def __init__(self, path: Path, pragmas: dict):
+        self.path, self.pragmas = path, pragmas
+
+    def get(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False, factory=app.PooledConnection)
+        conn.row_factory = sqlite3.Row
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name}={value}")
+        return conn
+
+    @contextmanager
+    def transaction(self, immediate: bool = True):
+        conn = self.get()
+        conn.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+        conn.in_pool_tx = True
+        try:
+            yield conn
+        except BaseException:
+            conn.in_pool_tx = False
+            conn.rollback()
+            raise
+        else:
+            conn.in_pool_tx = False
+            conn.commit()
+        finally:
+            conn.close()
+
+
+def seed(writers: int) -> list[list[int]]:
+    """Uživatelé rozdělení po writerech – každý writer píchá jen své lidi."""
+    with app.db_transaction() as conn:
+        ids = [conn.execute(
+            "INSERT INTO users(username,password_hash,display_name) VALUES(?,?,?)",
+            (f"bench{i}", "x", f"Bench {i}")
+        ).lastrowid for i in range(writers * USERS_PER_WRITER)]
+    return [ids[k::writers] for k in range(writers)]
+
+
+def variant_db(name: str, journal: str) -> Path:
+    path = WORK / f"{name}.db"
+    dst  = sqlite3.connect(path)
+    app.get_conn().backup(dst)
+    dst.execute(f"PRAGMA journal_mode={journal}")
+    dst.close()
+    return path
+
+
+def run(pool, groups: list[list[int]], readers: int, seconds: float) -> dict:
+    """Writery píchají dokola, readery měří latenci přehledu; vrátí metriky."""
+    app.get_pool = lambda: pool
+    stop, writes, lat, errors = threading.Event(), [0] * len(groups), [], []
+
+    def writer(k):
+        i = 0
+        while not stop.is_set():
+            uid = groups[k][i % len(groups[k])]
+            try:
+                app.do_checkin(uid)
+                app.do_checkout(uid)
+                writes[k] += 2
+            except sqlite3.OperationalError as e:
+                errors.append(str(e))
+            i += 1
+
+    def reader():
+        while not stop.is_set():
+            t0 = time.perf_counter()
+            try:
+                app.get_staff_snapshot()
+            except sqlite3.OperationalError as e:
+                errors.append(str(e))
+                continue
+            lat.append((time.perf_counter() - t0) * 1000)
+
+    threads = ([threading.Thread(target=writer, args=(k,)) for k in range(len(groups))]
+               + [threading.Thread(target=reader) for _ in range(readers)])
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+    lat.sort()
+    return {"writes": sum(writes) / seconds, "reads": len(lat) / seconds,
+            "p50": statistics.median(lat) if lat else float("nan"),
+            "p95": lat[int(len(lat) * 0.95)] if lat else float("nan"),
+            "errors": len(errors)}
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--writers", type=int, default=4)
+    ap.add_argument("--readers", type=int, default=2)
+    ap.add_argument("--seconds", type=float, default=3.0)
+    args = ap.parse_args()
+    groups = seed(args.writers)
+    base   = {k: v for k, v in app.DB_PROFILE.items() if k not in ("journal_mode", "synchronous")}
+    print(f"{args.writers} writerů (do_checkin + do_checkout), {args.readers} čtenáři"
+          f" (get_staff_snapshot), {args.seconds:g} s na variantu, DB v {WORK}")
+    print(f"{'varianta':<20}{'píchnutí/s':>12}{'čtení/s':>10}{'p50 ms':>9}{'p95 ms':>9}{'chyby':>7}")
+    for journal, (mode, sync) in JOURNALS.items():
+        for conn_kind in ("connect", "pool"):
+            name    = f"{conn_kind}+{journal}"
+            path    = variant_db(name, mode)
+            pragmas = {**base, "synchronous": sync}
+            pool    = (ConnectPerCall(path, pragmas) if conn_kind == "connect"
+                       else app.ConnectionPool(path, pragmas))
+            r = run(pool, groups, args.readers, args.seconds)
+            print(f"{name:<20}{r['writes']:12.0f}{r['reads']:10.0f}"
+                  f"{r['p50']:9.2f}{r['p95']:9.2f}{r['errors']:7d}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+"""Společné fixtures: app.py se importuje proti dočasné DB a adresáři záloh."""
+import itertools
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+ROOT  = Path(__file__).resolve().parent.parent
+_WORK = Path(tempfile.mkdtemp(prefix="dochazka_test_"))
+os.environ["DOCHAZKA_DB"]         = str(_WORK / "test.db")
+os.environ["DOCHAZKA_BACKUP_DIR"] = str(_WORK / "backups")
+sys.path.insert(0, str(ROOT))
+
+_seq = itertools.count(1)
+
+
+@pytest.fixture(scope="session")
+def app():
+    import app as module
+    return module
+
+
+@pytest.fixture
+def make_user(app):
+    """Vytvoří aktivního uživatele s unikátním jménem; vrátí jeho řádek."""
+    def make(role: str = "user", email: str = "") -> dict:
+        name = f"t{next(_seq)}"
+        ok, msg = app.create_user(name, "heslo", f"Test {name}", role, "#1f5e8c")
+        assert ok, msg
+        if email:
+            app.update_user_email(app.authenticate(name, "heslo")["id"], email)
+        return app.authenticate(name, "heslo")
+    return make
@@ -0,0 +1,40 @@
+import pytest
+
+VACATION = {"user_id": 1, "absence_type": "vacation",  "date_from": "2026-10-12",
+            "date_to": "2026-10-16", "half_days": "[]"}
+DOCTOR   = {"user_id": 1, "absence_type": "lekar_den", "date_from": "2026-10-14",
+            "date_to": "2026-10-14", "half_days": "[]"}
+SICK     = {"user_id": 1, "absence_type": "nemoc",     "date_from": "2026-10-15",
+            "date_to": "2026-10-20", "half_days": "[]"}
+
+
+@pytest.mark.parametrize("rows", [
+    [VACATION, DOCTOR], [DOCTOR, VACATION], [VACATION, SICK, DOCTOR], [SICK, DOCTOR, VACATION],
+])
+def test_overlap_does_not_depend_on_row_order(app, rows):
+    mask = app.absence_mask(rows, 2026, 10)
+    expected = 5 if SICK not in rows else 7      # 12.–20.10. = 7 pracovních dní
+    assert app.absence_fund_days(mask, 2026, 10)[0] == expected
+    assert mask[0, 13] == app.ABS_CODES["vacation"]       # 14.10. zůstane dovolená
+
+
+def test_half_day_is_outranked_by_full_day(app):
+    half = {**VACATION, "half_days": '["2026-10-13"]'}
+    sick = {**SICK, "date_from": "2026-10-13", "date_to": "2026-10-13"}
+    assert app.absence_fund_days(app.absence_mask([half], 2026, 10), 2026, 10)[0] == 4.5
+    for rows in ([half, sick], [sick, half]):
+        assert app.absence_fund_days(app.absence_mask(rows, 2026, 10), 2026, 10)[0] == 5
+
+
+def test_month_report_matches_count_absence_workdays(app, make_user):
+    user = make_user()
+    # lékař dřív zadaný i dřív v pořadí ORDER BY date_from by ho nesměl přebít
+    for t, d_from, d_to in (("lekar_den", "2026-10-14", "2026-10-14"),
+                            ("vacation",  "2026-10-12", "2026-10-16")):
+        app.request_absence(user["id"], t, app.date.fromisoformat(d_from),
+                            app.date.fromisoformat(d_to))
+    for r in app.get_user_absences.uncached(user["id"]):
+        app.approve_absence(r["id"], True)
+    data = app.load_month_data([user["id"]], 2026, 10)
+    fund = app.absence_fund_days(data["absence_mask"], 2026, 10)[data["mask_row"][user["id"]]]
+    assert fund == app.count_absence_workdays(user["id"], 2026, 10) == 5
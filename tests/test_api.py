@@ -0,0 +1,130 @@
+import http.client
+import json
+import threading
+import time
+
+import pytest
+
+TERMINAL = "terminal-token"
+
+
+@pytest.fixture
+def api(app, monkeypatch):
+    monkeypatch.setattr(app, "API_TOKENS", {app.hash_api_token(TERMINAL): "*"})
+    server = app.make_api_server("127.0.0.1", 0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _conn(server):
+    return http.client.HTTPConnection(*server.server_address, timeout=10)
+
+
+def _call(conn, method, path, body=None, token=TERMINAL):
+    headers = {"Authorization": f"Bearer {token}"} if token else {}
+    data = json.dumps(body).encode() if body is not None else None
+    if data is not None:
+        headers["Content-Type"] = "application/json"
+    conn.request(method, path, body=data, headers=headers)
+    resp = conn.getresponse()
+    return resp.status, json.loads(resp.read()), resp
+
+
+def test_error_replies_keep_the_connection_in_sync(api, make_user):
+    user = make_user()
+    conn = _conn(api)
+    status, payload, _ = _call(conn, "POST", "/api/checkin", {"user": user["username"]}, token="spatny")
+    assert status == 401
+    status, _, _ = _call(conn, "POST", "/api/neexistuje", {"user": user["username"]})
+    assert status == 404
+    # nepřečtené tělo by se teď načetlo jako další požadavek
+    status, payload, _ = _call(conn, "GET", "/api/health")
+    assert (status, payload["ok"]) == (200, True)
+    status, payload, _ = _call(conn, "POST", "/api/checkin", {"user": user["username"]})
+    assert (status, payload["state"]) == (200, "in")
+
+
+@pytest.mark.parametrize("length, expected", [("-5", 400), ("abc", 400), ("999999", 413)])
+def test_bad_content_length_closes_the_connection(api, length, expected):
+    conn = _conn(api)
+    conn.putrequest("POST", "/api/checkin")
+    conn.putheader("Authorization", f"Bearer {TERMINAL}")
+    conn.putheader("Content-Length", length)
+    conn.endheaders()
+    resp = conn.getresponse()
+    assert resp.status == expected
+    assert resp.getheader("Connection") == "close"
+    assert json.loads(resp.read())["ok"] is False
+
+
+def test_internal_error_does_not_leak_details(app, api, make_user, monkeypatch):
+    def boom(user_id):
+        raise RuntimeError("tajný detail")
+    monkeypatch.setattr(app, "api_status", boom)
+    status, payload, _ = _call(_conn(api), "GET", f"/api/status?user={make_user()['username']}")
+    assert status == 500
+    assert "tajný" not in json.dumps(payload, ensure_ascii=False)
+    assert api.stats["errors"] == 1 and "tajný detail" in api.stats["error"]
+
+
+def test_load_parallel_terminals(app, api, make_user):
+    """Zátěž: každé vlákno = terminál s keep-alive spojením, celý den jednoho uživatele."""
+    users, rounds = [make_user() for _ in range(8)], 10
+    latencies, errors = [], []
+
+    def terminal(user):
+        conn, who = _conn(api), {"user": user["username"]}
+        steps = [("POST", "/api/checkin", who)]
+        steps += [("POST", "/api/pause/start", who), ("GET", f"/api/status?user={user['username']}", None),
+                  ("POST", "/api/pause/end", who)] * rounds
+        steps += [("POST", "/api/checkout", who)]
+        for method, path, body in steps:
+            t0 = time.perf_counter()
+            status, payload, _ = _call(conn, method, path, body)
+            latencies.append(time.perf_counter() - t0)
+            if status != 200:
+                errors.append((user["username"], path, status, payload))
+
+    threads = [threading.Thread(target=terminal, args=(u,)) for u in users]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert not errors, errors[:3]
+    assert len(latencies) == len(users) * (2 + 3 * rounds)
+    assert sorted(latencies)[int(len(latencies) * 0.95)] < 1.0
+    conn = app.get_conn()
+    for u in users:
+        atts = conn.execute("SELECT id, checkout_time FROM attendance WHERE user_id=?",
+                            (u["id"],)).fetchall()
+        assert len(atts) == 1 and atts[0]["checkout_time"]
+        assert conn.execute("SELECT COUNT(*) FROM pauses WHERE attendance_id=? AND end_time IS NOT NULL",
+                            (atts[0]["id"],)).fetchone()[0] == rounds
+
+
+def test_api_only_mode_starts_only_what_the_api_needs(tmp_path):
+    """python app.py --api: auditní zápis a checkpointer WAL ano, e-maily/přehled/zálohy ne."""
+    import os
+    import subprocess
+    import sys
+    from pathlib import Path
+
+    probe = (
+        "import os, runpy, sys, threading\n"
+        "sys.argv = ['app.py', '--api']\n"
+        "def show():\n"
+        "    t = [getattr(getattr(t, '_target', None), '__qualname__', '') for t in threading.enumerate()]\n"
+        "    print(sorted(filter(None, t)), flush=True)\n"
+        "    os._exit(0)\n"
+        "threading.Timer(3, show).start()\n"
+        f"runpy.run_path({str(Path(__file__).resolve().parent.parent / 'app.py')!r}, run_name='__main__')\n"
+    )
+    env = {**os.environ, "DOCHAZKA_DB": str(tmp_path / "api.db"),
+           "DOCHAZKA_BACKUP_DIR": str(tmp_path / "backups")}
+    out = subprocess.run([sys.executable, "-c", probe], env=env, capture_output=True,
+                         text=True, timeout=60).stdout
+    assert "AuditWriter.loop" in out and "_wal_checkpoint_loop" in out
+    for name in ("EmailSender.loop", "DigestJob", "BackupScheduler"):
+        assert name not in out
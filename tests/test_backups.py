@@ -0,0 +1,49 @@
+import threading
+from datetime import datetime
+
+LABEL = "souběh"
+
+
+class FrozenDatetime(datetime):
+    @classmethod
+    def now(cls, tz=None):
+        return cls(2026, 10, 18, 9, 15, 30, 123000, tzinfo=tz)
+
+
+def _entries(app):
+    return [e for e in app.list_backups() if e["label"] == LABEL]
+
+
+def test_backups_in_the_same_millisecond_get_distinct_files(app, monkeypatch):
+    monkeypatch.setattr(app, "datetime", FrozenDatetime)
+    paths = [app._do_backup(LABEL) for _ in range(3)]
+    assert all(paths) and len({p.name for p in paths}) == 3
+    assert all(p.exists() for p in paths)
+    names = [e["name"] for e in _entries(app)]
+    assert sorted(names) == sorted(p.name for p in paths)
+    assert not list(app.BACKUP_DIR.glob(".*.partial"))
+
+
+def test_concurrent_backups_do_not_share_a_file(app):
+    barrier, paths = threading.Barrier(4), []
+
+    def run():
+        barrier.wait()
+        paths.append(app._do_backup(LABEL))
+
+    threads = [threading.Thread(target=run) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert all(paths) and len({p.name for p in paths}) == 4
+    names = [e["name"] for e in _entries(app)]
+    assert len(names) == len(set(names))
+    assert {p.name for p in paths} <= set(names)
+
+
+def test_manifest_rebuild_parses_new_names(app):
+    path = app._do_backup(LABEL)
+    app.BACKUP_MANIFEST.unlink()
+    rebuilt = {e["name"]: e for e in app._load_manifest()}
+    assert rebuilt[path.name]["label"] == LABEL
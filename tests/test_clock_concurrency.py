@@ -0,0 +1,102 @@
+"""Souběh píchnutí: více vláken (UI session, API terminál) nad stejným uživatelem."""
+import random
+import threading
+
+THREADS = 12
+
+
+def _race(fn, n=THREADS):
+    """Spustí fn() v n vláknech naráz (Barrier); vrátí jejich výsledky."""
+    barrier, results, errors = threading.Barrier(n), [], []
+
+    def run():
+        barrier.wait()
+        try:
+            results.append(fn())
+        except Exception as e:          # pragma: no cover – selhání testu
+            errors.append(e)
+
+    threads = [threading.Thread(target=run) for _ in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert not errors, errors
+    return results
+
+
+def test_simultaneous_checkins_create_one_record(app, make_user):
+    user = make_user()
+    results = _race(lambda: app.do_checkin(user["id"]))
+    assert sum(ok for ok, _ in results) == 1
+    conn = app.get_conn()
+    assert conn.execute("SELECT COUNT(*) FROM attendance WHERE user_id=?",
+                        (user["id"],)).fetchone()[0] == 1
+    assert conn.execute("SELECT COUNT(*) FROM punch_events WHERE user_id=? AND kind='checkin'",
+                        (user["id"],)).fetchone()[0] == 1
+
+
+def test_simultaneous_pause_start_and_end(app, make_user):
+    user = make_user()
+    app.do_checkin(user["id"])
+    att_id = app.get_active_attendance(user["id"])["id"]
+    started = _race(lambda: app.open_pause(att_id, "stress"))
+    assert sum(ok for ok, _ in started) == 1
+    ended = _race(lambda: app.end_pause(att_id))
+    assert sum(ok for ok, _ in ended) == 1
+    pauses = app.get_pauses(att_id)
+    assert len(pauses) == 1 and pauses[0]["end_time"]
+
+
+def test_random_clock_actions_keep_invariants(app, make_user):
+    users = [make_user()["id"] for _ in range(4)]
+    drift_before = app.replay_punch_log()   # řádky jiných testů mimo log se jen změří
+    counts = {"pause_start": 0, "second_checkin": 0}
+    lock = threading.Lock()
+
+    def worker(seed):
+        rnd = random.Random(seed)
+        for _ in range(40):
+            uid = rnd.choice(users)
+            action = rnd.choice(("checkin", "checkout", "pause_start", "pause_end", "pause_end"))
+            if action == "checkin":
+                ok, msg = app.do_checkin(uid)
+                if ok and "Druhý" in msg:
+                    with lock:
+                        counts["second_checkin"] += 1
+            elif action == "checkout":
+                app.do_checkout(uid)
+            else:
+                att = app.get_active_attendance(uid)
+                if not att:
+                    continue
+                if action == "pause_start":
+                    ok, _ = app.open_pause(att["id"], "stress")
+                    if ok:
+                        with lock:
+                            counts["pause_start"] += 1
+                else:
+                    app.end_pause(att["id"])
+
+    seeds = iter(range(THREADS))
+    _race(lambda: worker(next(seeds)))
+
+    conn  = app.get_conn()
+    marks = ",".join("?" * len(users))
+    assert conn.execute(
+        f"SELECT COUNT(*) FROM (SELECT 1 FROM attendance WHERE user_id IN ({marks})"
+        " GROUP BY user_id, date HAVING COUNT(*) > 1)", users).fetchone()[0] == 0
+    assert conn.execute(
+        f"""SELECT COUNT(*) FROM (SELECT 1 FROM pauses p JOIN attendance a ON a.id = p.attendance_id
+            WHERE a.user_id IN ({marks}) AND p.end_time IS NULL
+            GROUP BY p.attendance_id HAVING COUNT(*) > 1)""", users).fetchone()[0] == 0
+    # každá úspěšně zahájená pauza je v tabulce a odchod ji uzavřel
+    stress = conn.execute(
+        f"""SELECT p.pause_type, p.end_time, a.checkout_time FROM pauses p
+            JOIN attendance a ON a.id = p.attendance_id WHERE a.user_id IN ({marks})""",
+        users).fetchall()
+    assert counts["pause_start"] > 0
+    assert sum(r["pause_type"] == "stress" for r in stress) == counts["pause_start"]
+    assert sum(r["pause_type"] != "stress" for r in stress) == counts["second_checkin"]
+    assert all(r["end_time"] for r in stress if r["checkout_time"])
+    assert app.replay_punch_log() == drift_before
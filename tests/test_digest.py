@@ -0,0 +1,17 @@
+from datetime import date
+
+
+def test_digest_missing_list_follows_requested_day(app, make_user):
+    present, away, missing = make_user(), make_user(), make_user()
+    with app.db_transaction() as conn:
+        conn.execute("INSERT INTO attendance(user_id,date,checkin_time,checkout_time)"
+                     " VALUES(?, '2026-10-12', '08:00:00', '16:00:00')", (present["id"],))
+    app.request_absence(away["id"], "nemoc", date(2026, 10, 12), date(2026, 10, 12))
+
+    names = set(app.compute_digest("2026-10-12")["missing"])
+    assert missing["display_name"] in names
+    assert not {present["display_name"], away["display_name"]} & names
+
+    # jiný den: příchod z 12.10. ani absence se nepočítají
+    names = set(app.compute_digest("2026-10-13")["missing"])
+    assert {present["display_name"], away["display_name"], missing["display_name"]} <= names
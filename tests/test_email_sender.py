@@ -0,0 +1,123 @@
+import smtplib
+from datetime import datetime, timedelta
+
+import pytest
+
+NOW = datetime(2026, 10, 18, 9, 0, 0)
+
+
+class StubSMTP:
+    """Náhrada smtplib.SMTP: odmítne adresy z refuse, po fail_after zprávách spadne."""
+
+    def __init__(self, refuse=(), fail_after=None):
+        self.refuse, self.fail_after = set(refuse), fail_after
+        self.sent, self.connects = [], 0
+
+    def __call__(self):
+        self.connects += 1
+        return self
+
+    def sendmail(self, sender, to, msg):
+        if self.fail_after is not None and len(self.sent) >= self.fail_after:
+            raise smtplib.SMTPServerDisconnected("spojení ukončeno")
+        if to[0] in self.refuse:
+            raise smtplib.SMTPRecipientsRefused({to[0]: (550, b"no such user")})
+        self.sent.append(to[0])
+
+    def quit(self):
+        pass
+
+
+@pytest.fixture
+def outbox(app, monkeypatch):
+    """Fronta jen pro test: sender na pozadí nic nebere, čas stojí na NOW."""
+    monkeypatch.setattr(app.start_email_sender(), "send_batch", lambda: 0)
+    monkeypatch.setattr(app, "cet_now", lambda: NOW.replace(tzinfo=app.CET))
+    with app.db_transaction() as conn:
+        conn.execute("UPDATE email_outbox SET status='failed' WHERE status IN ('pending','sending')")
+
+    def enqueue(to_addr, **kw):
+        with app.db_transaction() as conn:
+            return app.enqueue_email(conn, to_addr, "Předmět", "Tělo", **kw)
+    return enqueue
+
+
+def _row(app, msg_id):
+    return dict(app.get_conn().execute("SELECT * FROM email_outbox WHERE id=?", (msg_id,)).fetchone())
+
+
+def _at(seconds):
+    return (NOW + timedelta(seconds=seconds)).isoformat(timespec="seconds")
+
+
+def test_refused_recipient_is_retried_with_backoff(app, outbox):
+    ok, bad = outbox("ok@example.cz"), outbox("bad@example.cz")
+    smtp = StubSMTP(refuse={"bad@example.cz"})
+    sender = app.EmailSender(smtp_factory=smtp)
+    assert sender.send_batch() == 2
+    assert smtp.connects == 1 and smtp.sent == ["ok@example.cz"]
+    assert _row(app, ok)["status"] == "sent"
+    r = _row(app, bad)
+    assert (r["status"], r["attempts"]) == ("pending", 1)
+    assert r["next_attempt_at"].startswith(_at(app.EMAIL_RETRY_BASE_S))
+    assert "SMTPRecipientsRefused" in r["last_error"]
+
+
+def test_connection_failure_requeues_rest_of_batch(app, outbox):
+    ids = [outbox(f"u{i}@example.cz") for i in range(3)]
+    sender = app.EmailSender(smtp_factory=StubSMTP(fail_after=1))
+    sender.send_batch()
+    assert [_row(app, i)["status"] for i in ids] == ["sent", "pending", "pending"]
+    assert all("SMTPServerDisconnected" in _row(app, i)["last_error"] for i in ids[1:])
+
+
+def test_last_attempt_marks_message_failed(app, outbox):
+    msg = outbox("bad@example.cz")
+    with app.db_transaction() as conn:
+        conn.execute("UPDATE email_outbox SET attempts=? WHERE id=?",
+                     (app.EMAIL_MAX_ATTEMPTS - 1, msg))
+    sender = app.EmailSender(smtp_factory=StubSMTP(refuse={"bad@example.cz"}))
+    sender.send_batch()
+    assert _row(app, msg)["status"] == "failed"
+    assert sender.stats["failed"] == 1
+
+
+def test_delivery_sets_absence_email_sent(app, outbox, make_user):
+    user = make_user()
+    app.request_absence(user["id"], "vacation", NOW.date(), NOW.date())
+    ab_id = app.get_user_absences.uncached(user["id"])[0]["id"]
+    outbox("ok@example.cz", kind="absence_approved", ref_id=ab_id)
+    app.EmailSender(smtp_factory=StubSMTP()).send_batch()
+    assert app.get_conn().execute("SELECT email_sent FROM absences WHERE id=?",
+                                  (ab_id,)).fetchone()[0] == 1
+
+
+def test_recover_resets_only_expired_claims(app, outbox):
+    msg = outbox("ok@example.cz")
+    other = app.EmailSender(smtp_factory=StubSMTP())
+    assert [m["id"] for m in other._claim()] == [msg]
+    me = app.EmailSender(smtp_factory=StubSMTP())
+    assert me.recover() == 0                       # cizí dávka je v lhůtě
+    assert _row(app, msg)["status"] == "sending"
+    later = NOW.replace(tzinfo=app.CET) + timedelta(seconds=app.EMAIL_CLAIM_LEASE_S + 1)
+    assert me.recover(now=later) == 1
+    assert me.send_batch() == 1
+    other._finish([(_row(app, msg), None)])        # opožděný výsledek se zahodí
+    r = _row(app, msg)
+    assert (r["status"], r["claimed_by"], r["attempts"]) == ("sent", me.owner, 2)
+
+
+def test_lease_survives_dst_change(app, outbox, monkeypatch):
+    # 25.10.2026: 03:00 CEST → 02:00 CET; claim v 02:40 CEST = 00:40 UTC
+    clock = [datetime(2026, 10, 25, 2, 40, tzinfo=app.CET)]
+    monkeypatch.setattr(app, "cet_now", lambda: clock[0])
+    msg = outbox("ok@example.cz")
+    app.EmailSender(smtp_factory=StubSMTP())._claim()
+    me = app.EmailSender(smtp_factory=StubSMTP())
+    # 02:05 CET (po změně) = 01:05 UTC: uběhlo 25 min, lhůta 30 min ještě běží
+    clock[0] = datetime(2026, 10, 25, 2, 5, fold=1, tzinfo=app.CET)
+    assert me.recover() == 0
+    # 02:15 CET = 01:15 UTC: uběhlo 35 min – řetězce s posunem by čekaly další hodinu
+    clock[0] = datetime(2026, 10, 25, 2, 15, fold=1, tzinfo=app.CET)
+    assert me.recover() == 1
+    assert _row(app, msg)["status"] == "pending"
@@ -0,0 +1,30 @@
+import io
+import sqlite3
+
+
+def _audit_rows(blob: bytes, tmp_path) -> int:
+    path = tmp_path / "snap.sqlite"
+    path.write_bytes(blob)
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute("SELECT COUNT(*) FROM audit_log").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_db_snapshot_contains_latest_audit(app, tmp_path):
+    app.audit("users", 1, None, {"note": "první"})
+    first = _audit_rows(app.db_snapshot_bytes(), tmp_path)
+    app.audit("users", 1, None, {"note": "druhý"})   # data_versions se nemění
+    second = _audit_rows(app.db_snapshot_bytes(), tmp_path)
+    assert second == first + 1
+
+
+def test_ndjson_export_contains_latest_punches(app, make_user):
+    user = make_user()
+    app.do_checkin(user["id"])
+    header = next(app.read_ndjson_export(io.BytesIO(app.ndjson_export_bytes())))
+    before = header["tables"]["punch_events"]["rows"]
+    app.do_checkout(user["id"])
+    header = next(app.read_ndjson_export(io.BytesIO(app.ndjson_export_bytes())))
+    assert header["tables"]["punch_events"]["rows"] == before + 1
@@ -0,0 +1,39 @@
+def _rows(app, user_id):
+    conn = app.get_conn()
+    return (conn.execute("SELECT year FROM leave_funds WHERE user_id=?", (user_id,)).fetchall(),
+            conn.execute("SELECT year FROM leave_balances WHERE user_id=?", (user_id,)).fetchall())
+
+
+def test_create_user_creates_leave_rows(app, make_user):
+    u = make_user()
+    funds, balances = _rows(app, u["id"])
+    year = app.cet_today().year
+    assert [r["year"] for r in funds] == [year]
+    assert [r["year"] for r in balances] == [year]
+
+
+def test_leave_summary_is_read_only(app, make_user):
+    u = make_user()
+    before = app.data_version("leave_funds", "leave_balances")
+    summ = app.leave_summary.uncached(u["id"], 2031)
+    assert summ["vacation_total"] == 20 and summ["sickday_total"] == 5
+    assert summ["vacation_used"] == 0
+    assert app.data_version("leave_funds", "leave_balances") == before
+    funds, balances = _rows(app, u["id"])
+    assert 2031 not in {r["year"] for r in funds + balances}
+
+
+def test_rebuild_creates_missing_rows_for_active_users(app):
+    with app.db_transaction() as conn:
+        uid = conn.execute(
+            "INSERT INTO users(username,password_hash,display_name) VALUES('raw_leave','x','Raw')"
+        ).lastrowid
+    assert _rows(app, uid) == ([], [])
+    drift = app.rebuild_leave_ledger(fix=False)
+    assert _rows(app, uid) == ([], [])
+    assert {"user_id": uid, "year": app.cet_today().year} in [
+        {"user_id": d["user_id"], "year": d["year"]} for d in drift]
+    app.rebuild_leave_ledger()
+    funds, balances = _rows(app, uid)
+    assert len(funds) == 1 and len(balances) == 1
+    assert app.rebuild_leave_ledger(fix=False) == []
@@ -0,0 +1,51 @@
+import sqlite3
+
+import pytest
+
+DAY = "2026-10-14"
+
+
+def _old_db(rows):
+    """Schéma před migrací 2: attendance bez UNIQUE(user_id, date)."""
+    conn = sqlite3.connect(":memory:")
+    conn.row_factory = sqlite3.Row
+    conn.executescript("""
+        CREATE TABLE attendance (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER NOT NULL,
+            date TEXT NOT NULL, checkin_time TEXT, checkout_time TEXT);
+        CREATE TABLE pauses (id INTEGER PRIMARY KEY AUTOINCREMENT, attendance_id INTEGER NOT NULL,
+            pause_type TEXT NOT NULL, start_time TEXT NOT NULL, end_time TEXT, paid INTEGER DEFAULT 0);
+    """)
+    for checkin, checkout, pauses in rows:
+        att_id = conn.execute("INSERT INTO attendance(user_id,date,checkin_time,checkout_time)"
+                              " VALUES(1,?,?,?)", (DAY, checkin, checkout)).lastrowid
+        for start, end in pauses:
+            conn.execute("INSERT INTO pauses(attendance_id,pause_type,start_time,end_time)"
+                         " VALUES(?,'☕ Přestávka',?,?)", (att_id, start, end))
+    return conn
+
+
+def _worked(app, conn):
+    return sum(
+        app.calc_worked_seconds(dict(att), [dict(p) for p in conn.execute(
+            "SELECT * FROM pauses WHERE attendance_id=?", (att["id"],))])
+        for att in conn.execute("SELECT * FROM attendance")
+    )
+
+
+@pytest.mark.parametrize("rows", [
+    [("08:00:00", "12:00:00", []), ("13:00:00", "17:00:00", [])],
+    [("13:00:00", "17:00:00", [("15:00:00", "15:15:00")]), ("08:00:00", "12:00:00", [])],
+    [("07:30:00", "10:00:00", []), ("10:30:00", "12:00:00", [("11:00:00", "11:10:00")]),
+     ("12:45:00", "16:00:00", [])],
+    [("08:00:00", "12:00:00", []), ("13:00:00", None, [])],          # poslední záznam otevřený
+])
+def test_merge_keeps_worked_time(app, monkeypatch, rows):
+    monkeypatch.setattr(app, "now_str", lambda: "17:00:00")
+    conn   = _old_db(rows)
+    before = _worked(app, conn)
+    app._m002_attendance_unique(conn)
+    assert conn.execute("SELECT COUNT(*) FROM attendance").fetchone()[0] == 1
+    assert _worked(app, conn) == before
+    gaps = conn.execute("SELECT COUNT(*) FROM pauses WHERE pause_type=?",
+                        (app.SECOND_CHECKIN_PAUSE,)).fetchone()[0]
+    assert gaps == len(rows) - 1
@@ -0,0 +1,8 @@
+def test_detail_sheet_labels_are_ascii(app, make_user):
+    user = make_user()
+    # říjen 2026: 28.10. „Vznik ČSR“ → „Vznik CSR“
+    data = app.load_month_data([user["id"]], 2026, 10)
+    rows = app.month_detail_rows(user, data)
+    holiday = next(r for r in rows if r["Datum"] == "2026-10-28")
+    assert holiday["Stav"].startswith("Statni svatek: ")
+    assert all(str(v).isascii() for r in rows for k, v in r.items() if k != "Pauzy")
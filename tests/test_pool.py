@@ -0,0 +1,56 @@
+import threading
+
+
+def test_invalidate_does_not_close_connections_of_live_threads(app):
+    got, go, done, errors = [], threading.Event(), threading.Event(), []
+
+    def worker():
+        try:
+            got.append(app.get_conn())
+            go.wait(5)
+            # po invalidate_caches() si vlákno samo otevře nové spojení
+            conn = app.get_conn()
+            conn.execute("SELECT COUNT(*) FROM users").fetchone()
+            got.append(conn)
+        except Exception as e:          # pragma: no cover – selhání testu
+            errors.append(e)
+        finally:
+            done.set()
+
+    t = threading.Thread(target=worker)
+    t.start()
+    while not got:
+        pass
+    old = got[0]
+    app.invalidate_caches()
+    old.execute("SELECT 1").fetchone()   # spojení cizího vlákna zůstalo otevřené
+    go.set()
+    done.wait(5)
+    t.join()
+    assert not errors, errors
+    assert got[1] is not old
+    assert got[1].pool_gen == app.get_pool().generation
+
+
+def test_background_writers_survive_invalidate(app):
+    writer = app.start_audit_writer()
+    app.audit("users", 1, None, {"n": 1})
+    assert writer.flush()
+    app.invalidate_caches()
+    before = writer.stats["errors"]
+    app.audit("users", 1, None, {"n": 2})
+    assert writer.flush()
+    assert writer.stats["errors"] == before
+
+
+def test_read_helper_inside_transaction_does_not_commit(app, make_user):
+    user = make_user()
+    try:
+        with app.db_transaction() as conn:
+            conn.execute("UPDATE users SET color='#000001' WHERE id=?", (user["id"],))
+            app.get_all_users.uncached()          # `with get_conn() as conn:` uvnitř
+            assert conn.in_transaction
+            raise RuntimeError("rollback")
+    except RuntimeError:
+        pass
+    assert app.authenticate(user["username"], "heslo")["color"] == "#1f5e8c"
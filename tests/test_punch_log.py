@@ -0,0 +1,50 @@
+import sqlite3
+
+import pytest
+
+
+@pytest.fixture
+def own_db(app, tmp_path, monkeypatch):
+    """Kopie testovací DB s vlastním poolem – opravy nesahají na data jiných testů."""
+    path = tmp_path / "replay.db"
+    dst  = sqlite3.connect(path)
+    app.get_conn().backup(dst)
+    dst.close()
+    pool = app.ConnectionPool(path, app._connection_pragmas())
+    monkeypatch.setattr(app, "get_pool", lambda: pool)
+    return pool
+
+
+def _att(app, att_id):
+    return app.get_conn().execute("SELECT * FROM attendance WHERE id=?", (att_id,)).fetchone()
+
+
+def test_extra_rows_survive_unless_deletion_is_requested(app, make_user, own_db):
+    user = make_user()
+    with app.db_transaction() as conn:       # řádek mimo log (starší data, ruční SQL)
+        extra = conn.execute("INSERT INTO attendance(user_id,date,checkin_time,checkout_time)"
+                             " VALUES(?, '2026-10-12', '08:00:00', '16:00:00')",
+                             (user["id"],)).lastrowid
+    drift = app.replay_punch_log()
+    assert drift["attendance"]["extra"] >= 1
+    assert _att(app, extra)                  # výchozí volání je jen kontrola
+
+    app.replay_punch_log(fix=True)
+    assert _att(app, extra)                  # oprava bez delete_extra řádek nechá
+    assert app.replay_punch_log()["attendance"]["extra"] == drift["attendance"]["extra"]
+
+    app.replay_punch_log(fix=True, delete_extra=True)
+    assert _att(app, extra) is None
+    assert app.replay_punch_log() == {}
+
+
+def test_fix_restores_changed_rows_from_log(app, make_user, own_db):
+    user = make_user()
+    app.do_checkin(user["id"])
+    app.do_checkout(user["id"])
+    att = app.get_conn().execute("SELECT * FROM attendance WHERE user_id=?", (user["id"],)).fetchone()
+    with app.db_transaction() as conn:
+        conn.execute("UPDATE attendance SET checkout_time='23:59:00' WHERE id=?", (att["id"],))
+    assert app.replay_punch_log()["attendance"]["changed"] >= 1
+    app.replay_punch_log(fix=True)
+    assert _att(app, att["id"])["checkout_time"] == att["checkout_time"]
@@ -0,0 +1,21 @@
+import pytest
+
+
+def test_hot_queries_use_indexes(app):
+    plans = app.explain_hot_queries()
+    assert len(plans) == len(app.HOT_QUERIES)
+    full = [f"{p['query']}: {p['plan']}" for p in plans if p["full_scan"]]
+    assert not full, "full scan v horkých dotazech:\n" + "\n".join(full)
+
+
+@pytest.mark.parametrize("detail, expected", [
+    ("SCAN attendance", True),
+    ("SEARCH attendance USING INDEX ix_att (user_id=? AND date=?)", False),
+    ("SCAN absences USING COVERING INDEX ix_absences_approved", False),
+])
+def test_full_scan_detection(app, monkeypatch, detail, expected):
+    class Conn:
+        def execute(self, *a):
+            return [{"detail": detail}]
+    monkeypatch.setattr(app, "get_conn", lambda: Conn())
+    assert all(p["full_scan"] is expected for p in app.explain_hot_queries())
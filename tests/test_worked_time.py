@@ -0,0 +1,75 @@
+"""Vektorová calc_worked_seconds_vec musí dávat totéž co referenční calc_worked_seconds."""
+import random
+
+import numpy as np
+import pytest
+
+NOW = "17:45:10"
+
+
+def _t(rng: random.Random, with_date: bool | None = None) -> str:
+    hms = f"{rng.randrange(24):02d}:{rng.randrange(60):02d}:{rng.randrange(60):02d}"
+    if with_date is None:
+        with_date = rng.random() < 0.2
+    return f"2026-02-{rng.randint(1, 28):02d} {hms}" if with_date else hms
+
+
+def _vec(app, atts, pauses):
+    idx, ps, pe, paid = [], [], [], []
+    for i, plist in enumerate(pauses):
+        for p in plist:
+            idx.append(i)
+            ps.append(p["start_time"])
+            pe.append(p["end_time"])
+            paid.append(p["paid"])
+    return app.calc_worked_seconds_vec(
+        [a["checkin_time"] for a in atts], [a["checkout_time"] for a in atts],
+        idx, ps, pe, paid, now=NOW,
+    )
+
+
+def _scalar(app, monkeypatch, atts, pauses):
+    monkeypatch.setattr(app, "now_str", lambda: NOW)
+    return np.array([app.calc_worked_seconds(a, p) for a, p in zip(atts, pauses)])
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_vectorized_matches_scalar_randomized(app, monkeypatch, seed):
+    rng = random.Random(seed)
+    atts, pauses = [], []
+    for _ in range(200):
+        checkin  = rng.choice([None, "", _t(rng), _t(rng), _t(rng)])
+        checkout = rng.choice([None, "", _t(rng), _t(rng)])   # None/"" = běží (now)
+        atts.append({"checkin_time": checkin, "checkout_time": checkout})
+        pauses.append([
+            {"start_time": _t(rng),
+             "end_time":   rng.choice([None, _t(rng), _t(rng)]),   # None = otevřená
+             "paid":       rng.choice([0, 1, None])}
+            for _ in range(rng.randrange(4))
+        ])
+    np.testing.assert_array_equal(_vec(app, atts, pauses), _scalar(app, monkeypatch, atts, pauses))
+
+
+@pytest.mark.parametrize("att, pauses, expected", [
+    # běžný den s neplacenou pauzou
+    ({"checkin_time": "08:00:00", "checkout_time": "16:30:00"},
+     [{"start_time": "12:00:00", "end_time": "12:30:00", "paid": 0}], 8 * 3600),
+    # placená pauza se neodečítá
+    ({"checkin_time": "08:00:00", "checkout_time": "16:00:00"},
+     [{"start_time": "09:00:00", "end_time": "11:00:00", "paid": 1}], 8 * 3600),
+    # přes půlnoc, pauza také přes půlnoc
+    ({"checkin_time": "22:00:00", "checkout_time": "06:00:00"},
+     [{"start_time": "23:50:00", "end_time": "00:10:00", "paid": 0}], 8 * 3600 - 20 * 60),
+    # otevřený záznam a otevřená pauza počítají do NOW
+    ({"checkin_time": "08:00:00", "checkout_time": None},
+     [{"start_time": "17:00:00", "end_time": None, "paid": 0}], 9 * 3600),
+    # formát s datem
+    ({"checkin_time": "2026-02-28 09:00:00", "checkout_time": "2026-02-28 15:00:00"}, [], 6 * 3600),
+    # bez příchodu nic, pauzy delší než den nejdou do záporu
+    ({"checkin_time": None, "checkout_time": "16:00:00"}, [], 0),
+    ({"checkin_time": "08:00:00", "checkout_time": "09:00:00"},
+     [{"start_time": "08:10:00", "end_time": "10:00:00", "paid": 0}], 0),
+])
+def test_vectorized_known_cases(app, monkeypatch, att, pauses, expected):
+    assert _vec(app, [att], [pauses])[0] == expected
+    assert _scalar(app, monkeypatch, [att], [pauses])[0] == expected